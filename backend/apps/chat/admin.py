@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Conversation, ConversationMessage
+from .models import Conversation, ConversationMessage, ConversationReadState
 
 # Register your models here.
 admin.site.register(Conversation)
-admin.site.register(ConversationMessage)
\ No newline at end of file
+admin.site.register(ConversationMessage)
+admin.site.register(ConversationReadState)
\ No newline at end of file
@@ -1,44 +1,108 @@
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.http import JsonResponse
 
 from rest_framework.decorators import api_view
 
-from .models import Conversation, ConversationMessage
-from .serializer import ConversationListSerializer, ConversationDetailSerializer, ConversationMessageSerializer
+from .models import Conversation, ConversationMessage, ConversationReadState
+from .serializer import ConversationListSerializer, ConversationDetailSerializer, ConversationMessageSerializer, ConversationMessageCompactSerializer, ConversationInboxSerializer
+from .history import message_page, page_users
+
+from backend_project.pagination import keyset_page, parse_page_size
 
 from apps.useraccount.models import User
+from apps.useraccount.serializers import UserDetailSerializer
 
 
 @api_view(['GET'])
 def conversations_list(request):
-    serializer = ConversationListSerializer(request.user.conversations.all().order_by('-modified_at'), many=True)
+    serializer = ConversationListSerializer(request.user.conversations.prefetch_related('users').order_by('-modified_at'), many=True)
 
     return JsonResponse(serializer.data, safe=False)
 
 
+@api_view(['GET'])
+def conversations_inbox(request):
+    # Newest conversations first with their last message and the request
+    # user's unread count: three queries per page however many conversations
+    unread = ConversationReadState.objects.filter(conversation=OuterRef('pk'), user=request.user).values('unread_count')
+    conversations = request.user.conversations.annotate(
+        unread_count=Coalesce(Subquery(unread[:1]), 0)
+    ).prefetch_related('users')
+    try:
+        page_size = parse_page_size(request.GET, 20, 100)
+        page, next_cursor = keyset_page(conversations, 'modified_at', True, request.GET.get('cursor', ''), page_size)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    total_unread = request.user.conversation_read_states.aggregate(total=Sum('unread_count'))['total'] or 0
+
+    return JsonResponse({
+        'conversations': ConversationInboxSerializer(page, many=True).data,
+        'next_cursor': next_cursor,
+        'total_unread': total_unread
+    })
+
+
+@api_view(['POST'])
+def conversations_read(request, pk):
+    if not request.user.conversations.filter(pk=pk).exists():
+        return JsonResponse({'error': 'Conversation not found'}, status=404)
+    ConversationReadState.mark_read(pk, request.user.id)
+
+    return JsonResponse({'success': True})
+
+
 @api_view(['GET'])
 def conversations_detail(request, pk):
-    conversation = request.user.conversations.get(pk=pk)
+    try:
+        conversation = request.user.conversations.prefetch_related('users').get(pk=pk)
+        messages, next_cursor = message_page(conversation, request.GET)
+    except Conversation.DoesNotExist:
+        return JsonResponse({'error': 'Conversation not found'}, status=404)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not request.GET.get('cursor'):
+        # Opening the conversation shows the newest messages
+        ConversationReadState.mark_read(conversation.id, request.user.id)
+    # Nested users come from the participants instead of 2 queries per message
+    users = page_users(conversation, messages)
+    for message in messages:
+        message.sent_to = users[message.sent_to_id]
+        message.created_by = users[message.created_by_id]
 
     conversation_serializer = ConversationDetailSerializer(conversation, many=False)
-    messages_serializer = ConversationMessageSerializer(conversation.messages.all(), many=True)
+    messages_serializer = ConversationMessageSerializer(messages, many=True)
 
     return JsonResponse({
         'conversation': conversation_serializer.data,
-        'messages': messages_serializer.data
+        'messages': messages_serializer.data,
+        'next_cursor': next_cursor
     }, safe=False)
 
+
 @api_view(['GET'])
-def conversations_start(request, user_id):
-    conversations = Conversation.objects.filter(users__in=[user_id]).filter(users__in=[request.user.id])
+def conversations_messages(request, pk):
+    try:
+        conversation = request.user.conversations.prefetch_related('users').get(pk=pk)
+        messages, next_cursor = message_page(conversation, request.GET)
+    except Conversation.DoesNotExist:
+        return JsonResponse({'error': 'Conversation not found'}, status=404)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    users = page_users(conversation, messages)
 
-    if conversations.count() > 0:
-        conversation = conversations.first()
-        
-        return JsonResponse({'success': True, 'conversation_id': conversation.id})
-    else:
+    return JsonResponse({
+        'messages': ConversationMessageCompactSerializer(messages, many=True).data,
+        'users': UserDetailSerializer(users.values(), many=True).data,
+        'next_cursor': next_cursor
+    })
+
+@api_view(['GET'])
+def conversations_start(request, user_id):
+    try:
         user = User.objects.get(pk=user_id)
-        conversation = Conversation.objects.create()
-        conversation.users.add(request.user)
-        conversation.users.add(user)
+    except User.DoesNotExist:
+        return JsonResponse({'error': 'User not found'}, status=404)
+    conversation, _ = Conversation.get_or_create_pair(request.user, user)
 
-        return JsonResponse({'success': True, 'conversation_id': conversation.id})
\ No newline at end of file
+    return JsonResponse({'success': True, 'conversation_id': conversation.id})
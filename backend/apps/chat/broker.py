@@ -0,0 +1,279 @@
+import asyncio
+import collections
+import fnmatch
+import os
+import time
+from urllib.parse import urlparse
+
+from .resp import RespError, encode_reply, read_reply
+
+# Local stand-in for Redis: an asyncio server implementing just the list,
+# hash, sorted set and key commands BrokerChannelLayer uses, over a Unix socket or
+# TCP. It lets several daphne processes on one host share chat groups
+# without running Redis.
+
+DEFAULT_MAX_LIST_LENGTH = 100000
+
+
+def _score(value):
+    # float() also takes b'-inf' / b'+inf'
+    return float(value)
+
+
+class ChatBroker:
+    def __init__(self, max_list_length=DEFAULT_MAX_LIST_LENGTH):
+        self.max_list_length = max_list_length
+        self.lists = {}  # key -> deque of values
+        self.zsets = {}  # key -> {member: score}
+        self.hashes = {}  # key -> {field: int value}
+        self.expires = {}  # key -> monotonic deadline
+        self.waiters = collections.defaultdict(collections.deque)  # key -> BLPOP futures
+        self.commands = {
+            'PING': self.ping,
+            'SELECT': self.ok,
+            'AUTH': self.ok,
+            'RPUSH': self.rpush,
+            'LPOP': self.lpop,
+            'BLPOP': self.blpop,
+            'LLEN': self.llen,
+            'HINCRBY': self.hincrby,
+            'HMGET': self.hmget,
+            'HDEL': self.hdel,
+            'EXPIRE': self.expire,
+            'DEL': self.delete,
+            'KEYS': self.keys,
+            'ZADD': self.zadd,
+            'ZREM': self.zrem,
+            'ZCARD': self.zcard,
+            'ZRANGEBYSCORE': self.zrangebyscore,
+            'ZREMRANGEBYSCORE': self.zremrangebyscore,
+            'FLUSHDB': self.flushdb,
+        }
+
+    # Keys
+
+    def _alive(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._drop(key)
+        return key in self.lists or key in self.zsets or key in self.hashes
+
+    def _drop(self, key):
+        self.lists.pop(key, None)
+        self.zsets.pop(key, None)
+        self.hashes.pop(key, None)
+        self.expires.pop(key, None)
+
+    def sweep(self):
+        now = time.monotonic()
+        for key in [key for key, deadline in self.expires.items() if deadline <= now]:
+            self._drop(key)
+
+    async def ping(self, *args):
+        return args[0] if args else 'PONG'
+
+    async def ok(self, *args):
+        return 'OK'
+
+    async def expire(self, key, seconds):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(seconds)
+        return 1
+
+    async def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                self._drop(key)
+                removed += 1
+        return removed
+
+    async def keys(self, pattern):
+        pattern = pattern.decode()
+        return [
+            key for key in list(self.lists) + list(self.zsets) + list(self.hashes)
+            if self._alive(key) and fnmatch.fnmatchcase(key.decode(), pattern)
+        ]
+
+    async def flushdb(self, *args):
+        self.lists.clear()
+        self.zsets.clear()
+        self.hashes.clear()
+        self.expires.clear()
+        return 'OK'
+
+    # Lists
+
+    async def rpush(self, key, *values):
+        self._alive(key)
+        items = self.lists.setdefault(key, collections.deque())
+        if len(items) + len(values) > self.max_list_length:
+            return RespError(f'list {key.decode()} is full')
+        items.extend(values)
+        length = len(items)
+        # Hand values straight to blocked BLPOP callers, oldest first
+        waiters = self.waiters.get(key)
+        while waiters and items:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result([key, items.popleft()])
+        if not items:
+            self._drop(key)
+        return length
+
+    async def lpop(self, key, count=None):
+        if not self._alive(key) or key not in self.lists:
+            return None
+        items = self.lists[key]
+        if count is None:
+            value = items.popleft()
+        else:
+            value = [items.popleft() for _ in range(min(int(count), len(items)))]
+        if not items:
+            self._drop(key)
+        return value
+
+    async def blpop(self, *args):
+        *keys, timeout = args
+        for key in keys:
+            value = await self.lpop(key)
+            if value is not None:
+                return [key, value]
+        future = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self.waiters[key].append(future)
+        try:
+            return await asyncio.wait_for(future, float(timeout) or None)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            for key in keys:
+                waiters = self.waiters.get(key)
+                if waiters is not None:
+                    try:
+                        waiters.remove(future)
+                    except ValueError:
+                        pass
+                    if not waiters:
+                        del self.waiters[key]
+
+    async def llen(self, key):
+        if not self._alive(key) or key not in self.lists:
+            return 0
+        return len(self.lists[key])
+
+    # Hashes (integer values only)
+
+    async def hincrby(self, key, field, increment):
+        self._alive(key)
+        fields = self.hashes.setdefault(key, {})
+        fields[field] = fields.get(field, 0) + int(increment)
+        return fields[field]
+
+    async def hmget(self, key, *fields):
+        values = self.hashes.get(key, {}) if self._alive(key) else {}
+        return [None if field not in values else str(values[field]).encode() for field in fields]
+
+    async def hdel(self, key, *fields):
+        if not self._alive(key) or key not in self.hashes:
+            return 0
+        values = self.hashes[key]
+        removed = sum(values.pop(field, None) is not None for field in fields)
+        if not values:
+            self._drop(key)
+        return removed
+
+    # Sorted sets
+
+    async def zadd(self, key, *args):
+        self._alive(key)
+        members = self.zsets.setdefault(key, {})
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            added += member not in members
+            members[member] = _score(score)
+        return added
+
+    async def zrem(self, key, *members):
+        if not self._alive(key) or key not in self.zsets:
+            return 0
+        zset = self.zsets[key]
+        removed = sum(zset.pop(member, None) is not None for member in members)
+        if not zset:
+            self._drop(key)
+        return removed
+
+    async def zcard(self, key):
+        if not self._alive(key) or key not in self.zsets:
+            return 0
+        return len(self.zsets[key])
+
+    async def zrangebyscore(self, key, low, high):
+        if not self._alive(key) or key not in self.zsets:
+            return []
+        low, high = _score(low), _score(high)
+        return [member for member, score in sorted(self.zsets[key].items(), key=lambda item: item[1])
+                if low <= score <= high]
+
+    async def zremrangebyscore(self, key, low, high):
+        if not self._alive(key) or key not in self.zsets:
+            return 0
+        low, high = _score(low), _score(high)
+        zset = self.zsets[key]
+        stale = [member for member, score in zset.items() if low <= score <= high]
+        for member in stale:
+            del zset[member]
+        if not zset:
+            self._drop(key)
+        return len(stale)
+
+    # Server
+
+    async def execute(self, command):
+        if not isinstance(command, list) or not command:
+            return RespError('expected a command array')
+        handler = self.commands.get(command[0].decode().upper())
+        if handler is None:
+            return RespError(f'unknown command {command[0].decode()}')
+        try:
+            return await handler(*command[1:])
+        except (TypeError, ValueError) as e:
+            return RespError(str(e))
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                command = await read_reply(reader)
+                writer.write(encode_reply(await self.execute(command)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _sweep_forever(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+
+    async def serve(self, url, ready=None):
+        parsed = urlparse(url)
+        if parsed.scheme == 'unix':
+            if os.path.exists(parsed.path):
+                os.unlink(parsed.path)
+            server = await asyncio.start_unix_server(self.handle, parsed.path)
+        elif parsed.scheme in ('redis', 'tcp'):
+            server = await asyncio.start_server(self.handle, parsed.hostname or 'localhost', parsed.port or 6379)
+        else:
+            raise ValueError(f'Unsupported broker URL: {url}')
+        sweeper = asyncio.create_task(self._sweep_forever(1))
+        if ready is not None:
+            ready()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+            if parsed.scheme == 'unix' and os.path.exists(parsed.path):
+                os.unlink(parsed.path)
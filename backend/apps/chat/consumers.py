@@ -1,9 +1,8 @@
 import json
 
-from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
-from .models import ConversationMessage, Conversation
+from .persistence import chat_message_buffer
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -18,7 +17,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
         await self.accept()
 
-    async def disconnect(self):
+    async def disconnect(self, close_code):
         # Leave room
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -55,12 +54,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'username': username
         }))
 
-    @sync_to_async
-    def save_message(self, conversation_id, body, sent_to_id):
-        conversation = Conversation.objects.get(id=conversation_id)
+    async def save_message(self, conversation_id, body, sent_to_id):
+        # Queued and written in bulk by the chat message buffer
         user = self.scope['user']
-
-        message = ConversationMessage.objects.create(conversation_id=conversation_id, body=body, sent_to_id=sent_to_id, created_by=user)
-        conversation.modified_at = message.created_at
-        conversation.save()
-        
\ No newline at end of file
+        await chat_message_buffer.add(conversation_id, body, sent_to_id, user.id)
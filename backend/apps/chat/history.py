@@ -0,0 +1,26 @@
+from backend_project.pagination import keyset_page, parse_page_size
+from apps.useraccount.models import User
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+
+def message_page(conversation, query):
+    # Newest page first (keyset on created_at, id); next_cursor loads the
+    # older messages. The page itself is returned oldest first for display.
+    page_size = parse_page_size(query, HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE)
+    messages = conversation.messages.only('id', 'conversation_id', 'body', 'sent_to_id', 'created_by_id', 'created_at')
+    page, next_cursor = keyset_page(messages, 'created_at', True, query.get('cursor', ''), page_size)
+    page.reverse()
+    return page, next_cursor
+
+
+def page_users(conversation, messages):
+    # id -> User for everyone on the page; conversation.users should be
+    # prefetched, anyone else (a former participant) costs one more query
+    users = {user.id: user for user in conversation.users.all()}
+    missing = {message.sent_to_id for message in messages} | {message.created_by_id for message in messages}
+    missing -= users.keys()
+    if missing:
+        users.update((user.id, user) for user in User.objects.filter(id__in=missing))
+    return users
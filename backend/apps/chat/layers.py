@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+import weakref
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+from .resp import RespConnection, RespError
+
+logger = logging.getLogger(__name__)
+
+# Channel layer shared between processes through a Redis-protocol broker:
+# a real Redis server or the stand-in from `manage.py run_chat_broker`.
+#
+# Every channel is a broker list. All specific channels of one process
+# ("specific.<client>!<id>") share a single list, so one BLPOP loop per
+# process and event loop feeds every consumer in it, and group_send costs
+# three round trips whatever the group size. Capacity is per channel: the
+# shared list has a companion hash counting the queued messages of each of
+# its channels (send() raises ChannelFull, group_send() skips full members),
+# and each local queue is bounded too, so a slow consumer drops its own
+# messages instead of stalling the others. Needs Redis 6.2+ (LPOP with a
+# count).
+
+
+class _LoopState:
+    # Connections and local queues belong to one event loop; async_to_sync
+    # callers each bring their own loop
+    def __init__(self):
+        self.connection = None
+        self.connect_lock = asyncio.Lock()
+        self.queues = {}  # specific channel -> asyncio.Queue
+        self.receivers = {}  # non-local channel name -> receive loop task
+
+
+class BrokerChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, url='unix:///tmp/webgame-chat.sock', prefix='asgi', expiry=60, group_expiry=86400,
+                 capacity=100, channel_capacity=None, receive_timeout=5, receive_batch=100, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.url = url
+        self.prefix = prefix
+        self.group_expiry = group_expiry
+        self.receive_timeout = receive_timeout
+        self.receive_batch = receive_batch
+        self.client_prefix = uuid.uuid4().hex
+        self.dropped = 0  # messages discarded as expired or over capacity
+        self._states = weakref.WeakKeyDictionary()
+
+    # Broker access
+
+    def _state(self):
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+        return state
+
+    async def _pipeline(self, commands):
+        state = self._state()
+        async with state.connect_lock:
+            if state.connection is None or state.connection.broken:
+                state.connection = await RespConnection.open(self.url)
+            connection = state.connection
+        replies = await connection.pipeline(commands)
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def _channel_key(self, channel):
+        return f'{self.prefix}:channel:{self.non_local_name(channel)}'
+
+    def _count_key(self, channel):
+        # Queued messages per channel of a shared process list
+        return f'{self.prefix}:count:{self.non_local_name(channel)}'
+
+    def _group_key(self, group):
+        return f'{self.prefix}:group:{group}'
+
+    def _pack(self, channel, message):
+        return json.dumps({'channel': channel, 'expires': time.time() + self.expiry, 'message': message})
+
+    def _unpack(self, data):
+        # (channel, message); message is None when it expired in the queue
+        envelope = json.loads(data)
+        if envelope['expires'] < time.time():
+            self.dropped += 1
+            return envelope['channel'], None
+        return envelope['channel'], envelope['message']
+
+    async def _queued(self, targets):
+        # targets: {list key: [channels]} -> {channel: messages queued for it}
+        keys = list(targets)
+        commands = []
+        for list_key in keys:
+            channels = targets[list_key]
+            if '!' in channels[0]:
+                commands.append(('HMGET', self._count_key(channels[0]), *channels))
+            else:
+                commands.append(('LLEN', list_key))
+        queued = {}
+        for list_key, reply in zip(keys, await self._pipeline(commands)):
+            for index, channel in enumerate(targets[list_key]):
+                queued[channel] = int(reply[index] or 0) if isinstance(reply, list) else reply
+        return queued
+
+    def _push_commands(self, list_key, payloads):
+        # payloads: [(channel, packed message)], all for list_key
+        commands = [('RPUSH', list_key, *[data for _, data in payloads]), ('EXPIRE', list_key, self.expiry)]
+        if '!' in payloads[0][0]:
+            counts = {}
+            for channel, _ in payloads:
+                counts[channel] = counts.get(channel, 0) + 1
+            count_key = self._count_key(payloads[0][0])
+            commands += [('HINCRBY', count_key, channel, count) for channel, count in counts.items()]
+            commands.append(('EXPIRE', count_key, self.expiry))
+        return commands
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        assert '__asgi_channel__' not in message
+        key = self._channel_key(channel)
+        queued = await self._queued({key: [channel]})
+        if queued[channel] >= self.get_capacity(channel):
+            raise ChannelFull(channel)
+        await self._pipeline(self._push_commands(key, [(channel, self._pack(channel, message))]))
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        if '!' not in channel:
+            return await self._receive_direct(channel)
+        state = self._state()
+        queue = state.queues.setdefault(channel, asyncio.Queue(self.get_capacity(channel)))
+        name = self.non_local_name(channel)
+        receiver = state.receivers.get(name)
+        if receiver is None or receiver.done():
+            state.receivers[name] = asyncio.get_running_loop().create_task(self._receive_loop(state, name))
+        try:
+            return await queue.get()
+        finally:
+            if queue.empty() and state.queues.get(channel) is queue:
+                del state.queues[channel]
+
+    async def new_channel(self, prefix='specific.'):
+        return f'{prefix}{self.client_prefix}!{uuid.uuid4().hex[:12]}'
+
+    async def _blpop(self, connection, key):
+        reply, = await connection.pipeline([('BLPOP', key, self.receive_timeout)])
+        if isinstance(reply, RespError):
+            raise reply
+        return reply[1] if reply else None
+
+    async def _receive_direct(self, channel):
+        # Normal channels get their own blocking connection per receive()
+        connection = await RespConnection.open(self.url)
+        try:
+            while True:
+                data = await self._blpop(connection, self._channel_key(channel))
+                message = self._unpack(data)[1] if data is not None else None
+                if message is not None:
+                    return message
+        finally:
+            await connection.close()
+
+    async def _receive_loop(self, state, name):
+        key = self._channel_key(name)
+        count_key = self._count_key(name)
+        connection = None
+        # Counts of received messages go out with the next LPOP, so they cost
+        # no extra round trip; fields that reached zero are removed after that
+        # (a send racing the HDEL only makes the count too low, never too high)
+        received = {}
+        emptied = []
+        while True:
+            try:
+                if connection is None or connection.broken:
+                    connection = await RespConnection.open(self.url)
+                # Drain a backlog in batches, block only once it is empty
+                commands = [('HINCRBY', count_key, channel, -count) for channel, count in received.items()]
+                if emptied:
+                    commands.append(('HDEL', count_key, *emptied))
+                *replies, batch = await connection.pipeline(commands + [('LPOP', key, self.receive_batch)])
+                for reply in replies + [batch]:
+                    if isinstance(reply, RespError):
+                        raise reply
+                emptied = [channel for channel, count in zip(received, replies) if count <= 0]
+                received = {}
+                if not batch:
+                    data = await self._blpop(connection, key)
+                    batch = [data] if data is not None else []
+            except asyncio.CancelledError:
+                if connection is not None:
+                    await connection.close()
+                raise
+            except (ConnectionError, OSError, RespError):
+                logger.exception('Chat broker receive failed, reconnecting')
+                connection = None
+                await asyncio.sleep(1)
+                continue
+            for data in batch:
+                channel, message = self._unpack(data)
+                received[channel] = received.get(channel, 0) + 1
+                if message is None:
+                    continue
+                queue = state.queues.setdefault(channel, asyncio.Queue(self.get_capacity(channel)))
+                try:
+                    queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    self.dropped += 1
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        key = self._group_key(group)
+        await self._pipeline([('ZADD', key, time.time(), channel), ('EXPIRE', key, self.group_expiry)])
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        await self._pipeline([('ZREM', self._group_key(group), channel)])
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        assert self.valid_group_name(group), 'Group name not valid'
+        key = self._group_key(group)
+        oldest = time.time() - self.group_expiry
+        _, members = await self._pipeline([
+            ('ZREMRANGEBYSCORE', key, 0, oldest),
+            ('ZRANGEBYSCORE', key, oldest, '+inf'),
+        ])
+        if not members:
+            return
+        # Members of one process share a list: one HMGET and one RPUSH each
+        targets = {}
+        for member in members:
+            channel = member.decode()
+            targets.setdefault(self._channel_key(channel), []).append(channel)
+        queued = await self._queued(targets)
+        commands = []
+        for list_key, channels in targets.items():
+            payloads = []
+            for channel in channels:
+                if queued[channel] >= self.get_capacity(channel):
+                    self.dropped += 1
+                    continue
+                payloads.append((channel, self._pack(channel, message)))
+            if payloads:
+                commands += self._push_commands(list_key, payloads)
+        if commands:
+            await self._pipeline(commands)
+
+    # Flush extension
+
+    async def flush(self):
+        keys, = await self._pipeline([('KEYS', f'{self.prefix}:*')])
+        if keys:
+            await self._pipeline([('DEL', *keys)])
+        self._state().queues.clear()
+
+    async def close(self):
+        state = self._states.pop(asyncio.get_running_loop(), None)
+        if state is None:
+            return
+        for receiver in state.receivers.values():
+            receiver.cancel()
+        if state.connection is not None:
+            await state.connection.close()
@@ -0,0 +1,121 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.chat.broker import ChatBroker
+from apps.chat.layers import BrokerChannelLayer
+from apps.chat.resp import RespConnection
+
+GROUP = 'benchmark'
+
+
+def run_broker(url):
+    asyncio.run(ChatBroker().serve(url))
+
+
+def run_worker(url, index, workers, messages, capacity, ready, start, results):
+    asyncio.run(_worker(url, index, workers, messages, capacity, ready, start, results))
+
+
+async def _worker(url, index, workers, messages, capacity, ready, start, results):
+    # Every worker sends `messages` chat messages to the group and receives
+    # the messages of all workers, like daphne processes sharing one room
+    layer = BrokerChannelLayer(url=url, capacity=capacity)
+    channel = await layer.new_channel()
+    await layer.group_add(GROUP, channel)
+    ready.put(index)
+    await asyncio.get_running_loop().run_in_executor(None, start.wait)
+
+    async def send_all():
+        for number in range(messages):
+            await layer.group_send(GROUP, {'type': 'chat_message', 'worker': index, 'number': number, 'sent_at': time.time()})
+
+    sender = asyncio.create_task(send_all())
+    latencies = []
+    while len(latencies) < workers * messages:
+        try:
+            message = await asyncio.wait_for(layer.receive(channel), timeout=5)
+        except asyncio.TimeoutError:
+            break
+        latencies.append(time.time() - message['sent_at'])
+    await sender
+    finished = time.time()
+    await layer.group_discard(GROUP, channel)
+    await layer.close()
+    results.put((index, latencies, layer.dropped, finished))
+
+
+async def _wait_for_broker(url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            connection = await RespConnection.open(url)
+            await connection.execute('PING')
+            await connection.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+class Command(BaseCommand):
+    help = 'Measure BrokerChannelLayer group fan-out across worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--messages', type=int, default=2000, help='Messages sent by each worker')
+        parser.add_argument('--capacity', type=int, default=1000)
+        parser.add_argument('--url', default='',
+                            help='Use this broker (e.g. redis://localhost:6379/0) instead of starting a local one')
+
+    def handle(self, *args, **options):
+        workers, messages = options['workers'], options['messages']
+        broker = None
+        with tempfile.TemporaryDirectory() as directory:
+            url = options['url'] or f'unix://{os.path.join(directory, "broker.sock")}'
+            if not options['url']:
+                broker = multiprocessing.Process(target=run_broker, args=(url,), daemon=True)
+                broker.start()
+            try:
+                asyncio.run(_wait_for_broker(url))
+                self.run(url, workers, messages, options['capacity'])
+            finally:
+                if broker is not None:
+                    broker.terminate()
+                    broker.join()
+
+    def run(self, url, workers, messages, capacity):
+        ready, results, start = multiprocessing.Queue(), multiprocessing.Queue(), multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(url, index, workers, messages, capacity, ready, start, results))
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get(timeout=30)
+        started = time.time()
+        start.set()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        latencies = sorted(latency for _, worker_latencies, _, _ in outcomes for latency in worker_latencies)
+        elapsed = max(finished for _, _, _, finished in outcomes) - started
+        expected = workers * workers * messages
+        dropped = sum(dropped for _, _, dropped, _ in outcomes)
+
+        def percentile(fraction):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000 if latencies else 0.0
+
+        self.stdout.write(f'{workers} workers x {messages} messages, {len(latencies)}/{expected} delivered, '
+                          f'{dropped} dropped over capacity or expired')
+        self.stdout.write(f'{len(latencies) / elapsed:,.0f} deliveries/s, {workers * messages / elapsed:,.0f} group sends/s '
+                          f'in {elapsed:.2f} s')
+        self.stdout.write(f'latency p50 {percentile(0.5):.2f} ms, p99 {percentile(0.99):.2f} ms, '
+                          f'max {percentile(1.0):.2f} ms')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.chat.persistence import buffer_settings, replay_dead_letters
+
+
+class Command(BaseCommand):
+    help = 'Write the chat messages that the message buffer could not store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=buffer_settings()['DEAD_LETTER_PATH'],
+                            help='Dead-letter file, CHAT_MESSAGE_BUFFER["DEAD_LETTER_PATH"] by default')
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            raise CommandError('No dead-letter file configured')
+        written, failed = replay_dead_letters(options['path'])
+        self.stdout.write(f'{written} chat messages written, {failed} still failing')
@@ -0,0 +1,24 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.chat.broker import DEFAULT_MAX_LIST_LENGTH, ChatBroker
+
+
+class Command(BaseCommand):
+    help = 'Run the local Redis-protocol broker that BrokerChannelLayer processes share'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=getattr(settings, 'CHAT_BROKER_URL', '') or 'unix:///tmp/webgame-chat.sock',
+                            help='unix:///path.sock or tcp://host:port to listen on')
+        parser.add_argument('--max-list-length', type=int, default=DEFAULT_MAX_LIST_LENGTH,
+                            help='Refuse pushes beyond this many queued messages per channel')
+
+    def handle(self, *args, **options):
+        broker = ChatBroker(max_list_length=options['max_list_length'])
+        ready = lambda: self.stdout.write(f'Chat broker listening on {options["url"]}')
+        try:
+            asyncio.run(broker.serve(options['url'], ready=ready))
+        except KeyboardInterrupt:
+            pass
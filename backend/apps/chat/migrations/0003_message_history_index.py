@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_created_at_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversationmessage',
+            index=models.Index(fields=['conversation', '-created_at', '-id'], name='message_conv_created_idx'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:08
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Now, Substr
+
+
+def backfill_inbox(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationMessage = apps.get_model('chat', 'ConversationMessage')
+    ConversationReadState = apps.get_model('chat', 'ConversationReadState')
+    latest = ConversationMessage.objects.filter(conversation=models.OuterRef('pk')).order_by('-created_at', '-id')
+    Conversation.objects.filter(messages__isnull=False).update(
+        last_message_preview=models.Subquery(latest.annotate(preview=Substr('body', 1, 255)).values('preview')[:1]),
+        last_message_at=models.Subquery(latest.values('created_at')[:1]),
+        last_message_by=models.Subquery(latest.values('created_by')[:1]),
+    )
+    # Existing history counts as read
+    ConversationReadState.objects.bulk_create([
+        ConversationReadState(conversation_id=conversation_id, user_id=user_id)
+        for conversation_id, user_id in Conversation.users.through.objects.values_list('conversation_id', 'user_id')
+    ], batch_size=1000, ignore_conflicts=True)
+    ConversationReadState.objects.update(last_read_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_message_history_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationReadState',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('last_read_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['-modified_at', '-id'], name='conversation_modified_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversationreadstate',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='chat.conversation'),
+        ),
+        migrations.AddField(
+            model_name='conversationreadstate',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_read_states', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='conversationreadstate',
+            constraint=models.UniqueConstraint(fields=('conversation', 'user'), name='unique_conversation_read_state'),
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:09
+
+from django.db import migrations, models
+
+
+def backfill_pair_keys(apps, schema_editor):
+    # Two person conversations get their key; when a pair already has
+    # several, the most recently active one is used from now on
+    Conversation = apps.get_model('chat', 'Conversation')
+    participants = {}
+    for conversation_id, user_id in Conversation.users.through.objects.values_list('conversation_id', 'user_id'):
+        participants.setdefault(conversation_id, []).append(str(user_id))
+    conversations = []
+    seen = set()
+    for conversation in Conversation.objects.filter(id__in=participants).order_by('-modified_at'):
+        users = participants[conversation.id]
+        if len(users) != 2:
+            continue
+        conversation.pair_key = ':'.join(sorted(users))
+        if conversation.pair_key not in seen:
+            seen.add(conversation.pair_key)
+            conversations.append(conversation)
+    Conversation.objects.bulk_update(conversations, ['pair_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_conversation_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='pair_key',
+            field=models.CharField(blank=True, editable=False, max_length=73, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_pair_keys, migrations.RunPython.noop),
+    ]
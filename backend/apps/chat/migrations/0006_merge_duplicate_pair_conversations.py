@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:40
+
+from django.db import migrations, models
+
+
+def merge_duplicate_pairs(apps, schema_editor):
+    # 0005 only keyed the most recently active conversation of a pair. Move
+    # the messages of the pair's other conversations into it, merge the read
+    # markers and delete the emptied duplicates, so no history is lost.
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationMessage = apps.get_model('chat', 'ConversationMessage')
+    ConversationReadState = apps.get_model('chat', 'ConversationReadState')
+    participants = {}
+    for conversation_id, user_id in Conversation.users.through.objects.values_list('conversation_id', 'user_id'):
+        participants.setdefault(conversation_id, []).append(str(user_id))
+    survivors = dict(Conversation.objects.filter(pair_key__isnull=False).values_list('pair_key', 'id'))
+    duplicates = {}
+    for conversation_id in Conversation.objects.filter(pair_key__isnull=True, id__in=participants).values_list('id', flat=True):
+        users = participants[conversation_id]
+        survivor_id = survivors.get(':'.join(sorted(users))) if len(users) == 2 else None
+        if survivor_id is not None:
+            duplicates.setdefault(survivor_id, []).append(conversation_id)
+
+    for survivor_id, duplicate_ids in duplicates.items():
+        conversation_ids = [survivor_id, *duplicate_ids]
+        ConversationMessage.objects.filter(conversation_id__in=duplicate_ids).update(conversation_id=survivor_id)
+        markers = ConversationReadState.objects.filter(conversation_id__in=conversation_ids).values('user_id').annotate(
+            unread=models.Sum('unread_count'), read_at=models.Max('last_read_at')).order_by()
+        for marker in markers:
+            ConversationReadState.objects.update_or_create(
+                conversation_id=survivor_id, user_id=marker['user_id'],
+                defaults={'unread_count': marker['unread'], 'last_read_at': marker['read_at']},
+            )
+        modified_at = Conversation.objects.filter(id__in=conversation_ids).aggregate(latest=models.Max('modified_at'))['latest']
+        latest = ConversationMessage.objects.filter(conversation_id=survivor_id).order_by('-created_at', '-id').first()
+        changes = {'modified_at': modified_at}
+        if latest is not None:
+            changes.update(last_message_preview=latest.body[:255], last_message_at=latest.created_at,
+                           last_message_by_id=latest.created_by_id)
+        Conversation.objects.filter(id=survivor_id).update(**changes)
+        Conversation.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_conversation_pair_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_pairs, migrations.RunPython.noop),
+    ]
@@ -1,21 +1,87 @@
 import uuid
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 
 from apps.useraccount.models import User
 
 
 class Conversation(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=['-modified_at', '-id'], name='conversation_modified_idx')
+        ]
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     users = models.ManyToManyField(User, related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
+    # Newest message, kept up to date by the chat write path for the inbox
+    last_message_preview = models.CharField(max_length=255, blank=True, default='')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_by = models.ForeignKey(User, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    # Sorted "<user id>:<user id>" of a two person conversation, so a DM is
+    # found with one unique index lookup; null for other conversations
+    pair_key = models.CharField(max_length=73, unique=True, null=True, blank=True, editable=False)
+
+    @staticmethod
+    def make_pair_key(user_id, other_id):
+        return ':'.join(sorted([str(user_id), str(other_id)]))
+
+    @classmethod
+    def get_or_create_pair(cls, user, other):
+        # (conversation, created); the unique pair_key makes concurrent
+        # starts for the same two users end up in one conversation
+        pair_key = cls.make_pair_key(user.id, other.id)
+        try:
+            return cls.objects.get(pair_key=pair_key), False
+        except cls.DoesNotExist:
+            pass
+        try:
+            with transaction.atomic():
+                conversation = cls.objects.create(pair_key=pair_key)
+                conversation.users.add(user, other)
+                ConversationReadState.objects.bulk_create([
+                    ConversationReadState(conversation=conversation, user=participant) for participant in {user, other}
+                ], ignore_conflicts=True)
+        except IntegrityError:
+            # Another request created it first
+            return cls.objects.get(pair_key=pair_key), False
+        return conversation, True
 
 
 class ConversationMessage(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', '-created_at', '-id'], name='message_conv_created_idx')
+        ]
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     conversation = models.ForeignKey(Conversation, related_name='messages', on_delete=models.CASCADE)
     body = models.TextField()
     sent_to = models.ForeignKey(User, related_name='received_messages', on_delete=models.CASCADE)
     created_by = models.ForeignKey(User, related_name='sent_messages', on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    # Set when the message is queued, not when the batch is written
+    created_at = models.DateTimeField(default=timezone.now)
+
+
+class ConversationReadState(models.Model):
+    # Per participant read marker and unread counter of a conversation
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='unique_conversation_read_state')
+        ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    conversation = models.ForeignKey(Conversation, related_name='read_states', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='conversation_read_states', on_delete=models.CASCADE)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    unread_count = models.IntegerField(default=0)
+
+    @classmethod
+    def mark_read(cls, conversation_id, user_id, read_at=None):
+        read_at = read_at or timezone.now()
+        updated = cls.objects.filter(conversation_id=conversation_id, user_id=user_id).update(
+            unread_count=0, last_read_at=read_at)
+        if not updated:
+            # No marker yet; the write path may be creating it concurrently
+            cls.objects.bulk_create([cls(conversation_id=conversation_id, user_id=user_id)], ignore_conflicts=True)
+            cls.objects.filter(conversation_id=conversation_id, user_id=user_id).update(
+                unread_count=0, last_read_at=read_at)
@@ -0,0 +1,406 @@
+import asyncio
+import atexit
+import collections
+import datetime
+import json
+import logging
+import os
+import signal
+import threading
+import uuid
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from apps.useraccount.models import User
+
+from .models import Conversation, ConversationMessage, ConversationReadState
+
+logger = logging.getLogger(__name__)
+
+# Chat messages are queued here by ChatConsumer instead of being written one
+# by one. A background task collects everything that arrives within
+# FLUSH_INTERVAL_MS, across conversations, and writes it with a single
+# bulk_create plus chunked UPDATEs of the conversations (modified_at and
+# last message) and the participants' unread counters. Messages get their
+# id and created_at when queued, so a failed or repeated flush keeps their
+# order and never writes one twice. A batch that still fails after
+# MAX_RETRIES attempts is written message by message, and the messages that
+# fail on their own are appended to DEAD_LETTER_PATH (JSON lines) so the queue
+# keeps moving; `manage.py replay_chat_dead_letters` writes them later.
+#
+# Queued messages only live in memory until their flush commits. SIGTERM,
+# SIGINT and a normal exit write them first (to the dead-letter file when the
+# database is unreachable), but a process killed with SIGKILL or a host crash
+# loses the queue: about FLUSH_INTERVAL_MS of messages while the database
+# keeps up, up to MAX_PENDING while it is down.
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL_MS': 20,
+    'MAX_BATCH': 500,
+    'MAX_PENDING': 10000,
+    'MAX_RETRIES': 8,
+    'DEAD_LETTER_PATH': None,
+}
+
+# Rows per CASE UPDATE in update_conversations
+UPDATE_CHUNK = 200
+
+
+def buffer_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'CHAT_MESSAGE_BUFFER', {})}
+
+
+def write_messages(messages):
+    # messages: unsaved ConversationMessage objects with id and created_at
+    # set; ones already stored are skipped on their id
+    conversation_ids = {message.conversation_id for message in messages}
+    user_ids = {message.sent_to_id for message in messages} | {message.created_by_id for message in messages}
+    valid_conversations = set(Conversation.objects.filter(id__in=conversation_ids).values_list('id', flat=True))
+    valid_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    rows = [
+        message for message in messages
+        if message.conversation_id in valid_conversations
+        and message.sent_to_id in valid_users and message.created_by_id in valid_users
+    ]
+    if len(rows) < len(messages):
+        logger.warning('Dropped %d chat messages for unknown conversations or users', len(messages) - len(rows))
+    with transaction.atomic():
+        # A retried batch may have been committed already; only messages
+        # stored now count towards the conversations and unread counters
+        stored = set(ConversationMessage.objects.filter(id__in=[message.id for message in rows]).values_list('id', flat=True))
+        rows = [message for message in rows if message.id not in stored]
+        ConversationMessage.objects.bulk_create(rows, ignore_conflicts=True)
+        update_conversations(rows)
+    return len(rows)
+
+
+def dump_message(message):
+    return json.dumps({
+        'id': str(message.id),
+        'conversation_id': str(message.conversation_id),
+        'body': message.body,
+        'sent_to_id': str(message.sent_to_id),
+        'created_by_id': str(message.created_by_id),
+        'created_at': message.created_at.isoformat(),
+    })
+
+
+def load_message(line):
+    data = json.loads(line)
+    return ConversationMessage(
+        id=uuid.UUID(data['id']),
+        conversation_id=uuid.UUID(data['conversation_id']),
+        body=data['body'],
+        sent_to_id=uuid.UUID(data['sent_to_id']),
+        created_by_id=uuid.UUID(data['created_by_id']),
+        created_at=datetime.datetime.fromisoformat(data['created_at']),
+    )
+
+
+def append_dead_letters(path, messages):
+    # One write in append mode, synced before returning since the messages
+    # leave the queue right after
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(''.join(dump_message(message) + '\n' for message in messages))
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def replay_dead_letters(path):
+    # Writes the dead-lettered messages again, those stored already are
+    # skipped on their id; ones that still fail go back to the file. The file
+    # is moved aside first, so workers can keep appending meanwhile and a
+    # replay stopped half way is picked up by the next one.
+    # Returns (written, failed)
+    replaying = f'{path}.replaying'
+    if not os.path.exists(replaying):
+        if not os.path.exists(path):
+            return 0, 0
+        os.replace(path, replaying)
+    with open(replaying, encoding='utf-8') as file:
+        messages = [load_message(line) for line in file if line.strip()]
+    failed = []
+    try:
+        written = write_messages(messages)
+    except Exception:
+        written = 0
+        for message in messages:
+            try:
+                written += write_messages([message])
+            except Exception:
+                logger.exception('Could not replay chat message %s', message.id)
+                failed.append(message)
+    if failed:
+        append_dead_letters(path, failed)
+    os.remove(replaying)
+    return written, len(failed)
+
+
+def _case(values, output_field, default=None):
+    # values: {Q: value}; one CASE so a whole batch is a single UPDATE
+    return models.Case(
+        *[models.When(condition, then=value) for condition, value in values.items()],
+        default=default, output_field=output_field,
+    )
+
+
+def update_conversations(messages):
+    # Newest message and per participant unread counters for a batch of
+    # messages (in created_at order)
+    latest = {}
+    for message in messages:
+        latest[message.conversation_id] = message
+    if not latest:
+        return
+    members = collections.defaultdict(list)
+    for conversation_id, user_id in Conversation.users.through.objects.filter(
+            conversation_id__in=latest).values_list('conversation_id', 'user_id'):
+        members[conversation_id].append(user_id)
+
+    # (conversation, user) -> [read up to here?, unread messages, read at].
+    # Sending a message marks everything before it as read for the sender
+    states = {}
+    for message in messages:
+        for user_id in members[message.conversation_id]:
+            if user_id != message.created_by_id:
+                states.setdefault((message.conversation_id, user_id), [False, 0, None])[1] += 1
+        states[(message.conversation_id, message.created_by_id)] = [True, 0, message.created_at]
+
+    ConversationReadState.objects.bulk_create([
+        ConversationReadState(conversation_id=conversation_id, user_id=user_id)
+        for conversation_id, user_ids in members.items() for user_id in user_ids
+    ], ignore_conflicts=True)
+    # Chunked and filtered by conversation, so a full batch stays well below
+    # the database's expression size limits
+    keys = list(states)
+    for start in range(0, len(keys), UPDATE_CHUNK):
+        chunk = {key: states[key] for key in keys[start:start + UPDATE_CHUNK]}
+        pairs = {key: models.Q(conversation_id=key[0], user_id=key[1]) for key in chunk}
+        ConversationReadState.objects.filter(conversation_id__in={key[0] for key in chunk}).update(
+            unread_count=_case({
+                pairs[key]: models.Value(unread) if read else models.F('unread_count') + unread
+                for key, (read, unread, _) in chunk.items()
+            }, models.IntegerField(), default=models.F('unread_count')),
+            last_read_at=_case({
+                pairs[key]: models.Value(read_at)
+                for key, (read, _, read_at) in chunk.items() if read
+            }, models.DateTimeField(), default=models.F('last_read_at')),
+        )
+
+    conversation_ids = list(latest)
+    for start in range(0, len(conversation_ids), UPDATE_CHUNK):
+        chunk = {conversation_id: latest[conversation_id] for conversation_id in conversation_ids[start:start + UPDATE_CHUNK]}
+        conversations = {conversation_id: models.Q(id=conversation_id) for conversation_id in chunk}
+        Conversation.objects.filter(id__in=chunk).update(
+            modified_at=_case({conversations[key]: models.Value(message.created_at) for key, message in chunk.items()},
+                              models.DateTimeField()),
+            last_message_at=_case({conversations[key]: models.Value(message.created_at) for key, message in chunk.items()},
+                                  models.DateTimeField()),
+            last_message_preview=_case({conversations[key]: models.Value(message.body[:255]) for key, message in chunk.items()},
+                                       models.CharField()),
+            last_message_by_id=_case({conversations[key]: models.Value(message.created_by_id) for key, message in chunk.items()},
+                                     models.UUIDField()),
+        )
+
+
+class ChatMessageBuffer:
+    def __init__(self, enabled, flush_interval_ms, max_batch, max_pending, max_retries, dead_letter_path=None):
+        self.enabled = enabled
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path
+        self._pending = collections.deque()
+        self._dequeue_lock = threading.Lock()
+        self._task = None
+        self._wakeup = None
+        self._space = None
+        self._last_created_at = None
+        self._flushes = 0
+        self._flushed = 0
+        self._failures = 0
+        self._dead_lettered = 0
+
+    def _timestamp(self):
+        # Strictly increasing, so history order is the order of arrival
+        now = timezone.now()
+        if self._last_created_at is not None and now <= self._last_created_at:
+            now = self._last_created_at + datetime.timedelta(microseconds=1)
+        self._last_created_at = now
+        return now
+
+    async def add(self, conversation_id, body, sent_to_id, created_by_id):
+        # Raises ValueError on malformed ids; returns the queued message
+        message = ConversationMessage(
+            id=uuid.uuid4(),
+            conversation_id=uuid.UUID(str(conversation_id)),
+            body=body,
+            sent_to_id=uuid.UUID(str(sent_to_id)),
+            created_by_id=uuid.UUID(str(created_by_id)),
+            created_at=self._timestamp(),
+        )
+        if not self.enabled:
+            await database_sync_to_async(write_messages)([message])
+            return message
+        self._ensure_worker()
+        while len(self._pending) >= self.max_pending:
+            # Wait for the writer to catch up rather than lose messages
+            self._space.clear()
+            self._wakeup.set()
+            await self._space.wait()
+        self._pending.append(message)
+        self._wakeup.set()
+        return message
+
+    def _next_batch(self):
+        # Left queued until written, so a crash mid-flush loses nothing;
+        # writing a batch again is harmless
+        return [self._pending[index] for index in range(min(self.max_batch, len(self._pending)))]
+
+    def _dequeue(self, batch):
+        # Only drops what is still at the head of the queue, so a batch that
+        # the shutdown flush wrote while the writer task was on it leaves once
+        ids = {message.id for message in batch}
+        with self._dequeue_lock:
+            count = 0
+            while self._pending and self._pending[0].id in ids:
+                self._pending.popleft()
+                count += 1
+        self._flushes += 1
+        self._flushed += count
+
+    def _written(self, batch):
+        self._dequeue(batch)
+        if self._space is not None:
+            self._space.set()
+
+    async def flush(self):
+        while self._pending:
+            batch = self._next_batch()
+            await database_sync_to_async(write_messages)(batch)
+            self._written(batch)
+
+    def flush_sync(self):
+        # For shutdown, when the event loop is stopped or busy with a signal
+        while self._pending:
+            batch = self._next_batch()
+            write_messages(batch)
+            self._dequeue(batch)
+
+    def flush_on_shutdown(self):
+        try:
+            self.flush_sync()
+        except Exception:
+            logger.exception('Failed to write chat messages on shutdown, dead-lettering %d', len(self._pending))
+            batch = list(self._pending)
+            self._dead_letter(batch)
+            self._dequeue(batch)
+
+    def _write_each(self, batch):
+        # Last resort for a batch that keeps failing
+        failed = []
+        for message in batch:
+            try:
+                write_messages([message])
+            except Exception:
+                logger.exception('Could not write chat message %s', message.id)
+                failed.append(message)
+        if failed:
+            self._dead_letter(failed)
+
+    def _dead_letter(self, messages):
+        self._dead_lettered += len(messages)
+        if self.dead_letter_path:
+            try:
+                append_dead_letters(self.dead_letter_path, messages)
+                return
+            except OSError:
+                logger.exception('Could not write the chat dead-letter file %s', self.dead_letter_path)
+        for message in messages:
+            logger.error('Dropped chat message %s in conversation %s from %s: %r', message.id,
+                         message.conversation_id, message.created_by_id, message.body)
+
+    def metrics(self):
+        return {
+            'pending': len(self._pending),
+            'flushes': self._flushes,
+            'flushed': self._flushed,
+            'failures': self._failures,
+            'dead_lettered': self._dead_lettered,
+        }
+
+    def _ensure_worker(self):
+        # One writer task per event loop; restarted if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        retry_delay = self.flush_interval
+        attempts = 0
+        while True:
+            await self._wakeup.wait()
+            if len(self._pending) < self.max_batch:
+                # Give the batch a moment to fill up
+                await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                retry_delay = self.flush_interval
+                attempts = 0
+            except Exception:
+                self._failures += 1
+                attempts += 1
+                if attempts < self.max_retries:
+                    logger.exception('Failed to write chat messages, retrying')
+                    await asyncio.sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, 5)
+                else:
+                    logger.exception('Failed to write chat messages %d times, writing them one by one', attempts)
+                    batch = self._next_batch()
+                    await database_sync_to_async(self._write_each)(batch)
+                    self._written(batch)
+                    retry_delay = self.flush_interval
+                    attempts = 0
+                self._wakeup.set()
+
+
+_config = buffer_settings()
+chat_message_buffer = ChatMessageBuffer(
+    _config['ENABLED'], _config['FLUSH_INTERVAL_MS'], _config['MAX_BATCH'], _config['MAX_PENDING'], _config['MAX_RETRIES'],
+    _config['DEAD_LETTER_PATH'])
+_previous_handlers = {}
+
+
+@atexit.register
+def _flush_on_exit():
+    chat_message_buffer.flush_on_shutdown()
+
+
+def _flush_on_signal(signum, frame):
+    # The handler runs on the thread of the event loop, where the ORM refuses
+    # synchronous calls
+    thread = threading.Thread(target=chat_message_buffer.flush_on_shutdown)
+    thread.start()
+    thread.join()
+    previous = _previous_handlers.get(signum)
+    if callable(previous):
+        previous(signum, frame)
+    elif previous != signal.SIG_IGN:
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+
+def install_signal_handlers():
+    # Called from the main thread at startup. A server that installs its own
+    # handlers afterwards (daphne's reactor) replaces these; it then exits
+    # normally and the atexit flush runs instead.
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        _previous_handlers[signum] = signal.signal(signum, _flush_on_signal)
@@ -0,0 +1,120 @@
+import asyncio
+from urllib.parse import urlparse
+
+# The subset of the Redis wire protocol (RESP2) spoken between the chat
+# channel layer and its broker: either a real Redis server or the stand-in
+# started with `manage.py run_chat_broker`.
+
+
+class RespError(Exception):
+    pass
+
+
+def _bulk(value):
+    if isinstance(value, str):
+        value = value.encode()
+    elif not isinstance(value, bytes):
+        value = str(value).encode()
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def encode_command(*args):
+    return b'*%d\r\n' % len(args) + b''.join(_bulk(arg) for arg in args)
+
+
+def encode_reply(value):
+    # str is a status reply (+OK), bytes a bulk string, None a null bulk
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, RespError):
+        return b'-ERR %s\r\n' % str(value).encode()
+    if isinstance(value, str):
+        return b'+%s\r\n' % value.encode()
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, bytes):
+        return _bulk(value)
+    return b'*%d\r\n' % len(value) + b''.join(encode_reply(item) for item in value)
+
+
+async def read_reply(reader):
+    # Error replies are returned, not raised, so a pipeline can carry on
+    line = await reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError('Broker connection closed')
+    kind, rest = line[:1], line[1:-2]
+    if kind == b'+':
+        return rest.decode()
+    if kind == b'-':
+        return RespError(rest.decode())
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        length = int(rest)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b'*':
+        length = int(rest)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RespError(f'Unexpected reply {line!r}')
+
+
+async def open_stream(url):
+    # unix:///path/to.sock, redis://host:port/db or tcp://host:port
+    parsed = urlparse(url)
+    if parsed.scheme == 'unix':
+        return await asyncio.open_unix_connection(parsed.path)
+    if parsed.scheme in ('redis', 'tcp'):
+        return await asyncio.open_connection(parsed.hostname or 'localhost', parsed.port or 6379)
+    raise ValueError(f'Unsupported broker URL: {url}')
+
+
+class RespConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.broken = False
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def open(cls, url):
+        connection = cls(*await open_stream(url))
+        parsed = urlparse(url)
+        if parsed.password:
+            await connection.execute('AUTH', parsed.password)
+        database = parsed.path.strip('/') if parsed.scheme == 'redis' else ''
+        if database:
+            await connection.execute('SELECT', database)
+        return connection
+
+    async def pipeline(self, commands):
+        # One write and one round trip for all commands; replies in order
+        async with self._lock:
+            if self.broken:
+                raise ConnectionError('Broker connection closed')
+            try:
+                self.writer.write(b''.join(encode_command(*command) for command in commands))
+                await self.writer.drain()
+                return [await read_reply(self.reader) for _ in commands]
+            except BaseException:
+                # Cancelled or failed half way: replies would no longer line up
+                self.broken = True
+                self.writer.close()
+                raise
+
+    async def execute(self, *command):
+        reply, = await self.pipeline([command])
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    async def close(self):
+        self.broken = True
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
@@ -27,4 +27,25 @@ class ConversationMessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ConversationMessage
-        fields = ('id', 'body', 'sent_to', 'created_by',)
\ No newline at end of file
+        fields = ('id', 'body', 'sent_to', 'created_by',)
+
+
+class ConversationMessageCompactSerializer(serializers.ModelSerializer):
+    # Participants are sent once per page, messages only carry their ids
+    sent_to_id = serializers.UUIDField(read_only=True)
+    created_by_id = serializers.UUIDField(read_only=True)
+
+    class Meta:
+        model = ConversationMessage
+        fields = ('id', 'body', 'sent_to_id', 'created_by_id', 'created_at',)
+
+
+class ConversationInboxSerializer(serializers.ModelSerializer):
+    users = UserDetailSerializer(many=True, read_only=True)
+    last_message_by_id = serializers.UUIDField(read_only=True)
+    # Annotated from the request user's ConversationReadState
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Conversation
+        fields = ('id', 'users', 'modified_at', 'last_message_preview', 'last_message_at', 'last_message_by_id', 'unread_count',)
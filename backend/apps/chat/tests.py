@@ -1,3 +1,462 @@
-from django.test import TestCase
+import asyncio
+import collections
+import datetime
+import importlib
+import io
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import unittest
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.useraccount.models import User
+
+from .broker import ChatBroker
+from .layers import BrokerChannelLayer
+from .models import Conversation, ConversationMessage, ConversationReadState
+from .persistence import (ChatMessageBuffer, append_dead_letters, install_signal_handlers, load_message,
+                          replay_dead_letters, write_messages)
+
+
+class WriteMessagesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = User.objects.create(email='sender@example.com', username='sender', password='pbkdf2_sha256$x')
+        cls.receiver = User.objects.create(email='receiver@example.com', username='receiver', password='pbkdf2_sha256$x')
+
+    def conversations(self, count):
+        conversations = Conversation.objects.bulk_create([Conversation() for _ in range(count)])
+        Conversation.users.through.objects.bulk_create([
+            Conversation.users.through(conversation_id=conversation.id, user_id=user.id)
+            for conversation in conversations for user in (self.sender, self.receiver)
+        ])
+        return conversations
+
+    def messages(self, conversations, sender, receiver):
+        now = timezone.now()
+        return [
+            ConversationMessage(id=uuid.uuid4(), conversation_id=conversation.id, body=f'message {index}',
+                                sent_to=receiver, created_by=sender, created_at=now + datetime.timedelta(microseconds=index))
+            for index, conversation in enumerate(conversations)
+        ]
+
+    def unread(self, user):
+        return sorted(ConversationReadState.objects.filter(user=user).values_list('unread_count', flat=True))
+
+    def test_full_batch_across_conversations(self):
+        conversations = self.conversations(500)
+        self.assertEqual(write_messages(self.messages(conversations, self.sender, self.receiver)), 500)
+
+        self.assertEqual(self.unread(self.receiver), [1] * 500)
+        self.assertEqual(self.unread(self.sender), [0] * 500)
+        self.assertEqual(Conversation.objects.filter(last_message_by=self.sender).count(), 500)
+
+    def test_reply_resets_sender_unread_count(self):
+        conversation, = self.conversations(1)
+        write_messages(self.messages([conversation] * 3, self.sender, self.receiver))
+        write_messages(self.messages([conversation], self.receiver, self.sender))
+
+        self.assertEqual(self.unread(self.receiver), [0])
+        self.assertEqual(self.unread(self.sender), [1])
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.last_message_preview, 'message 0')
+        self.assertEqual(conversation.last_message_by, self.receiver)
+
+    def test_rewritten_batch_is_counted_once(self):
+        conversation, = self.conversations(1)
+        messages = self.messages([conversation] * 2, self.sender, self.receiver)
+        write_messages(messages)
+
+        self.assertEqual(write_messages(messages), 0)
+        self.assertEqual(self.unread(self.receiver), [2])
+
+    def dead_letter_path(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return os.path.join(directory, 'dead_letters.jsonl')
+
+    def test_failing_message_is_dead_lettered_and_replayed(self):
+        conversation, = self.conversations(1)
+        path = self.dead_letter_path()
+        buffer = ChatMessageBuffer(True, 1, 500, 10000, 2, path)
+
+        def flaky_write(messages):
+            if any(message.body == 'poison' for message in messages):
+                raise DatabaseError('cannot write')
+            return write_messages(messages)
+
+        async def send():
+            for body in ('first', 'poison', 'last'):
+                await buffer.add(conversation.id, body, self.receiver.id, self.sender.id)
+            while buffer.metrics()['pending']:
+                await asyncio.sleep(0.01)
+            buffer._task.cancel()
+
+        # database_sync_to_async would close the connection of the test transaction
+        with mock.patch('channels.db.close_old_connections'), \
+                mock.patch('apps.chat.persistence.write_messages', flaky_write), \
+                self.assertLogs('apps.chat.persistence', 'ERROR'):
+            async_to_sync(send)()
+
+        self.assertEqual(list(conversation.messages.order_by('created_at').values_list('body', flat=True)), ['first', 'last'])
+        self.assertEqual(buffer.metrics()['dead_lettered'], 1)
+        self.assertEqual(self.unread(self.receiver), [2])
+
+        out = io.StringIO()
+        call_command('replay_chat_dead_letters', path=path, stdout=out)
+        self.assertEqual(out.getvalue().strip(), '1 chat messages written, 0 still failing')
+        self.assertEqual(list(conversation.messages.order_by('created_at').values_list('body', flat=True)),
+                         ['first', 'poison', 'last'])
+        self.assertEqual(self.unread(self.receiver), [3])
+        self.assertFalse(os.path.exists(path))
+
+    def test_replay_keeps_messages_that_still_fail(self):
+        conversation, = self.conversations(1)
+        path = self.dead_letter_path()
+        messages = self.messages([conversation] * 2, self.sender, self.receiver)
+        append_dead_letters(path, messages)
+
+        with mock.patch('apps.chat.persistence.write_messages', side_effect=DatabaseError('down')), \
+                self.assertLogs('apps.chat.persistence', 'ERROR'):
+            self.assertEqual(replay_dead_letters(path), (0, 2))
+        self.assertEqual(replay_dead_letters(path), (2, 0))
+        self.assertEqual(self.unread(self.receiver), [2])
+        self.assertEqual(replay_dead_letters(path), (0, 0))
+
+    def test_shutdown_flush_writes_the_queue(self):
+        conversation, = self.conversations(1)
+        buffer = ChatMessageBuffer(True, 1, 2, 10000, 2, self.dead_letter_path())
+        buffer._pending.extend(self.messages([conversation] * 3, self.sender, self.receiver))
+
+        buffer.flush_on_shutdown()
+
+        self.assertEqual(buffer.metrics()['pending'], 0)
+        self.assertEqual(conversation.messages.count(), 3)
+
+    def test_shutdown_flush_dead_letters_when_the_database_fails(self):
+        conversation, = self.conversations(1)
+        path = self.dead_letter_path()
+        buffer = ChatMessageBuffer(True, 1, 500, 10000, 2, path)
+        messages = self.messages([conversation] * 3, self.sender, self.receiver)
+        buffer._pending.extend(messages)
+
+        with mock.patch('apps.chat.persistence.write_messages', side_effect=DatabaseError('down')), \
+                self.assertLogs('apps.chat.persistence', 'ERROR'):
+            buffer.flush_on_shutdown()
+
+        self.assertEqual(buffer.metrics()['pending'], 0)
+        with open(path, encoding='utf-8') as file:
+            self.assertEqual([load_message(line).id for line in file], [message.id for message in messages])
+
+    def test_signal_flushes_before_the_previous_handler(self):
+        calls = []
+        previous = signal.signal(signal.SIGTERM, lambda signum, frame: calls.append('previous'))
+        self.addCleanup(signal.signal, signal.SIGTERM, previous)
+        self.addCleanup(signal.signal, signal.SIGINT, signal.getsignal(signal.SIGINT))
+        with mock.patch('apps.chat.persistence.chat_message_buffer') as buffer:
+            buffer.flush_on_shutdown.side_effect = lambda: calls.append('flush')
+            install_signal_handlers()
+            signal.raise_signal(signal.SIGTERM)
+
+        self.assertEqual(calls, ['flush', 'previous'])
+
+
+class ConversationPairTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='user@example.com', username='user', password='pbkdf2_sha256$x')
+        cls.other = User.objects.create(email='other@example.com', username='other', password='pbkdf2_sha256$x')
+
+    def test_start_that_loses_the_race_gets_the_winner(self):
+        get = Conversation.objects.get
+        created = []
+
+        def racing_get(**kwargs):
+            if not created:
+                # Another request creates the pair between the lookup and the insert
+                created.append(Conversation.objects.create(pair_key=kwargs['pair_key']))
+                raise Conversation.DoesNotExist
+            return get(**kwargs)
+
+        with mock.patch.object(Conversation.objects, 'get', racing_get):
+            conversation, was_created = Conversation.get_or_create_pair(self.user, self.other)
+
+        self.assertFalse(was_created)
+        self.assertEqual(conversation, created[0])
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(Conversation.get_or_create_pair(self.other, self.user), (conversation, False))
+
+    def test_migration_merges_duplicate_pairs(self):
+        now = timezone.now()
+        older, newer = Conversation.objects.bulk_create([Conversation(), Conversation()])
+        Conversation.objects.filter(pk=older.pk).update(modified_at=now - datetime.timedelta(days=1))
+        for conversation in (older, newer):
+            conversation.users.add(self.user, self.other)
+        Conversation.objects.filter(pk=newer.pk).update(pair_key=Conversation.make_pair_key(self.user.id, self.other.id))
+        for conversation, unread in ((older, 2), (newer, 1)):
+            ConversationReadState.objects.create(conversation=conversation, user=self.other, unread_count=unread)
+        write_messages([
+            ConversationMessage(id=uuid.uuid4(), conversation_id=conversation.id, body=body, sent_to=self.other,
+                                created_by=self.user, created_at=now + datetime.timedelta(seconds=offset))
+            for conversation, body, offset in ((older, 'old', 0), (newer, 'new', 1), (older, 'newest', 2))
+        ])
+        migration = importlib.import_module('apps.chat.migrations.0006_merge_duplicate_pair_conversations')
+
+        migration.merge_duplicate_pairs(django_apps, None)
+
+        self.assertEqual(list(Conversation.objects.all()), [newer])
+        newer.refresh_from_db()
+        self.assertEqual(list(newer.messages.order_by('created_at').values_list('body', flat=True)), ['old', 'new', 'newest'])
+        self.assertEqual((newer.last_message_preview, newer.last_message_by), ('newest', self.user))
+        self.assertEqual(ConversationReadState.objects.get(conversation=newer, user=self.other).unread_count, 6)
+
+
+class ConversationMessagesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='user@example.com', username='user', password='pbkdf2_sha256$x')
+        cls.other = User.objects.create(email='other@example.com', username='other', password='pbkdf2_sha256$x')
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.users.add(cls.user, cls.other)
+
+    def send(self, count):
+        now = timezone.now()
+        start = ConversationMessage.objects.count()
+        write_messages([
+            ConversationMessage(id=uuid.uuid4(), conversation_id=self.conversation.id, body=f'message {index}',
+                                sent_to=self.other if index % 2 else self.user,
+                                created_by=self.user if index % 2 else self.other,
+                                created_at=now + datetime.timedelta(microseconds=index))
+            for index in range(start, start + count)
+        ])
+
+    def get(self, **params):
+        response = self.client.get(f'/api/chat/{self.conversation.id}/messages/', params,
+                                   HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_go_back_through_the_history(self):
+        self.send(5)
+        pages, cursor = [], ''
+        while True:
+            body = self.get(page_size=2, **({'cursor': cursor} if cursor else {}))
+            pages.append([message['body'] for message in body['messages']])
+            self.assertEqual(sorted(user['id'] for user in body['users']), sorted([str(self.user.id), str(self.other.id)]))
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        # Newest page first, each page oldest first
+        self.assertEqual(pages, [['message 3', 'message 4'], ['message 1', 'message 2'], ['message 0']])
+
+    def test_each_user_is_serialized_once_per_page(self):
+        self.send(2)
+        with CaptureQueriesContext(connection) as queries:
+            self.get(page_size=2)
+        self.send(48)
+        with self.assertNumQueries(len(queries)):
+            body = self.get(page_size=50)
+        self.assertEqual(len(body['messages']), 50)
+        self.assertEqual(len(body['users']), 2)
+        self.assertEqual(set(body['messages'][0]), {'id', 'body', 'sent_to_id', 'created_by_id', 'created_at'})
+
+    def test_former_participant_is_included(self):
+        self.send(2)
+        self.conversation.users.remove(self.other)
+        self.conversation.users.add(User.objects.create(email='new@example.com', username='new', password='pbkdf2_sha256$x'))
+        body = self.get()
+        self.assertIn(str(self.other.id), {user['id'] for user in body['users']})
+        self.assertEqual(len(body['users']), 3)
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({'page_size': 'many'}, {'cursor': 'not a cursor'}):
+            with self.subTest(params=params):
+                response = self.client.get(f'/api/chat/{self.conversation.id}/messages/', params,
+                                           HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+                self.assertEqual(response.status_code, 400)
+
+
+class InboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='user@example.com', username='user', password='pbkdf2_sha256$x')
+        cls.friends = [
+            User.objects.create(email=f'friend{number}@example.com', username=f'friend{number}', password='pbkdf2_sha256$x')
+            for number in range(3)
+        ]
+        cls.conversations = [Conversation.get_or_create_pair(cls.user, friend)[0] for friend in cls.friends]
+
+    def send(self, conversation, sender, receiver, count):
+        now = timezone.now()
+        write_messages([
+            ConversationMessage(id=uuid.uuid4(), conversation_id=conversation.id, body=f'message {index}',
+                                sent_to=receiver, created_by=sender, created_at=now + datetime.timedelta(microseconds=index))
+            for index in range(count)
+        ])
+
+    def auth(self):
+        return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def inbox(self, **params):
+        response = self.client.get('/api/chat/inbox/', params, **self.auth())
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def unread(self, body):
+        return {conversation['id']: conversation['unread_count'] for conversation in body['conversations']}
+
+    def test_unread_counts(self):
+        first, second, third = self.conversations
+        self.send(first, self.friends[0], self.user, 2)
+        self.send(second, self.friends[1], self.user, 3)
+        # The user's own messages are unread only for the friend
+        self.send(third, self.user, self.friends[2], 4)
+
+        body = self.inbox()
+        self.assertEqual(self.unread(body), {str(first.id): 2, str(second.id): 3, str(third.id): 0})
+        self.assertEqual(body['total_unread'], 5)
+        self.assertEqual([conversation['id'] for conversation in body['conversations']],
+                         [str(third.id), str(second.id), str(first.id)])
+
+    def test_unread_counts_are_per_page(self):
+        for number, conversation in enumerate(self.conversations):
+            self.send(conversation, self.friends[number], self.user, number + 1)
+        body = self.inbox(page_size=2)
+        self.assertEqual(list(self.unread(body).values()), [3, 2])
+        self.assertEqual(body['total_unread'], 6)
+        body = self.inbox(page_size=2, cursor=body['next_cursor'])
+        self.assertEqual(list(self.unread(body).values()), [1])
+        self.assertIsNone(body['next_cursor'])
+
+    def test_queries_do_not_grow_with_the_inbox(self):
+        self.send(self.conversations[0], self.friends[0], self.user, 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.inbox()
+        for number, conversation in enumerate(self.conversations):
+            self.send(conversation, self.friends[number], self.user, 2)
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(self.inbox()['total_unread'], 7)
+
+    def test_mark_read_resets_the_counter(self):
+        first, second, _ = self.conversations
+        self.send(first, self.friends[0], self.user, 2)
+        self.send(second, self.friends[1], self.user, 3)
+
+        response = self.client.post(f'/api/chat/{second.id}/read/', **self.auth())
+        self.assertEqual(response.json(), {'success': True})
+        body = self.inbox()
+        self.assertEqual(self.unread(body)[str(second.id)], 0)
+        self.assertEqual(body['total_unread'], 2)
+        self.assertIsNotNone(ConversationReadState.objects.get(conversation=second, user=self.user).last_read_at)
+
+        # New messages count again from zero
+        self.send(second, self.friends[1], self.user, 1)
+        self.assertEqual(self.inbox()['total_unread'], 3)
+
+    def test_mark_read_without_a_marker(self):
+        conversation = self.conversations[0]
+        ConversationReadState.objects.filter(conversation=conversation, user=self.user).delete()
+        ConversationReadState.mark_read(conversation.id, self.user.id)
+        self.assertEqual(ConversationReadState.objects.get(conversation=conversation, user=self.user).unread_count, 0)
+
+    def test_mark_read_needs_a_participant(self):
+        stranger, _ = Conversation.get_or_create_pair(self.friends[0], self.friends[1])
+        response = self.client.post(f'/api/chat/{stranger.id}/read/', **self.auth())
+        self.assertEqual(response.status_code, 404)
+
+
+class ConcurrentConversationPairTests(TransactionTestCase):
+    # One connection per thread, see ConcurrentPlaceOrderTests
+    STARTS = 20
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('needs a test database that allows concurrent connections')
+        self.user = User.objects.create(email='user@example.com', username='user', password='pbkdf2_sha256$x')
+        self.other = User.objects.create(email='other@example.com', username='other', password='pbkdf2_sha256$x')
+
+    def test_simultaneous_starts_create_one_conversation(self):
+        results = collections.Counter()
+        barrier = threading.Barrier(self.STARTS)
+
+        def start(number):
+            try:
+                barrier.wait()
+                users = (self.user, self.other) if number % 2 else (self.other, self.user)
+                conversation, created = Conversation.get_or_create_pair(*users)
+                results['created' if created else 'found'] += 1
+                results[conversation.id] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=start, args=(number,)) for number in range(self.STARTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(results, {'created': 1, 'found': self.STARTS - 1, conversation.id: self.STARTS})
+        self.assertEqual(set(conversation.users.all()), {self.user, self.other})
+
+
+class BrokerChannelLayerTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.url = f'unix://{os.path.join(directory.name, "broker.sock")}'
+        ready = asyncio.Event()
+        self.broker = asyncio.create_task(ChatBroker().serve(self.url, ready.set))
+        await ready.wait()
+        self.layer = BrokerChannelLayer(url=self.url, capacity=5)
+
+    async def asyncTearDown(self):
+        await self.layer.close()
+        # Let the broker see its connections close before stopping it
+        await asyncio.sleep(0.05)
+        self.broker.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await self.broker
+
+    async def test_capacity_is_per_channel(self):
+        channels = [await self.layer.new_channel() for _ in range(10)]
+        for channel in channels:
+            await self.layer.group_add('room', channel)
+        await self.layer.group_send('room', {'type': 'chat.message'})
+        await self.layer.send(channels[0], {'type': 'chat.message'})
+
+        for _ in range(3):
+            await self.layer.send(channels[0], {'type': 'chat.message'})
+        with self.assertRaises(ChannelFull):
+            await self.layer.send(channels[0], {'type': 'chat.message'})
+        await self.layer.group_send('room', {'type': 'chat.message'})
+        self.assertEqual(self.layer.dropped, 1)
+
+        received = [await self.layer.receive(channel) for channel in channels for _ in range(2)]
+        self.assertEqual(len(received), 20)
+
+    async def test_receiving_frees_capacity(self):
+        channel = await self.layer.new_channel()
+        for _ in range(5):
+            await self.layer.send(channel, {'type': 'chat.message'})
+        for _ in range(5):
+            await self.layer.receive(channel)
+        # Counts are released with the receive loop's next broker round trip
+        await asyncio.sleep(0.1)
+
+        for _ in range(5):
+            await self.layer.send(channel, {'type': 'chat.message'})
+        self.assertEqual(self.layer.dropped, 0)
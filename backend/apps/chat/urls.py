@@ -4,6 +4,9 @@ from . import api
 
 urlpatterns = [
     path('', api.conversations_list, name='api_conversations_list'),
+    path('inbox/', api.conversations_inbox, name='api_conversations_inbox'),
     path('start/<uuid:user_id>/', api.conversations_start, name='api_conversations_start'),
     path('<uuid:pk>/', api.conversations_detail, name='api_conversations_detail'),
+    path('<uuid:pk>/messages/', api.conversations_messages, name='api_conversations_messages'),
+    path('<uuid:pk>/read/', api.conversations_read, name='api_conversations_read'),
 ]
\ No newline at end of file
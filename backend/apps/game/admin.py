@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, OperatingSystem, Game, CategoryDetail, OperatingSystemDetail, Promotion, PromotionDetail, Image, Order, Rating
+from .models import Category, OperatingSystem, Game, CategoryDetail, OperatingSystemDetail, Promotion, PromotionDetail, Image, Order, Rating, GameDiscount, GameSalesDaily, PublisherSalesDaily
 
 # Register your models here.
 admin.site.register(Category)
@@ -11,4 +11,7 @@ admin.site.register(Promotion)
 admin.site.register(PromotionDetail)
 admin.site.register(Image)
 admin.site.register(Order)
-admin.site.register(Rating)
\ No newline at end of file
+admin.site.register(Rating)
+admin.site.register(GameDiscount)
+admin.site.register(GameSalesDaily)
+admin.site.register(PublisherSalesDaily)
\ No newline at end of file
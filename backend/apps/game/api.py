@@ -1,34 +1,79 @@
+import uuid
 from django.utils import timezone
 from django.http import Http404, JsonResponse
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated
+from backend_project.exports import export_response
+from backend_project.permissions import IsAdminRole
+from backend_project.pagination import admin_page, keyset_page, parse_page_size, wants_page
 from .models import *
 from .serializers import *
 from .form import GameForm
+from .search import parse_search_params, search_games, search_facets
+from .pricing import get_effective_prices, parse_game_ids
+from .batch import MAX_BATCH_IDS, load_game_batch, parse_includes
+from .projections import parse_fields, project_games
+from .fast_render import fast_json_response, fast_render_enabled, render_games
+from .filters import filter_manage_games, filter_orders
+from .response_cache import cached_response
+from .orders import parse_idempotency_key, place_order
+from .sales import game_sales_report, parse_sales_range, publisher_sales_report
+from .text_index import game_text_index, parse_limit
 
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
+@cached_response('game', 'user', expires=GameDiscount.objects.next_change)
 def game_list(request):
-    games = Game.objects.all()
+    try:
+        fields = parse_fields(request.GET, GameDetailSerializer)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    games = Game.objects.filter(approval='APPROVED')
     publisher_id = request.GET.get('publisher_id', '')
     if publisher_id:
         games = games.filter(publisher_id=publisher_id)
-    games = games.filter(approval='APPROVED')
-    serializer = GameDetailSerializer(games, many=True)
+    if fast_render_enabled():
+        return fast_json_response({'data': render_games(games, fields)})
+    serializer = GameDetailSerializer(project_games(games, fields), many=True, fields=fields)
     return JsonResponse({'data': serializer.data})
 
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
 def game_list_manage(request):
-    games = Game.objects.all()
-    publisher_id = request.GET.get('publisher_id', '')
-    if publisher_id:
-        games = games.filter(publisher_id=publisher_id)
-    serializer = GameDetailSerializer(games, many=True)
+    try:
+        fields = parse_fields(request.GET, GameDetailSerializer)
+        games = filter_manage_games(request, Game.objects.all())
+        page = None
+        if wants_page(request.GET):
+            page, meta = admin_page(project_games(games, fields, extra_columns=['title']), request.GET, 'title', False)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if page is not None:
+        serializer = GameDetailSerializer(page, many=True, fields=fields)
+        return JsonResponse({'data': serializer.data, **meta})
+    if fast_render_enabled():
+        return fast_json_response({'data': render_games(games, fields)})
+    serializer = GameDetailSerializer(project_games(games, fields), many=True, fields=fields)
     return JsonResponse({'data': serializer.data})
 
+@api_view(['GET'])
+@permission_classes([IsAdminRole])
+def game_export(request):
+    try:
+        games = filter_manage_games(request, Game.objects.all())
+        return export_response(request, games, [
+            ('id', 'id'), ('title', 'title'), ('price', 'price'), ('publish_year', 'publish_year'),
+            ('publisher_id', 'publisher_id'), ('publisher_username', 'publisher__username'),
+            ('avg_rating', 'avg_rating'), ('rating_count', 'rating_count'),
+            ('approval', 'approval'), ('approval_description', 'approval_description'),
+        ], 'games')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
 @api_view(['POST'])
 @authentication_classes([])
 @permission_classes([])
@@ -114,7 +159,7 @@ def update_game(request, game_id):
 @permission_classes([])
 def user_game_list(request, userId):
     try:
-        orders = Order.objects.filter(user=userId)
+        orders = Order.objects.select_related('user', 'game').filter(user=userId)
         serializer = OrderListSerializer(orders, many=True)
         return JsonResponse({'data': serializer.data})
     except Exception as e:
@@ -125,9 +170,15 @@ def user_game_list(request, userId):
 @authentication_classes([])
 @permission_classes([])
 def publisher_game_list(request, userId):
+    try:
+        fields = parse_fields(request.GET, GameListSerializer)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     try:
         games = Game.objects.filter(publisher=userId)
-        serializer = GameListSerializer(games, many=True)
+        if fast_render_enabled():
+            return fast_json_response({'data': render_games(games, fields)})
+        serializer = GameListSerializer(project_games(games, fields), many=True, fields=fields)
         return JsonResponse({'data': serializer.data})
     except Exception as e:
         print("Error fetching user orders:", e)
@@ -136,20 +187,72 @@ def publisher_game_list(request, userId):
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
+def publisher_sales(request, userId):
+    try:
+        start, end = parse_sales_range(request)
+        if not User.objects.filter(pk=userId).exists():
+            return JsonResponse({'error': 'Publisher not found'}, status=404)
+        return JsonResponse({'data': publisher_sales_report(userId, start, end)})
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([])
+def game_sales(request, game_id):
+    try:
+        start, end = parse_sales_range(request)
+        if not Game.objects.filter(pk=game_id).exists():
+            return JsonResponse({'error': 'Game not found'}, status=404)
+        return JsonResponse({'data': game_sales_report(game_id, start, end)})
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([])
+@cached_response('game', 'user', expires=GameDiscount.objects.next_change)
 def game_detail(request, pk):
     try:
-        game = Game.objects.get(pk=pk)
+        fields = parse_fields(request.GET, GameDetailSerializer)
+        game = project_games(Game.objects.all(), fields).get(pk=pk)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Game.DoesNotExist:
         return JsonResponse({'error': 'Game not found'}, status=404)
-    serializer = GameDetailSerializer(game)
+    serializer = GameDetailSerializer(game, fields=fields)
     return JsonResponse({'data': serializer.data})
 
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([])
+@cached_response('game', 'user', 'image', 'category', 'operating_system', 'promotion',
+                 expires=GameDiscount.objects.next_change)
+def game_batch(request):
+    try:
+        game_ids = parse_game_ids(request.GET.get('ids', ''), MAX_BATCH_IDS)
+        includes = parse_includes(request.GET.get('include', ''))
+        fields = parse_fields(request.GET, GameDetailSerializer)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    try:
+        data = load_game_batch(game_ids, includes, fields)
+        found = {item['id'] for item in data}
+        missing = [str(game_id) for game_id in game_ids if str(game_id) not in found]
+        return JsonResponse({'data': data, 'missing': missing})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
 def game_search_detail(request, pk):
     try:
-        game = Game.objects.get(pk=pk)
+        game = Game.objects.for_catalog().get(pk=pk)
     except Game.DoesNotExist:
         return JsonResponse({'error': 'Game not found'}, status=404)
     serializer = GameDetailSerializer(game)
@@ -158,6 +261,7 @@ def game_search_detail(request, pk):
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
+@cached_response('category')
 def category_list(request):
     categories = Category.objects.all()
     serializer = CategorySerializer(categories, many=True)
@@ -240,6 +344,7 @@ def delete_category(request, category_id):
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
+@cached_response('operating_system')
 def operatingSystem_list(request):
     categories = OperatingSystem.objects.all()
     serializer = OperatingSystemSerializer(categories, many=True)
@@ -327,10 +432,12 @@ def image_list(request, gameId):
 @permission_classes([])
 def game_promotion_detail(request, game_id):
     try:
-        game = Game.objects.get(id=game_id)
-        promotion_detail = PromotionDetail.objects.get(game=game)
-        if not promotion_detail:
+        # The running promotion with the biggest discount, if any
+        game = Game.objects.with_best_discount().get(id=game_id)
+        if game.best_promotion_id is None:
             return JsonResponse({'data': None}, status=200)
+        promotion_detail = PromotionDetail.objects.select_related('promotion', 'game__publisher').get(
+            game=game, promotion_id=game.best_promotion_id)
         serializer = PromotionDetailSerializer(promotion_detail)
         return JsonResponse({'data': serializer.data}, status=200)
     except Game.DoesNotExist:
@@ -343,11 +450,10 @@ def game_promotion_detail(request, game_id):
 @permission_classes([])
 def game_promotion(request, game_id):
     try:
-        game = Game.objects.get(id=game_id)
-        promotion_detail = PromotionDetail.objects.get(game=game)
-        promotion = Promotion.objects.get(id=promotion_detail.promotion.id)
-        if not promotion:
+        game = Game.objects.with_best_discount().get(id=game_id)
+        if game.best_promotion_id is None:
             return JsonResponse({'data': None}, status=200)
+        promotion = Promotion.objects.get(id=game.best_promotion_id)
         serializer = PromotionSerializer(promotion)
         return JsonResponse({'data': serializer.data}, status=200)
     except Game.DoesNotExist:
@@ -355,10 +461,24 @@ def game_promotion(request, game_id):
     except Exception as e:
         return JsonResponse({'data': None})
     
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([])
+def game_prices(request):
+    try:
+        game_ids = parse_game_ids(request.GET.get('ids', ''))
+        prices = get_effective_prices(game_ids)
+        return JsonResponse({'data': [prices[game_id] for game_id in game_ids if game_id in prices]})
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    
 # Promotion Endpoints
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
+@cached_response('promotion')
 def promotion_list(request):
     try:
         promotions = Promotion.objects.all()
@@ -373,7 +493,9 @@ def promotion_list(request):
 def promotion_details(request, promotion_id):
     try:
         promotion = Promotion.objects.get(id=promotion_id)
-        details = PromotionDetail.objects.filter(promotion=promotion)
+        details = PromotionDetail.objects.filter(promotion=promotion).select_related('promotion').prefetch_related(
+            Prefetch('game', queryset=Game.objects.for_catalog())
+        )
         serializer = PromotionDetailSerializer(details, many=True)
         return JsonResponse({'data': serializer.data})
     except Promotion.DoesNotExist:
@@ -522,44 +644,45 @@ def add_operating_systems_to_game(request, game_id, operating_system_id):
 @api_view(['POST'])
 def order_game(request, game_id):
     try:
-        total_price = request.POST.get('total_price')
-        if not total_price:
-            return JsonResponse({'error': 'total_price is required'}, status=400)
-        total_price = float(total_price)
-        game = Game.objects.get(id=game_id)
-        try:
-            order = Order.objects.get(user=request.user, game=game)
-            if order.status == 'PAID':
-                return JsonResponse({'error': 'You have already bought this game'}, status=400)
-            elif order.status == 'PROCESSING':
-                return JsonResponse({'error': 'You have already bought this game and it is processing for a refund'}, status=400)
-            else:
-                order.status = 'PAID'
-                order.save()
-                serializer = OrderSerializer(order)
-                return JsonResponse({'success': True, 'order': serializer.data})
-        except Order.DoesNotExist:
-            order = Order(
-                user=request.user,
-                game=game,
-                total_price=total_price,
-                status='PAID'
-            )
-            order.save()
-            serializer = OrderSerializer(order)
-            return JsonResponse({'success': True, 'order': serializer.data})
+        # Charge the server-side price; a client total_price is ignored
+        order, created = place_order(request.user, game_id, parse_idempotency_key(request))
+        serializer = OrderSerializer(order)
+        return JsonResponse({'success': True, 'order': serializer.data, 'replayed': not created})
+    except Game.DoesNotExist:
+        return JsonResponse({'error': 'Game not found'}, status=404)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         print('Error', e)
         return JsonResponse({'success': False})
     
+@api_view(['GET'])
+@permission_classes([IsAdminRole])
+def order_export(request):
+    try:
+        orders = filter_orders(request, Order.objects.all())
+        return export_response(request, orders, [
+            ('id', 'id'), ('user_id', 'user_id'), ('user_email', 'user__email'), ('username', 'user__username'),
+            ('game_id', 'game_id'), ('game_title', 'game__title'), ('buy_at', 'buy_at'),
+            ('total_price', 'total_price'), ('status', 'status'), ('refund_description', 'refund_description'),
+        ], 'orders')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
 def order_list(request):
     try:
-        orders = Order.objects.all()
+        orders = filter_orders(request, Order.objects.select_related('user', 'game'))
+        if wants_page(request.GET):
+            page, meta = admin_page(orders, request.GET, 'buy_at', True)
+            serializer = OrderListSerializer(page, many=True)
+            return JsonResponse({'data': serializer.data, **meta})
         serializer = OrderListSerializer(orders, many=True)
         return JsonResponse({'data': serializer.data})
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -568,11 +691,12 @@ def order_list(request):
 @permission_classes([])
 def update_order(request, order_id):
     try:
-        order = Order.objects.get(id=order_id)
-        order.total_price = float(request.POST.get('total_price', order.total_price))
-        order.status = request.POST.get('status', order.status)
-        order.refund_description = request.POST.get('refund_description', order.refund_description)
-        order.save()
+        with transaction.atomic():
+            order = Order.objects.select_for_update().get(id=order_id)
+            order.total_price = float(request.POST.get('total_price', order.total_price))
+            order.status = request.POST.get('status', order.status)
+            order.refund_description = request.POST.get('refund_description', order.refund_description)
+            order.save()
         serializer = OrderListSerializer(order)
         return JsonResponse({'success': True, 'data': serializer.data}, status=200)
     except Order.DoesNotExist:
@@ -587,8 +711,9 @@ def update_order(request, order_id):
 @permission_classes([])
 def delete_order(request, order_id):
     try:
-        order = Order.objects.get(id=order_id)
-        order.delete()
+        with transaction.atomic():
+            order = Order.objects.select_for_update().get(id=order_id)
+            order.delete()
         return JsonResponse({'success': True})
     except Order.DoesNotExist:
         return JsonResponse({'error': 'Order not found'}, status=404)
@@ -599,33 +724,34 @@ def delete_order(request, order_id):
 def toggle_favorite(request, gameId):
     try:
         game = Game.objects.get(id=gameId)
-        try:
-            order = Order.objects.get(user=request.user, game=game)
-            if order.status != 'WL':
-                return JsonResponse(
-                    {'non_field_errors': ['You have already bought this game']},
-                    status=400
+        with transaction.atomic():
+            try:
+                order = Order.objects.select_for_update().get(user=request.user, game=game)
+                if order.status != 'WL':
+                    return JsonResponse(
+                        {'non_field_errors': ['You have already bought this game']},
+                        status=400
+                    )
+                else:
+                    order.delete()
+                    return JsonResponse({
+                        'success': True,
+                        'is_favorited': False
+                    }, status=200)
+            except Order.DoesNotExist:
+                order = Order(
+                    user=request.user,
+                    game=game,
+                    total_price=0,
+                    status='WL'
                 )
-            else:
-                order.delete()
+                order.save()
+                serializer = OrderSerializer(order)
                 return JsonResponse({
                     'success': True,
-                    'is_favorited': False
-                }, status=200)
-        except Order.DoesNotExist:
-            order = Order(
-                user=request.user,
-                game=game,
-                total_price=0,
-                status='WL'
-            )
-            order.save()
-            serializer = OrderSerializer(order)
-            return JsonResponse({
-                'success': True,
-                'is_favorited': True,
-                'order': serializer.data
-            }, status=201)
+                    'is_favorited': True,
+                    'order': serializer.data
+                }, status=201)
     except Game.DoesNotExist:
         return JsonResponse(
             {'non_field_errors': ['Game not found']},
@@ -642,12 +768,18 @@ def toggle_favorite(request, gameId):
 @permission_classes([])
 def game_ratings(request, game_id):
     try:
-        game = Game.objects.get(id=game_id)
-        ratings = Rating.objects.filter(game=game)
+        if not Game.objects.filter(id=game_id).exists():
+            return JsonResponse({'error': 'Game not found'}, status=404)
+        ratings = Rating.objects.filter(game_id=game_id).select_related('user').only(
+            'id', 'rating', 'comment', 'created_at', 'updated_at', 'game_id',
+            'user__id', 'user__username', 'user__avatar',
+        )
+        page_size = parse_page_size(request.GET, 20, 100)
+        ratings, next_cursor = keyset_page(ratings, 'updated_at', True, request.GET.get('cursor', ''), page_size)
         serializer = RatingSerializer(ratings, many=True)
-        return JsonResponse({'data': serializer.data})
-    except Game.DoesNotExist:
-        return JsonResponse({'error': 'Game not found'}, status=404)
+        return JsonResponse({'data': serializer.data, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -676,20 +808,18 @@ def rate_game(request, game_id):
         except (ValueError, TypeError):
             return JsonResponse({'error': 'Rating must be an integer'}, status=400)
 
-        # Check if the user has already rated the game
-        try:
-            existing_rating = Rating.objects.get(user=user, game=game)
-            existing_rating.delete()  # Delete the old rating
-        except Rating.DoesNotExist:
-            pass  # No existing rating, proceed to create a new one
-
-        # Create new rating
-        rating = Rating.objects.create(
-            user=user,
-            game=game,
-            rating=rating_value,
-            comment=comment if comment else None
-        )
+        # Update the user's rating in place; the rating signals adjust the
+        # game's counters in the same transaction
+        with transaction.atomic():
+            rating, created = Rating.objects.select_for_update().get_or_create(
+                user=user,
+                game=game,
+                defaults={'rating': rating_value, 'comment': comment if comment else None}
+            )
+            if not created:
+                rating.rating = rating_value
+                rating.comment = comment if comment else None
+                rating.save()
         serializer = RatingSerializer(rating)
         return JsonResponse({'success': True, 'data': serializer.data})
     except Game.DoesNotExist:
@@ -701,7 +831,7 @@ def rate_game(request, game_id):
 @authentication_classes([])
 @permission_classes([])
 def game_list_search(request):
-    games = Game.objects.all()
+    games = Game.objects.for_catalog().prefetch_related('category_details', 'operatingsystem_details')
     publisher_id = request.GET.get('publisher_id', '')
     if publisher_id:
         games = games.filter(publisher_id=publisher_id)
@@ -709,6 +839,62 @@ def game_list_search(request):
     serializer = GameSearchSerializer(games, many=True)
     return JsonResponse({'data': serializer.data})
 
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([])
+def game_search(request):
+    try:
+        params = parse_search_params(request.GET)
+        games, next_cursor = search_games(params)
+        serializer = GameSearchSerializer(games, many=True, fields=params['fields'])
+        return JsonResponse({
+            'data': serializer.data,
+            'next_cursor': next_cursor,
+            'facets': search_facets(params),
+        })
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([])
+def game_text_search(request):
+    try:
+        limit = parse_limit(request.GET, 20, 100)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    try:
+        query = request.GET.get('q', '')
+        prefix = request.GET.get('prefix', '') == '1'
+        results = game_text_index.search(query, limit=limit, prefix=prefix)
+        games = Game.objects.in_bulk([game_id for game_id, _ in results])
+        data = []
+        for game_id, score in results:
+            game = games.get(uuid.UUID(game_id))
+            if game is None:
+                continue
+            item = GameSerializer(game).data
+            item['score'] = round(score, 4)
+            data.append(item)
+        return JsonResponse({'data': data})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([])
+def game_suggest(request):
+    try:
+        limit = parse_limit(request.GET, 10, 50)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    try:
+        return JsonResponse({'data': game_text_index.suggest(request.GET.get('q', ''), limit=limit)})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
@@ -748,16 +934,14 @@ def game_operating_systems_mapping(request):
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
+@cached_response('promotion', 'game', 'user', timeout=60, expires=GameDiscount.objects.next_change)
 def get_active_promotions(request):
     try:
-        # Fetch all promotion details
-        all_promotions = PromotionDetail.objects.select_related('game', 'promotion', 'game__publisher')
-
-        # Filter active promotions in Python
-        active_promotions = [
-            detail for detail in all_promotions
-            if detail.promotion.end_day > timezone.now()
-        ]
+        # Only running promotions, filtered on the indexed start/end days
+        now = timezone.now()
+        active_promotions = PromotionDetail.objects.filter(
+            promotion__start_day__lte=now, promotion__end_day__gt=now
+        ).select_related('game', 'promotion', 'game__publisher').order_by('promotion__end_day', 'id')
 
         # Serialize the data manually
         promotions_data = []
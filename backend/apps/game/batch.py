@@ -0,0 +1,76 @@
+from django.db.models import Prefetch
+
+from .models import Game, CategoryDetail, OperatingSystemDetail, PromotionDetail
+from .projections import FIELD_COLUMNS, project_games
+from .serializers import (
+    CategorySerializer, GameDetailSerializer, ImageSerializer,
+    OperatingSystemSerializer, PromotionSerializer,
+)
+
+# Parts a batch request can ask for on top of the game itself
+BATCH_INCLUDES = ('images', 'categories', 'operating_systems', 'promotion', 'ratings')
+MAX_BATCH_IDS = 50
+
+
+def parse_includes(value):
+    includes = {v.strip() for v in value.split(',') if v.strip()}
+    unknown = includes.difference(BATCH_INCLUDES)
+    if unknown:
+        raise ValueError(f'Invalid include: {", ".join(sorted(unknown))}')
+    return includes
+
+
+def load_game_batch(game_ids, includes, fields=None):
+    # One query for the games plus at most one per include, whatever the
+    # number of ids; returns the games in the order they were asked for
+    if fields is not None and 'id' not in fields:
+        fields = ['id', *fields]
+    extra_columns = []
+    if 'ratings' in includes:
+        extra_columns = ['avg_rating', 'rating_count', *FIELD_COLUMNS['rating_histogram']]
+    games = project_games(Game.objects.with_best_discount(), fields, extra_columns).filter(id__in=game_ids)
+    if 'images' in includes:
+        games = games.prefetch_related('images')
+    if 'categories' in includes:
+        games = games.prefetch_related(
+            Prefetch('category_details', queryset=CategoryDetail.objects.select_related('category')))
+    if 'operating_systems' in includes:
+        games = games.prefetch_related(
+            Prefetch('operatingsystem_details', queryset=OperatingSystemDetail.objects.select_related('operating_system')))
+    games = {game.id: game for game in games}
+
+    promotions = {}
+    if 'promotion' in includes:
+        best = {game.id: game.best_promotion_id for game in games.values() if game.best_promotion_id}
+        details = PromotionDetail.objects.filter(
+            game_id__in=list(best), promotion_id__in=set(best.values())
+        ).select_related('promotion')
+        promotions = {detail.game_id: detail for detail in details if best[detail.game_id] == detail.promotion_id}
+
+    return [serialize_batch_game(games[game_id], includes, promotions, fields) for game_id in game_ids if game_id in games]
+
+
+def serialize_batch_game(game, includes, promotions, fields):
+    data = GameDetailSerializer(game, fields=fields).data
+    if 'images' in includes:
+        data['images'] = ImageSerializer(game.images.all(), many=True).data
+    if 'categories' in includes:
+        data['categories'] = CategorySerializer(
+            [detail.category for detail in game.category_details.all()], many=True).data
+    if 'operating_systems' in includes:
+        data['operating_systems'] = OperatingSystemSerializer(
+            [detail.operating_system for detail in game.operatingsystem_details.all()], many=True).data
+    if 'promotion' in includes:
+        detail = promotions.get(game.id)
+        data['promotion'] = {
+            'id': str(detail.id),
+            'discount': detail.discount,
+            'promotion': PromotionSerializer(detail.promotion).data,
+        } if detail else None
+    if 'ratings' in includes:
+        data['ratings'] = {
+            'avg_rating': game.avg_rating,
+            'rating_count': game.rating_count,
+            'rating_histogram': game.rating_histogram(),
+        }
+    return data
@@ -0,0 +1,61 @@
+import logging
+import threading
+import time
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import GameDiscount
+from .response_cache import get_cache
+
+# Keeps GameDiscount current from inside each server process: a daemon thread
+# refreshes the rows at every promotion start and end, and at least every
+# MAX_SLEEP seconds to pick up promotions created meanwhile, so a promotion
+# that starts later reaches the catalog without `refresh_promotions --loop`.
+# Every worker wakes at the boundary; a lock in the shared response cache lets
+# one of them write the rows while the others skip.
+
+logger = logging.getLogger(__name__)
+
+MAX_SLEEP = 60
+LOCK_KEY = 'game-discount-refresh'
+LOCK_TIMEOUT = 60
+
+
+class DiscountRefresher:
+    def __init__(self, max_sleep=MAX_SLEEP):
+        self.max_sleep = max_sleep
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def refresh(self, now=None):
+        # Returns the seconds to wait before the next call
+        now = now or timezone.now()
+        cache = get_cache()
+        if cache.add(LOCK_KEY, now.isoformat(), LOCK_TIMEOUT):
+            try:
+                GameDiscount.objects.refresh(now=now)
+            finally:
+                cache.delete(LOCK_KEY)
+        boundary = GameDiscount.objects.next_change(now)
+        if boundary is None:
+            return self.max_sleep
+        return min(self.max_sleep, max(0.0, (boundary - timezone.now()).total_seconds()))
+
+    def _run(self):
+        while True:
+            try:
+                delay = self.refresh()
+            except Exception:
+                logger.exception('Could not refresh the game discounts')
+                delay = self.max_sleep
+            finally:
+                connection.close()
+            time.sleep(delay)
+
+
+discount_refresher = DiscountRefresher()
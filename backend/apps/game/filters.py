@@ -0,0 +1,37 @@
+import uuid
+
+from django.utils.dateparse import parse_datetime
+
+from backend_project.filters import filter_param
+
+
+def filter_orders(request, orders):
+    status = filter_param(request, 'status')
+    if status:
+        orders = orders.filter(status=status)
+    user_id = filter_param(request, 'user_id', uuid.UUID)
+    if user_id:
+        orders = orders.filter(user_id=user_id)
+    game_id = filter_param(request, 'game_id', uuid.UUID)
+    if game_id:
+        orders = orders.filter(game_id=game_id)
+    publisher_id = filter_param(request, 'publisher_id', uuid.UUID)
+    if publisher_id:
+        orders = orders.filter(game__publisher_id=publisher_id)
+    since = filter_param(request, 'since', parse_datetime)
+    if since:
+        orders = orders.filter(buy_at__gte=since)
+    until = filter_param(request, 'until', parse_datetime)
+    if until:
+        orders = orders.filter(buy_at__lt=until)
+    return orders
+
+
+def filter_manage_games(request, games):
+    approval = filter_param(request, 'approval')
+    if approval:
+        games = games.filter(approval=approval)
+    publisher_id = filter_param(request, 'publisher_id', uuid.UUID)
+    if publisher_id:
+        games = games.filter(publisher_id=publisher_id)
+    return games
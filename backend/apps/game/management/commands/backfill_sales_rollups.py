@@ -0,0 +1,17 @@
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from apps.game.models import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily game and publisher sales rollups from the orders table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--game', type=uuid.UUID, action='append', dest='game_ids',
+                            help='Only rebuild this game (and its publisher); can be repeated')
+
+    def handle(self, *args, **options):
+        game_rows, publisher_rows = rebuild_sales_rollups(options['game_ids'])
+        self.stdout.write(f'{game_rows} game days and {publisher_rows} publisher days written')
@@ -0,0 +1,78 @@
+import datetime
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+from apps.game.fast_render import fast_json_response, render_games
+from apps.game.models import Game, GameDiscount, Promotion
+from apps.game.serializers import GameDetailSerializer
+from apps.useraccount.models import User
+from backend_project.encoding import orjson
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare GameDetailSerializer with the fast renderer on synthetic games (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['games'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, count, repeat):
+        publisher = User.objects.create(
+            email=f'bench-{uuid.uuid4().hex}@example.com', username=f'bench-{uuid.uuid4().hex[:8]}',
+            avatar='uploads/avatars/bench.png', role='PUBLISHER')
+        games = Game.objects.bulk_create([
+            Game(title=f'Benchmark game {uuid.uuid4().hex}', description='Lorem ipsum dolor sit amet ' * 8,
+                 price=9.99 + i % 50, publisher=publisher, image='uploads/games/bench.png',
+                 publish_year=datetime.date(2000 + i % 25, 1, 1), approval='APPROVED', avg_rating=(i % 50) / 10,
+                 rating_count=i % 7, rating_1_count=i % 3, rating_4_count=i % 4)
+            for i in range(count)
+        ], batch_size=1000)
+        promotion = Promotion.objects.create(
+            title=f'Benchmark {uuid.uuid4().hex}', end_day=timezone.now() + timezone.timedelta(days=1))
+        GameDiscount.objects.bulk_create([
+            GameDiscount(game=game, promotion=promotion, discount=20, discounted_price=round(game.price * 0.8, 2),
+                         ends_at=promotion.end_day)
+            for game in games[::10]
+        ])
+        queryset = Game.objects.filter(publisher=publisher)
+        self.stdout.write(f'{count} games, encoder: {"orjson" if orjson else "json"}')
+
+        def serializer_path():
+            serializer = GameDetailSerializer(queryset.for_catalog(), many=True)
+            return JsonResponse({'data': serializer.data}).content
+
+        def fast_path():
+            return fast_json_response({'data': render_games(queryset)}).content
+
+        results = {}
+        for name, render in [('serializer', serializer_path), ('fast', fast_path)]:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                content = render()
+                timings.append(time.perf_counter() - started)
+            results[name] = (min(timings), content)
+            self.stdout.write(
+                f'{name:>10}: best {min(timings) * 1000:8.1f} ms, '
+                f'median {sorted(timings)[len(timings) // 2] * 1000:8.1f} ms, {len(content)} bytes')
+
+        same = json.loads(results['serializer'][1]) == json.loads(results['fast'][1])
+        self.stdout.write(f'speedup x{results["serializer"][0] / results["fast"][0]:.1f}, identical payload: {same}')
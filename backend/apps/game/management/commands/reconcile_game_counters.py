@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.game.models import ORDER_COUNTER_AGGREGATES, ORDER_STATUS_COUNTERS, Game, Order
+from apps.game.response_cache import invalidate_tags
+
+
+class Command(BaseCommand):
+    help = 'Recount the per-game order counters from the orders table and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the games whose counters are wrong')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        names = list(ORDER_STATUS_COUNTERS.values())
+        empty = dict.fromkeys(names, 0)
+        fixed = 0
+        last_id = None
+        while True:
+            with transaction.atomic():
+                # Lock the batch before counting: an order written meanwhile
+                # either is counted here or waits to apply its delta after us
+                games = Game.objects.only('id', 'title', *names).order_by('id')
+                if not options['dry_run']:
+                    games = games.select_for_update()
+                if last_id is not None:
+                    games = games.filter(id__gt=last_id)
+                games = list(games[:options['batch_size']])
+                if not games:
+                    break
+                last_id = games[-1].id
+                # One grouped aggregate per batch instead of a COUNT per game
+                actual = {
+                    row.pop('game_id'): row
+                    for row in Order.objects.filter(game_id__in=[game.id for game in games])
+                    .values('game_id').annotate(**ORDER_COUNTER_AGGREGATES).order_by()
+                }
+                drifted = []
+                for game in games:
+                    expected = actual.get(game.id, empty)
+                    stored = {name: getattr(game, name) for name in names}
+                    if stored == expected:
+                        continue
+                    changes = ', '.join(
+                        f'{name} {stored[name]} -> {expected[name]}' for name in names if stored[name] != expected[name])
+                    self.stdout.write(f'{game.id} {game.title}: {changes}')
+                    for name in names:
+                        setattr(game, name, expected[name])
+                    drifted.append(game)
+                if drifted and not options['dry_run']:
+                    Game.objects.bulk_update(drifted, names)
+                    invalidate_tags('game')
+                fixed += len(drifted)
+        action = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(f'{fixed} games with drifted counters {action}')
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from apps.game.models import GameDiscount
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the per-game discounted prices from the promotions running now; the server '
+            'processes also do it at every promotion start and end')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and refresh again at the next promotion start or end')
+        parser.add_argument('--max-sleep', type=float, default=60,
+                            help='Longest wait in seconds between two refreshes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            now = timezone.now()
+            changed = GameDiscount.objects.refresh(now=now)
+            count = GameDiscount.objects.count()
+            self.stdout.write(f'{now.isoformat()} {count} discounted games{" (changed)" if changed else ""}')
+            if not options['loop']:
+                return
+            time.sleep(self.seconds_to_next_boundary(now, options['max_sleep']))
+            close_old_connections()
+
+    def seconds_to_next_boundary(self, now, max_sleep):
+        boundary = GameDiscount.objects.next_change(now)
+        if boundary is None:
+            return max_sleep
+        return min(max_sleep, max(0.0, (boundary - timezone.now()).total_seconds()))
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.7 on 2026-10-18 02:38
+
+from django.db import migrations, models
+
+
+def backfill_rating_counters(apps, schema_editor):
+    Game = apps.get_model('game', 'Game')
+    Rating = apps.get_model('game', 'Rating')
+    rows = Rating.objects.values('game_id').annotate(
+        count=models.Count('id'),
+        total=models.Sum('rating'),
+        **{f'rating_{star}_count': models.Count('id', filter=models.Q(rating=star)) for star in range(1, 6)}
+    ).order_by()
+    for row in rows:
+        Game.objects.filter(pk=row.pop('game_id')).update(
+            rating_count=row.pop('count'),
+            rating_sum=row.pop('total'),
+            **row
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0006_game_approval_description_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='rating_1_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='rating_2_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='rating_3_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='rating_4_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='rating_5_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 02:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0007_game_rating_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['game', '-updated_at', '-id'], name='rating_game_updated_idx'),
+        ),
+    ]
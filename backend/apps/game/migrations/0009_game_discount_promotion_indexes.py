@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-18 02:43
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0008_rating_game_updated_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameDiscount',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('discount', models.FloatField()),
+                ('discounted_price', models.FloatField()),
+                ('ends_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(fields=['end_day'], name='promotion_end_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(fields=['start_day'], name='promotion_start_day_idx'),
+        ),
+        migrations.AddField(
+            model_name='gamediscount',
+            name='game',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='active_discount', to='game.game'),
+        ),
+        migrations.AddField(
+            model_name='gamediscount',
+            name='promotion',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='game_discounts', to='game.promotion'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 02:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0009_game_discount_promotion_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-buy_at', '-id'], name='order_buy_at_idx'),
+        ),
+    ]
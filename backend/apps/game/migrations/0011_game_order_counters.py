@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-18 02:54
+
+from django.db import migrations, models
+
+
+def backfill_order_counters(apps, schema_editor):
+    Game = apps.get_model('game', 'Game')
+    Order = apps.get_model('game', 'Order')
+    rows = Order.objects.values('game_id').annotate(
+        purchase_count=models.Count('id', filter=models.Q(status='PAID')),
+        wishlist_count=models.Count('id', filter=models.Q(status='WL')),
+        refund_count=models.Count('id', filter=models.Q(status='REFUNDED')),
+    ).order_by()
+    for row in rows:
+        Game.objects.filter(pk=row.pop('game_id')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0010_admin_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='purchase_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='refund_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='wishlist_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_order_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.7 on 2026-10-18 02:57
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_sales_rollups(apps, schema_editor):
+    Order = apps.get_model('game', 'Order')
+    GameSalesDaily = apps.get_model('game', 'GameSalesDaily')
+    PublisherSalesDaily = apps.get_model('game', 'PublisherSalesDaily')
+    sales = models.Q(status__in=['PAID', 'PROCESSING'])
+    refunds = models.Q(status='REFUNDED')
+    aggregates = {
+        'orders': models.Count('id', filter=sales),
+        'refunds': models.Count('id', filter=refunds),
+        'revenue': Coalesce(models.Sum('total_price', filter=sales), 0.0),
+        'refunded': Coalesce(models.Sum('total_price', filter=refunds), 0.0),
+    }
+    orders = Order.objects.filter(sales | refunds).annotate(day=TruncDate('buy_at')).order_by()
+    GameSalesDaily.objects.bulk_create([
+        GameSalesDaily(game_id=row.pop('game_id'), **row)
+        for row in orders.values('game_id', 'day').annotate(**aggregates)
+    ], batch_size=1000)
+    PublisherSalesDaily.objects.bulk_create([
+        PublisherSalesDaily(publisher_id=row.pop('game__publisher_id'), **row)
+        for row in orders.values('game__publisher_id', 'day').annotate(**aggregates)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0011_game_order_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameSalesDaily',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('refunds', models.IntegerField(default=0)),
+                ('revenue', models.FloatField(default=0)),
+                ('refunded', models.FloatField(default=0)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_daily', to='game.game')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('game', 'day'), name='unique_game_sales_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PublisherSalesDaily',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('refunds', models.IntegerField(default=0)),
+                ('revenue', models.FloatField(default=0)),
+                ('refunded', models.FloatField(default=0)),
+                ('publisher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_daily', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('publisher', 'day'), name='unique_publisher_sales_day')],
+            },
+        ),
+        migrations.RunPython(backfill_sales_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:23
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def rebuild_sales_rollups(apps, schema_editor):
+    # Refunded orders now also count as a purchase on their purchase day;
+    # refunds from before refunded_at stay on the purchase day
+    Order = apps.get_model('game', 'Order')
+    GameSalesDaily = apps.get_model('game', 'GameSalesDaily')
+    PublisherSalesDaily = apps.get_model('game', 'PublisherSalesDaily')
+    sold = Order.objects.filter(status__in=['PAID', 'PROCESSING', 'REFUNDED']).annotate(day=TruncDate('buy_at'))
+    refunded = Order.objects.filter(status='REFUNDED').annotate(day=TruncDate('buy_at'))
+    for model, key, column in ((GameSalesDaily, 'game_id', 'game_id'), (PublisherSalesDaily, 'game__publisher_id', 'publisher_id')):
+        totals = {}
+        for row in sold.values(key, 'day').annotate(orders=models.Count('id'), revenue=Coalesce(models.Sum('total_price'), 0.0)).order_by():
+            totals.setdefault((row.pop(key), row.pop('day')), {}).update(row)
+        for row in refunded.values(key, 'day').annotate(refunds=models.Count('id'), refunded=Coalesce(models.Sum('total_price'), 0.0)).order_by():
+            totals.setdefault((row.pop(key), row.pop('day')), {}).update(row)
+        model.objects.all().delete()
+        model.objects.bulk_create([
+            model(**{column: value}, day=day, **amounts) for (value, day), amounts in totals.items() if value is not None
+        ], batch_size=1000)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0013_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='refunded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(rebuild_sales_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:10
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill_game_discounts(apps, schema_editor):
+    # Same rows as GameDiscount.objects.refresh(): the biggest running
+    # discount per game, the one ending first on a tie
+    GameDiscount = apps.get_model('game', 'GameDiscount')
+    PromotionDetail = apps.get_model('game', 'PromotionDetail')
+    now = timezone.now()
+    details = PromotionDetail.objects.filter(
+        promotion__start_day__lte=now, promotion__end_day__gt=now
+    ).order_by('game_id', '-discount', 'promotion__end_day').values_list(
+        'game_id', 'promotion_id', 'discount', 'promotion__end_day', 'game__price')
+    best = {}
+    for game_id, promotion_id, discount, ends_at, price in details.iterator():
+        if game_id not in best:
+            discounted_price = round(price * (1 - discount / 100), 2) if discount else price
+            best[game_id] = GameDiscount(game_id=game_id, promotion_id=promotion_id, discount=discount,
+                                         discounted_price=discounted_price, ends_at=ends_at)
+    GameDiscount.objects.all().delete()
+    GameDiscount.objects.bulk_create(best.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0014_order_refunded_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_game_discounts, migrations.RunPython.noop),
+    ]
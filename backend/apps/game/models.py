@@ -1,12 +1,15 @@
 import uuid
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.db import IntegrityError, models, transaction
+from django.db.models import OuterRef, Subquery, UniqueConstraint
+from django.db.models.functions import Cast, Coalesce, Round, TruncDate
 from django.conf import settings
 from django.utils import timezone
 from apps.useraccount.models import User
 from backend_project.choices import GAME_APPROVAL_CHOICES, ORDER_STATUS_CHOICES
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
+from .text_index import game_text_index
+from .response_cache import invalidate_tags
 
 class Category(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -27,6 +30,89 @@ class OperatingSystem(models.Model):
     def __str__(self):
         return self.title
     
+# Order status -> Game counter column
+ORDER_STATUS_COUNTERS = {
+    'PAID': 'purchase_count',
+    'WL': 'wishlist_count',
+    'REFUNDED': 'refund_count',
+}
+ORDER_COUNTER_AGGREGATES = {
+    name: models.Count('id', filter=models.Q(status=status)) for status, name in ORDER_STATUS_COUNTERS.items()
+}
+
+# Order statuses counted as a sale or as a refund by the sales rollups.
+# The rollups record events: a sale on the day of purchase and a refund on
+# the day of the refund, so later changes to an order never rewrite a day
+# that has passed.
+SALE_STATUSES = ('PAID', 'PROCESSING')
+REFUND_STATUSES = ('REFUNDED',)
+# Orders whose purchase, and whose refund, the rollups still count
+SOLD_ORDERS = models.Q(status__in=SALE_STATUSES + REFUND_STATUSES)
+REFUNDED_ORDERS = models.Q(status__in=REFUND_STATUSES) | models.Q(status__in=SALE_STATUSES, refunded_at__isnull=False)
+
+def _sale_event(state):
+    status, buy_at, total_price, refunded_at = state
+    return timezone.localdate(buy_at), {'orders': 1, 'revenue': total_price}
+
+def _refund_event(state):
+    # Orders refunded before refunded_at existed fall back to the purchase day
+    status, buy_at, total_price, refunded_at = state
+    return timezone.localdate(refunded_at or buy_at), {'refunds': 1, 'refunded': total_price}
+
+def order_sales_events(old, new):
+    # [(day, amounts, sign)] for one order going from old to new; states are
+    # (status, buy_at, total_price, refunded_at), None when not stored
+    was_sold = old is not None and old[0] in SALE_STATUSES
+    is_sold = new is not None and new[0] in SALE_STATUSES
+    was_refunded = old is not None and old[0] in REFUND_STATUSES
+    is_refunded = new is not None and new[0] in REFUND_STATUSES
+    if new is None:
+        # Deleted: take out what rebuild_sales_rollups() would no longer see
+        events = []
+        if was_sold or was_refunded:
+            events.append((*_sale_event(old), -1))
+        if was_refunded or (was_sold and old[3] is not None):
+            events.append((*_refund_event(old), -1))
+        return events
+    if was_sold and is_sold:
+        if old[1:3] == new[1:3]:
+            return []
+        # Purchase corrected by an admin
+        return [(*_sale_event(old), -1), (*_sale_event(new), 1)]
+    if is_sold:
+        # Bought, or bought again after a refund that stays recorded
+        return [(*_sale_event(new), 1)]
+    if is_refunded and not was_refunded:
+        events = [] if was_sold else [(*_sale_event(new), 1)]
+        return events + [(*_refund_event(new), 1)]
+    if was_sold:
+        # Purchase withdrawn without a refund
+        return [(*_sale_event(old), -1)]
+    return []
+
+class GameQuerySet(models.QuerySet):
+    def for_catalog(self):
+        # Load publisher and current discount in a single query
+        return self.select_related('publisher', 'active_discount')
+
+    def with_best_discount(self, now=None):
+        # Biggest running discount per game, read live from PromotionDetail
+        # (correlated subqueries, so still one query for any number of games)
+        now = now or timezone.now()
+        best = PromotionDetail.objects.filter(
+            game_id=OuterRef('pk'), promotion__start_day__lte=now, promotion__end_day__gt=now
+        ).order_by('-discount', 'promotion__end_day')
+        return self.annotate(
+            best_discount=Subquery(best.values('discount')[:1]),
+            best_promotion_id=Subquery(best.values('promotion_id')[:1], output_field=models.UUIDField()),
+            best_discount_ends_at=Subquery(best.values('promotion__end_day')[:1]),
+        )
+
+def apply_discount(price, discount):
+    if not discount:
+        return price
+    return round(price * (1 - discount / 100), 2)
+
 class Game(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=255, unique=True)
@@ -38,6 +124,18 @@ class Game(models.Model):
     approval = models.CharField(max_length=10, choices=GAME_APPROVAL_CHOICES, default='PENDING')
     approval_description = models.TextField(blank=True, default='')
     avg_rating = models.FloatField(default=0.0)
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    rating_1_count = models.IntegerField(default=0)
+    rating_2_count = models.IntegerField(default=0)
+    rating_3_count = models.IntegerField(default=0)
+    rating_4_count = models.IntegerField(default=0)
+    rating_5_count = models.IntegerField(default=0)
+    purchase_count = models.IntegerField(default=0)
+    wishlist_count = models.IntegerField(default=0)
+    refund_count = models.IntegerField(default=0)
+    
+    objects = GameQuerySet.as_manager()
     
     def image_url(self):
         return f'{settings.WEBSITE_URL}{self.image.url}'
@@ -46,16 +144,93 @@ class Game(models.Model):
         return self.publish_year.year
     
     def get_purchase_count(self):
-        return self.orders_user.filter(status='PAID').count()
+        return self.purchase_count
+    
+    def get_discount(self):
+        # Live value from with_best_discount() when annotated, else the
+        # precomputed GameDiscount row
+        if hasattr(self, 'best_discount'):
+            return self.best_discount
+        discount = self.current_discount()
+        return discount.discount if discount else None
+    
+    def get_effective_price(self):
+        return apply_discount(self.price, self.get_discount())
+    
+    def current_discount(self):
+        # Row kept by GameDiscount.objects.refresh, unless it ended since the last refresh
+        try:
+            discount = self.active_discount
+        except GameDiscount.DoesNotExist:
+            return None
+        if discount.ends_at <= timezone.now():
+            return None
+        return discount
+    
+    def rating_histogram(self):
+        return {star: getattr(self, f'rating_{star}_count') for star in range(1, 6)}
     
     def update_avg_rating(self):
-        ratings = self.ratings.all()
-        if ratings.exists():
-            avg = ratings.aggregate(models.Avg('rating'))['rating__avg']
-            self.avg_rating = round(avg, 1)
-        else:
-            self.avg_rating = 0.0
-        self.save()
+        # Full recount from Rating; normal writes go through apply_rating_delta
+        stats = self.ratings.aggregate(
+            count=models.Count('id'),
+            total=models.Sum('rating'),
+            **{f'rating_{star}_count': models.Count('id', filter=models.Q(rating=star)) for star in range(1, 6)}
+        )
+        count, total = stats.pop('count'), stats.pop('total') or 0
+        fields = {
+            'rating_count': count,
+            'rating_sum': total,
+            'avg_rating': round(total / count, 1) if count else 0.0,
+            **stats,
+        }
+        Game.objects.filter(pk=self.pk).update(**fields)
+        for name, value in fields.items():
+            setattr(self, name, value)
+    
+    @classmethod
+    def apply_rating_delta(cls, game_id, added=None, removed=None):
+        # Move one rating in/out of the counters with a single UPDATE; the
+        # right-hand sides all read the pre-update row
+        count_delta = (added is not None) - (removed is not None)
+        sum_delta = (added or 0) - (removed or 0)
+        new_count = models.F('rating_count') + count_delta
+        new_sum = models.F('rating_sum') + sum_delta
+        fields = {
+            'rating_count': new_count,
+            'rating_sum': new_sum,
+            'avg_rating': models.Case(
+                models.When(**{'rating_count': -count_delta}, then=models.Value(0.0)),
+                default=Round(Cast(new_sum, models.FloatField()) / Cast(new_count, models.FloatField()), 1),
+                output_field=models.FloatField(),
+            ),
+        }
+        if added is not None:
+            fields[f'rating_{added}_count'] = models.F(f'rating_{added}_count') + 1
+        if removed is not None:
+            name = f'rating_{removed}_count'
+            fields[name] = fields.get(name, models.F(name)) - 1
+        cls.objects.filter(pk=game_id).update(**fields)
+    
+    def update_order_counters(self):
+        # Full recount from Order; normal writes go through apply_order_status_delta
+        stats = self.orders_user.aggregate(**ORDER_COUNTER_AGGREGATES)
+        Game.objects.filter(pk=self.pk).update(**stats)
+        for name, value in stats.items():
+            setattr(self, name, value)
+    
+    @classmethod
+    def apply_order_status_delta(cls, game_id, added=None, removed=None):
+        # Move one order between status counters with a single UPDATE
+        fields = {}
+        if added in ORDER_STATUS_COUNTERS:
+            name = ORDER_STATUS_COUNTERS[added]
+            fields[name] = models.F(name) + 1
+        if removed in ORDER_STATUS_COUNTERS:
+            name = ORDER_STATUS_COUNTERS[removed]
+            fields[name] = fields.get(name, models.F(name)) - 1
+        if fields:
+            cls.objects.filter(pk=game_id).update(**fields)
     
     def __str__(self):
         return self.title
@@ -85,6 +260,11 @@ class OperatingSystemDetail(models.Model):
         return self.game.title + '-' + self.operating_system.title
     
 class Promotion(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=['end_day'], name='promotion_end_day_idx'),
+            models.Index(fields=['start_day'], name='promotion_start_day_idx'),
+        ]
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=255, unique=True)
     start_day = models.DateTimeField(auto_now_add=True)
@@ -106,6 +286,66 @@ class PromotionDetail(models.Model):
     def __str__(self):
         return self.promotion.title + '-' + self.game.title
     
+class GameDiscountManager(models.Manager):
+    def refresh(self, game_ids=None, now=None):
+        # Rebuild the rows of the given games (all games by default) from the
+        # promotions running at now; returns True when any row changed
+        now = now or timezone.now()
+        games = Game.objects.with_best_discount(now).filter(best_discount__isnull=False)
+        current = self.all()
+        if game_ids is not None:
+            games = games.filter(id__in=game_ids)
+            current = current.filter(game_id__in=game_ids)
+        best = {
+            game_id: (promotion_id, discount, apply_discount(price, discount), ends_at)
+            for game_id, price, discount, promotion_id, ends_at in games.values_list(
+                'id', 'price', 'best_discount', 'best_promotion_id', 'best_discount_ends_at')
+        }
+        existing = {row[0]: row[1:] for row in current.values_list(
+            'game_id', 'promotion_id', 'discount', 'discounted_price', 'ends_at')}
+        if existing == best:
+            return False
+        with transaction.atomic():
+            current.exclude(game_id__in=list(best)).delete()
+            self.bulk_create(
+                [
+                    self.model(game_id=game_id, promotion_id=promotion_id, discount=discount,
+                               discounted_price=discounted_price, ends_at=ends_at)
+                    for game_id, (promotion_id, discount, discounted_price, ends_at) in best.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['game'],
+                update_fields=['promotion', 'discount', 'discounted_price', 'ends_at'],
+            )
+        # bulk_create sends no signals
+        invalidate_tags('game', 'promotion')
+        return True
+
+    def next_change(self, now=None):
+        # Next promotion start or end after now (None when there is none): the
+        # rows, and every response showing a discount, are stale from then on
+        now = now or timezone.now()
+        boundaries = Promotion.objects.aggregate(
+            next_start=models.Min('start_day', filter=models.Q(start_day__gt=now)),
+            next_end=models.Min('end_day', filter=models.Q(end_day__gt=now)),
+        )
+        upcoming = [value for value in boundaries.values() if value is not None]
+        return min(upcoming) if upcoming else None
+
+class GameDiscount(models.Model):
+    # Best running promotion per game, rebuilt by GameDiscount.objects.refresh
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, related_name='active_discount')
+    promotion = models.ForeignKey(Promotion, on_delete=models.CASCADE, related_name='game_discounts')
+    discount = models.FloatField()
+    discounted_price = models.FloatField()
+    ends_at = models.DateTimeField()
+    
+    objects = GameDiscountManager()
+    
+    def __str__(self):
+        return f"{self.discount}% off {self.game_id}"
+    
 class Image(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     img = models.ImageField(upload_to='uploads/games', null=True, blank=True)
@@ -117,11 +357,16 @@ class Image(models.Model):
     def __str__(self):
         return str(self.id)
     
+ORDER_SALE_FIELDS = ('status', 'buy_at', 'total_price', 'refunded_at')
+
 class Order(models.Model):
     class Meta:
         constraints = [
             UniqueConstraint(fields=['game', 'user'], name='unique_games_user')
         ]
+        indexes = [
+            models.Index(fields=['-buy_at', '-id'], name='order_buy_at_idx')
+        ]
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, related_name='orders_user', on_delete=models.CASCADE)
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='orders_user')
@@ -129,6 +374,24 @@ class Order(models.Model):
     total_price = models.FloatField()
     status = models.CharField(max_length=10, choices=ORDER_STATUS_CHOICES, default='PAID')
     refund_description = models.TextField(blank=True, default='')
+    # When the order last became REFUNDED; the refund's day in the sales rollups
+    refunded_at = models.DateTimeField(null=True, blank=True)
+    # Key of the purchase request that last paid this order, for safe retries
+    idempotency_key = models.CharField(max_length=64, blank=True, default='')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so a transition moves the game counters
+        instance._stored_status = instance.__dict__.get('status')
+        # and the stored sale state, whose changes go into the rollups
+        stored = instance.__dict__
+        if all(name in stored for name in ORDER_SALE_FIELDS):
+            instance._stored_sale = tuple(stored[name] for name in ORDER_SALE_FIELDS)
+        return instance
+
+    def sale_state(self):
+        return tuple(getattr(self, name) for name in ORDER_SALE_FIELDS)
     
     def __str__(self):
         return f"Games {self.game.title} of: {self.user.username}"
@@ -138,6 +401,9 @@ class Rating(models.Model):
         constraints = [
             UniqueConstraint(fields=['user', 'game'], name='unique_user_game_rating')
         ]
+        indexes = [
+            models.Index(fields=['game', '-updated_at', '-id'], name='rating_game_updated_idx')
+        ]
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ratings')
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='ratings')
@@ -146,13 +412,226 @@ class Rating(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored value so a re-rating moves the histogram
+        instance._stored_rating = instance.__dict__.get('rating')
+        return instance
+    
     def __str__(self):
         return f"Rating {self.rating} for {self.game.title} by {self.user.username}"
 
+class SalesRollupManager(models.Manager):
+    def bump(self, amounts, sign=1, **key):
+        # Add (sign=1) or take out (sign=-1) amounts on one day row
+        changes = {name: models.F(name) + sign * value for name, value in amounts.items()}
+        if self.filter(**key).update(**changes) or sign < 0:
+            return
+        try:
+            with transaction.atomic():
+                self.create(**key, **amounts)
+        except IntegrityError:
+            # Created by a concurrent order in the meantime
+            self.filter(**key).update(**changes)
+
+class SalesDaily(models.Model):
+    # Purchases (orders/revenue) and refunds (refunds/refunded) made on one
+    # day; a refunded order counts as a purchase on its purchase day too
+    class Meta:
+        abstract = True
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    day = models.DateField()
+    orders = models.IntegerField(default=0)
+    refunds = models.IntegerField(default=0)
+    revenue = models.FloatField(default=0)
+    refunded = models.FloatField(default=0)
+    
+    objects = SalesRollupManager()
+
+class GameSalesDaily(SalesDaily):
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['game', 'day'], name='unique_game_sales_day')
+        ]
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='sales_daily')
+    
+    def __str__(self):
+        return f"Sales of {self.game_id} on {self.day}"
+
+class PublisherSalesDaily(SalesDaily):
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['publisher', 'day'], name='unique_publisher_sales_day')
+        ]
+    publisher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sales_daily')
+    
+    def __str__(self):
+        return f"Sales of {self.publisher_id} on {self.day}"
+
+def apply_order_sales(game_id, old, new):
+    # Record one order's change from old to new state in the rollups
+    events = order_sales_events(old, new)
+    if not events:
+        return
+    publisher_id = Game.objects.filter(pk=game_id).values_list('publisher_id', flat=True).first()
+    for day, amounts, sign in events:
+        GameSalesDaily.objects.bump(amounts, sign, game_id=game_id, day=day)
+        if publisher_id:
+            PublisherSalesDaily.objects.bump(amounts, sign, publisher_id=publisher_id, day=day)
+
+def _sales_totals(orders, key):
+    # {(key value, day): amounts} with sales on the purchase day and refunds
+    # on the refund day
+    totals = {}
+    sales = orders.filter(SOLD_ORDERS).annotate(day=TruncDate('buy_at')).values(key, 'day').annotate(
+        orders=models.Count('id'), revenue=Coalesce(models.Sum('total_price'), 0.0)).order_by()
+    refunds = orders.filter(REFUNDED_ORDERS).annotate(day=TruncDate(Coalesce('refunded_at', 'buy_at'))).values(key, 'day').annotate(
+        refunds=models.Count('id'), refunded=Coalesce(models.Sum('total_price'), 0.0)).order_by()
+    for row in list(sales) + list(refunds):
+        totals.setdefault((row.pop(key), row.pop('day')), {}).update(row)
+    return totals
+
+def rebuild_sales_rollups(game_ids=None):
+    # Recompute the rollups from Order for every game, or for game_ids and
+    # the publishers of those games; returns the number of rows written.
+    # Orders only keep their latest purchase and refund, so a rebuild loses
+    # the earlier purchases of an order that was refunded and bought again
+    orders = Order.objects.all()
+    game_rows = GameSalesDaily.objects.all()
+    publisher_rows = PublisherSalesDaily.objects.all()
+    game_orders = publisher_orders = orders
+    if game_ids is not None:
+        publisher_ids = list(Game.objects.filter(id__in=game_ids).values_list('publisher_id', flat=True).distinct())
+        game_rows = game_rows.filter(game_id__in=game_ids)
+        publisher_rows = publisher_rows.filter(publisher_id__in=publisher_ids)
+        game_orders = orders.filter(game_id__in=game_ids)
+        publisher_orders = orders.filter(game__publisher_id__in=publisher_ids)
+    with transaction.atomic():
+        new_game_rows = [
+            GameSalesDaily(game_id=game_id, day=day, **amounts)
+            for (game_id, day), amounts in _sales_totals(game_orders, 'game_id').items()
+        ]
+        new_publisher_rows = [
+            PublisherSalesDaily(publisher_id=publisher_id, day=day, **amounts)
+            for (publisher_id, day), amounts in _sales_totals(publisher_orders, 'game__publisher_id').items()
+            if publisher_id is not None
+        ]
+        game_rows.delete()
+        publisher_rows.delete()
+        GameSalesDaily.objects.bulk_create(new_game_rows, batch_size=1000)
+        PublisherSalesDaily.objects.bulk_create(new_publisher_rows, batch_size=1000)
+    return len(new_game_rows), len(new_publisher_rows)
+
 @receiver(post_save, sender=Rating)
-def update_avg_rating_on_save(sender, instance, **kwargs):
-    instance.game.update_avg_rating()
+def update_avg_rating_on_save(sender, instance, created, **kwargs):
+    if created:
+        Game.apply_rating_delta(instance.game_id, added=instance.rating)
+    elif not hasattr(instance, '_stored_rating'):
+        Game(pk=instance.game_id).update_avg_rating()
+    elif instance._stored_rating != instance.rating:
+        Game.apply_rating_delta(instance.game_id, added=instance.rating, removed=instance._stored_rating)
+    instance._stored_rating = instance.rating
 
 @receiver(post_delete, sender=Rating)
 def update_avg_rating_on_delete(sender, instance, **kwargs):
-    instance.game.update_avg_rating()
\ No newline at end of file
+    Game.apply_rating_delta(instance.game_id, removed=getattr(instance, '_stored_rating', instance.rating))
+
+@receiver(post_save, sender=Order)
+def update_order_counters_on_save(sender, instance, created, **kwargs):
+    if created:
+        Game.apply_order_status_delta(instance.game_id, added=instance.status)
+    elif getattr(instance, '_stored_status', None) is None:
+        Game(pk=instance.game_id).update_order_counters()
+    elif instance._stored_status != instance.status:
+        Game.apply_order_status_delta(instance.game_id, added=instance.status, removed=instance._stored_status)
+    instance._stored_status = instance.status
+
+@receiver(post_delete, sender=Order)
+def update_order_counters_on_delete(sender, instance, **kwargs):
+    Game.apply_order_status_delta(instance.game_id, removed=getattr(instance, '_stored_status', None) or instance.status)
+
+@receiver(pre_save, sender=Order)
+def stamp_order_refund(sender, instance, **kwargs):
+    if instance.status not in REFUND_STATUSES:
+        return
+    stored = getattr(instance, '_stored_sale', None)
+    if stored is not None and stored[0] in REFUND_STATUSES:
+        return
+    # Unknown stored state (new or deferred): keep a refund time already set
+    if stored is not None or instance.refunded_at is None:
+        instance.refunded_at = timezone.now()
+
+@receiver(post_save, sender=Order)
+def update_sales_rollups_on_save(sender, instance, created, **kwargs):
+    sale = instance.sale_state()
+    if created:
+        apply_order_sales(instance.game_id, None, sale)
+    elif not hasattr(instance, '_stored_sale'):
+        rebuild_sales_rollups([instance.game_id])
+    else:
+        apply_order_sales(instance.game_id, instance._stored_sale, sale)
+    instance._stored_sale = sale
+
+@receiver(post_delete, sender=Order)
+def update_sales_rollups_on_delete(sender, instance, **kwargs):
+    apply_order_sales(instance.game_id, getattr(instance, '_stored_sale', instance.sale_state()), None)
+
+@receiver(post_save, sender=Game)
+def update_text_index_on_save(sender, instance, **kwargs):
+    if instance.approval == 'APPROVED':
+        changed = game_text_index.add(instance.id, instance.title, instance.description)
+    else:
+        changed = game_text_index.remove(instance.id)
+    if changed:
+        transaction.on_commit(game_text_index.changed)
+
+@receiver(post_delete, sender=Game)
+def update_text_index_on_delete(sender, instance, **kwargs):
+    if game_text_index.remove(instance.id):
+        transaction.on_commit(game_text_index.changed)
+
+def refresh_discounts_on_commit(game_ids):
+    transaction.on_commit(lambda: GameDiscount.objects.refresh(game_ids=game_ids))
+
+@receiver(post_save, sender=PromotionDetail)
+@receiver(post_delete, sender=PromotionDetail)
+def refresh_discount_on_promotion_detail_change(sender, instance, **kwargs):
+    refresh_discounts_on_commit([instance.game_id])
+
+@receiver(post_save, sender=Promotion)
+def refresh_discounts_on_promotion_save(sender, instance, created, **kwargs):
+    if not created:
+        refresh_discounts_on_commit(list(instance.promotion_details.values_list('game_id', flat=True)))
+
+@receiver(post_save, sender=Game)
+def refresh_discount_on_game_save(sender, instance, created, **kwargs):
+    # The discounted price follows the game's price
+    if not created:
+        refresh_discounts_on_commit([instance.id])
+
+# Response cache tags touched by each model's writes. Orders are left out: they
+# only move the purchase counters, which the catalog may show up to
+# RESPONSE_CACHE['TIMEOUT'] late rather than being dropped on every sale
+RESPONSE_CACHE_TAGS = {
+    Game: ['game'],
+    Rating: ['game'],
+    Category: ['category'],
+    CategoryDetail: ['category'],
+    OperatingSystem: ['operating_system'],
+    OperatingSystemDetail: ['operating_system'],
+    Promotion: ['promotion'],
+    PromotionDetail: ['promotion'],
+    Image: ['image'],
+    User: ['user'],
+}
+
+def invalidate_response_cache(sender, update_fields=None, **kwargs):
+    # Logins only touch last_login, which no cached response shows
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_tags(*RESPONSE_CACHE_TAGS[sender])
+
+for model in RESPONSE_CACHE_TAGS:
+    post_save.connect(invalidate_response_cache, sender=model)
+    post_delete.connect(invalidate_response_cache, sender=model)
\ No newline at end of file
@@ -0,0 +1,63 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Game, Order
+
+# Longest accepted Idempotency-Key
+MAX_IDEMPOTENCY_KEY_LENGTH = 64
+
+
+def parse_idempotency_key(request):
+    # Idempotency-Key header, or an idempotency_key form field
+    key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key', '')
+    key = key.strip()
+    if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise ValueError(f'Idempotency key longer than {MAX_IDEMPOTENCY_KEY_LENGTH} characters')
+    return key
+
+
+def _locked_order(user, game):
+    order = Order.objects.select_for_update().filter(user=user, game=game).first()
+    if order is not None:
+        order.game = game
+    return order
+
+
+def place_order(user, game_id, idempotency_key=''):
+    # Buy game_id for user at the server-side price. Returns (order, created);
+    # a retry carrying the key of the purchase that made the order gets that
+    # order back with created=False. Raises ValueError when the game is
+    # already bought and Game.DoesNotExist for an unknown game.
+    game = Game.objects.with_best_discount().for_catalog().get(id=game_id)
+    total_price = game.get_effective_price()
+    with transaction.atomic():
+        order = _locked_order(user, game)
+        if order is None:
+            try:
+                with transaction.atomic():
+                    order = Order.objects.create(
+                        user=user,
+                        game=game,
+                        total_price=total_price,
+                        status='PAID',
+                        idempotency_key=idempotency_key,
+                    )
+                return order, True
+            except IntegrityError:
+                # A concurrent request created the order first; unique_games_user
+                # made this insert wait for it, so it can be locked now
+                order = _locked_order(user, game)
+                if order is None:
+                    raise
+        if idempotency_key and order.idempotency_key == idempotency_key:
+            return order, False
+        if order.status == 'PAID':
+            raise ValueError('You have already bought this game')
+        if order.status == 'PROCESSING':
+            raise ValueError('You have already bought this game and it is processing for a refund')
+        order.status = 'PAID'
+        order.total_price = total_price
+        order.buy_at = timezone.now()
+        order.idempotency_key = idempotency_key
+        order.save()
+        return order, True
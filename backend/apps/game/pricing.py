@@ -0,0 +1,40 @@
+import uuid
+
+from .models import Game
+
+# Largest number of games priced by one /prices request
+MAX_PRICE_IDS = 100
+
+
+def parse_game_ids(value, maximum=MAX_PRICE_IDS):
+    # ?ids=a,b,c -> list of UUIDs, ValueError on anything else
+    game_ids = []
+    for raw in value.split(','):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            game_ids.append(uuid.UUID(raw))
+        except ValueError:
+            raise ValueError(f'Invalid game id: {raw}')
+    if len(game_ids) > maximum:
+        raise ValueError(f'At most {maximum} ids per request')
+    return game_ids
+
+
+def price_data(game):
+    # game must come from Game.objects.with_best_discount()
+    return {
+        'game_id': str(game.id),
+        'price': game.price,
+        'discount': game.best_discount,
+        'effective_price': game.get_effective_price(),
+        'promotion_id': str(game.best_promotion_id) if game.best_promotion_id else None,
+        'discount_ends_at': game.best_discount_ends_at.isoformat() if game.best_discount_ends_at else None,
+    }
+
+
+def get_effective_prices(game_ids, now=None):
+    # game_id -> price data for every game that exists, in one query
+    games = Game.objects.with_best_discount(now).filter(id__in=game_ids).only('id', 'price')
+    return {game.id: price_data(game) for game in games}
@@ -0,0 +1,67 @@
+# Named field sets for callers that only need part of a game
+GAME_PROJECTIONS = {
+    'card': ['id', 'title', 'image_url', 'price', 'discount', 'discounted_price'],
+    'summary': [
+        'id', 'title', 'image_url', 'price', 'discount', 'discounted_price', 'publisher',
+        'publish_year', 'avg_rating', 'rating_count', 'purchase_count',
+    ],
+}
+
+# Game columns each serializer field reads
+FIELD_COLUMNS = {
+    'id': ['id'],
+    'title': ['title'],
+    'description': ['description'],
+    'price': ['price'],
+    'publisher': [
+        'publisher__id', 'publisher__email', 'publisher__username',
+        'publisher__avatar', 'publisher__is_active', 'publisher__role',
+    ],
+    'image_url': ['image'],
+    'publish_year': ['publish_year'],
+    'avg_rating': ['avg_rating'],
+    'rating_count': ['rating_count'],
+    'purchase_count': ['purchase_count'],
+    'rating_histogram': [f'rating_{star}_count' for star in range(1, 6)],
+    'discount': ['active_discount__discount', 'active_discount__ends_at'],
+    'discounted_price': ['price', 'active_discount__discount', 'active_discount__ends_at'],
+    'approval': ['approval'],
+    'approval_description': ['approval_description'],
+}
+
+
+def parse_fields(query, serializer_class):
+    # ?projection=card and/or ?fields=a,b -> serializer field names in the
+    # serializer's order; None when the client wants the full payload
+    names = set()
+    projection = query.get('projection', '')
+    if projection:
+        if projection not in GAME_PROJECTIONS:
+            raise ValueError(f'Invalid projection: {projection}')
+        names.update(GAME_PROJECTIONS[projection])
+    names.update(v.strip() for v in query.get('fields', '').split(',') if v.strip())
+    if not names:
+        return None
+    allowed = serializer_class.Meta.fields
+    unknown = names.difference(allowed)
+    if unknown:
+        raise ValueError(f'Invalid fields: {", ".join(sorted(unknown))}')
+    return [name for name in allowed if name in names]
+
+
+def project_games(games, fields, extra_columns=()):
+    # Narrow a Game queryset to the joins and columns the
+    # fields read; fields=None keeps the full catalog queryset
+    if fields is None:
+        return games.for_catalog()
+    related = []
+    if 'publisher' in fields:
+        related.append('publisher')
+    if 'discount' in fields or 'discounted_price' in fields:
+        related.append('active_discount')
+    if related:
+        games = games.select_related(*related)
+    columns = {'id', *extra_columns}
+    for name in fields:
+        columns.update(FIELD_COLUMNS.get(name, ()))
+    return games.only(*columns)
@@ -0,0 +1,144 @@
+import functools
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+# Cache for public GET endpoints. Entries are keyed by view, URL arguments
+# and query string plus the current version of every tag the view depends
+# on; invalidating a tag bumps its version (the invalidation time in ns), so
+# stale entries are never read again and simply expire. The version also
+# gives the Last-Modified value for conditional requests.
+
+DEFAULT_SETTINGS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
+
+def cache_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'RESPONSE_CACHE', {})}
+
+
+def get_cache():
+    return caches[cache_settings()['ALIAS']]
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    # Invalidation and the index versions only reach the other workers through
+    # this cache, so a per-process one is only valid for a single process
+    if getattr(settings, 'WEB_CONCURRENCY', 1) > 1 and isinstance(get_cache(), LocMemCache):
+        return [checks.Error(
+            f"The '{cache_settings()['ALIAS']}' cache is a per-process LocMemCache but WEB_CONCURRENCY is "
+            f"{settings.WEB_CONCURRENCY}; workers would keep serving responses invalidated by the others.",
+            hint='Use FileBasedCache or RedisCache for it (RESPONSE_CACHE_URL).',
+            id='game.E001',
+        )]
+    return []
+
+
+def tag_versions(cache, tags):
+    keys = [f'response-tag:{tag}' for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate_tags(*tags):
+    def bump():
+        cache = get_cache()
+        now = time.time_ns()
+        cache.set_many({f'response-tag:{tag}': now for tag in tags}, None)
+    # Wait for the commit so a concurrent request cannot re-cache old rows
+    transaction.on_commit(bump)
+
+
+def shared_version(name):
+    # Version stamp of per-process state (search index, feature matrix) that
+    # every worker compares with the version it built from. Like the tag
+    # versions it needs a cache shared by the workers.
+    cache = get_cache()
+    key = f'shared-version:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_shared_version(name):
+    # A new random stamp instead of incr(), which FileBasedCache does not do
+    # atomically: when two workers bump at once, the one written last still
+    # differs from every version anyone built from
+    version = uuid.uuid4().hex
+    get_cache().set(f'shared-version:{name}', version, None)
+    return version
+
+
+def _not_modified(request, entry):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return entry['etag'] in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and entry['last_modified'] <= if_modified_since
+
+
+def entry_timeout(timeout, expires):
+    # expires() gives the next time the response changes without a write (a
+    # promotion starting or ending); the entry must not outlive it
+    timeout = timeout if timeout is not None else cache_settings()['TIMEOUT']
+    until = expires() if expires is not None else None
+    if until is None:
+        return timeout
+    return min(timeout, int((until - timezone.now()).total_seconds()))
+
+
+def cached_response(*tags, timeout=None, expires=None):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            cache = get_cache()
+            versions = tag_versions(cache, tags)
+            raw_key = repr((
+                view.__module__, view.__name__, args, sorted(kwargs.items()),
+                sorted(request.GET.lists()), versions,
+            ))
+            key = 'response:' + hashlib.md5(raw_key.encode()).hexdigest()
+            entry = cache.get(key)
+            if entry is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+                entry = {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'etag': quote_etag(hashlib.md5(response.content).hexdigest()),
+                    'last_modified': max(versions) // 1_000_000_000 if versions else int(time.time()),
+                }
+                entry_ttl = entry_timeout(timeout, expires)
+                if entry_ttl > 0:
+                    cache.set(key, entry, entry_ttl)
+            if _not_modified(request, entry):
+                response = HttpResponseNotModified()
+            else:
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+            response['ETag'] = entry['etag']
+            response['Last-Modified'] = http_date(entry['last_modified'])
+            response['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,66 @@
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.db.models import Sum
+
+from backend_project.filters import filter_param
+from .models import GameSalesDaily, PublisherSalesDaily
+
+# Sales analytics read from the daily rollup tables, so a report costs the
+# same whatever the number of orders behind it.
+
+DEFAULT_SALES_DAYS = 30
+MAX_SALES_DAYS = 366
+SALES_COLUMNS = ('orders', 'refunds', 'revenue', 'refunded')
+
+
+def parse_sales_range(request):
+    # ?start=&end= as inclusive dates, the last DEFAULT_SALES_DAYS by default
+    end = filter_param(request, 'end', parse_date) or timezone.localdate()
+    start = filter_param(request, 'start', parse_date) or end - datetime.timedelta(days=DEFAULT_SALES_DAYS - 1)
+    if start > end:
+        raise ValueError('start must not be after end')
+    if (end - start).days >= MAX_SALES_DAYS:
+        raise ValueError(f'At most {MAX_SALES_DAYS} days per request')
+    return start, end
+
+
+def _amounts(row):
+    return {
+        'orders': row['orders'] or 0,
+        'refunds': row['refunds'] or 0,
+        'revenue': round(row['revenue'] or 0, 2),
+        'refunded': round(row['refunded'] or 0, 2),
+    }
+
+
+def sales_report(rows, start, end):
+    # rows: rollup queryset for one game or publisher; days without sales
+    # are left out of 'days'
+    days = [
+        {'day': row['day'].isoformat(), **_amounts(row)}
+        for row in rows.filter(day__range=(start, end)).order_by('day').values('day', *SALES_COLUMNS)
+    ]
+    totals = _amounts({name: sum(day[name] for day in days) for name in SALES_COLUMNS})
+    return {'start': start.isoformat(), 'end': end.isoformat(), 'totals': totals, 'days': days}
+
+
+def game_sales_report(game_id, start, end):
+    return sales_report(GameSalesDaily.objects.filter(game_id=game_id), start, end)
+
+
+def publisher_sales_report(publisher_id, start, end):
+    report = sales_report(PublisherSalesDaily.objects.filter(publisher_id=publisher_id), start, end)
+    games = (
+        GameSalesDaily.objects
+        .filter(game__publisher_id=publisher_id, day__range=(start, end))
+        .values('game_id', 'game__title')
+        .annotate(**{name: Sum(name) for name in SALES_COLUMNS})
+        .order_by('-revenue', 'game_id')
+    )
+    report['games'] = [
+        {'game_id': str(row['game_id']), 'title': row['game__title'], **_amounts(row)}
+        for row in games
+    ]
+    return report
@@ -0,0 +1,114 @@
+import uuid
+
+from django.db.models import Count, Q, Prefetch
+
+from .models import Game, CategoryDetail, OperatingSystemDetail
+from backend_project.pagination import keyset_page, parse_page_size
+from .projections import parse_fields, project_games
+from .serializers import GameSearchSerializer
+
+# sort option -> (field, descending); same names as the frontends' sort select
+SEARCH_SORTS = {
+    'title-asc': ('title', False),
+    'title-desc': ('title', True),
+    'price-asc': ('price', False),
+    'price-desc': ('price', True),
+    'rating-asc': ('avg_rating', False),
+    'rating-desc': ('avg_rating', True),
+    'year-desc': ('publish_year', True),
+}
+DEFAULT_PAGE_SIZE = 16
+MAX_PAGE_SIZE = 100
+
+
+def _get_list(query, key):
+    # Accept both ?category=a&category=b and ?category=a,b
+    values = []
+    for value in query.getlist(key):
+        values.extend(v for v in value.split(',') if v)
+    return values
+
+
+def _get_uuid_list(query, key):
+    try:
+        return [uuid.UUID(value) for value in _get_list(query, key)]
+    except ValueError:
+        raise ValueError(f'Invalid {key}')
+
+
+def _get_float(query, key):
+    value = query.get(key, '')
+    if value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'Invalid {key}')
+
+
+def parse_search_params(query):
+    sort = query.get('sort', 'title-asc')
+    if sort not in SEARCH_SORTS:
+        raise ValueError(f'Invalid sort: {sort}')
+    return {
+        'q': query.get('q', '').strip(),
+        'categories': _get_uuid_list(query, 'category'),
+        'operating_systems': _get_uuid_list(query, 'os'),
+        'publishers': _get_uuid_list(query, 'publisher_id'),
+        'min_price': _get_float(query, 'min_price'),
+        'max_price': _get_float(query, 'max_price'),
+        'min_rating': _get_float(query, 'min_rating'),
+        'sort': sort,
+        'page_size': parse_page_size(query, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE),
+        'cursor': query.get('cursor', ''),
+        'fields': parse_fields(query, GameSearchSerializer),
+    }
+
+
+def filter_games(params, exclude=None):
+    # exclude names the facet whose own filter is skipped, so its counts
+    # still show the other options the user could pick
+    games = Game.objects.filter(approval='APPROVED')
+    if params['q']:
+        games = games.filter(Q(title__icontains=params['q']) | Q(description__icontains=params['q']))
+    if params['publishers']:
+        games = games.filter(publisher_id__in=params['publishers'])
+    if params['min_price'] is not None:
+        games = games.filter(price__gte=params['min_price'])
+    if params['max_price'] is not None:
+        games = games.filter(price__lte=params['max_price'])
+    if params['min_rating'] is not None:
+        games = games.filter(avg_rating__gte=params['min_rating'])
+    if params['categories'] and exclude != 'categories':
+        games = games.filter(id__in=CategoryDetail.objects.filter(
+            category_id__in=params['categories']).values('game_id'))
+    if params['operating_systems'] and exclude != 'operating_systems':
+        games = games.filter(id__in=OperatingSystemDetail.objects.filter(
+            operating_system_id__in=params['operating_systems']).values('game_id'))
+    return games
+
+
+def search_facets(params):
+    categories = CategoryDetail.objects.filter(
+        game_id__in=filter_games(params, exclude='categories').values('id')
+    ).values('category_id').annotate(count=Count('id')).order_by()
+    operating_systems = OperatingSystemDetail.objects.filter(
+        game_id__in=filter_games(params, exclude='operating_systems').values('id')
+    ).values('operating_system_id').annotate(count=Count('id')).order_by()
+    return {
+        'categories': [{'id': str(row['category_id']), 'count': row['count']} for row in categories],
+        'operating_systems': [{'id': str(row['operating_system_id']), 'count': row['count']} for row in operating_systems],
+    }
+
+
+def search_games(params):
+    field, descending = SEARCH_SORTS[params['sort']]
+    fields = params['fields']
+    games = project_games(filter_games(params), fields, extra_columns=[field])
+    if fields is None or 'category_ids' in fields:
+        games = games.prefetch_related(
+            Prefetch('category_details', queryset=CategoryDetail.objects.only('id', 'game_id', 'category_id')))
+    if fields is None or 'operating_system_ids' in fields:
+        games = games.prefetch_related(
+            Prefetch('operatingsystem_details', queryset=OperatingSystemDetail.objects.only('id', 'game_id', 'operating_system_id')))
+    return keyset_page(games, field, descending, params['cursor'], params['page_size'])
@@ -1,6 +1,15 @@
 from rest_framework import serializers
 from .models import *
-from ..useraccount.serializers import UserDetailSerializer
+from ..useraccount.serializers import UserDetailSerializer, UserSummarySerializer
+
+class SparseFieldsMixin:
+    # fields=[...] keeps only those fields, so unused nested serializers
+    # and method fields never run
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 class GameSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,33 +17,39 @@ class GameSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'image_url', 'price']
 
 class RatingSerializer(serializers.ModelSerializer):
-    user = UserDetailSerializer()
+    user = UserSummarySerializer()
     class Meta:
         model = Rating
         fields = ['id', 'user', 'rating', 'comment', 'created_at', 'updated_at']
-class GameDetailSerializer(serializers.ModelSerializer):
-    ratings = RatingSerializer(many=True, read_only=True)
+class GameDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     avg_rating = serializers.FloatField(read_only=True)
-    purchase_count = serializers.SerializerMethodField()
+    discount = serializers.SerializerMethodField()
+    discounted_price = serializers.SerializerMethodField()
     publisher = UserDetailSerializer()
     class Meta:
         model = Game
-        fields = ['id', 'title', 'description', 'price', 'publisher', 'image_url', 'publish_year', 'avg_rating', 'ratings', 'purchase_count', 'approval', 'approval_description']
+        fields = ['id', 'title', 'description', 'price', 'publisher', 'image_url', 'publish_year', 'avg_rating', 'rating_count', 'rating_histogram', 'purchase_count', 'discount', 'discounted_price', 'approval', 'approval_description']
     
-    def get_purchase_count(self, obj):
-        return obj.get_purchase_count()
+    def get_discount(self, obj):
+        return obj.get_discount()
+
+    def get_discounted_price(self, obj):
+        return obj.get_effective_price()
 
-class GameListSerializer(serializers.ModelSerializer):
-    ratings = RatingSerializer(many=True, read_only=True)
+class GameListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     avg_rating = serializers.FloatField(read_only=True)
-    purchase_count = serializers.SerializerMethodField()
+    discount = serializers.SerializerMethodField()
+    discounted_price = serializers.SerializerMethodField()
     publisher = UserDetailSerializer()
     class Meta:
         model = Game
-        fields = ['id', 'title', 'description', 'price', 'publisher', 'image_url', 'publish_year', 'avg_rating', 'ratings', 'purchase_count', 'approval', 'approval_description']
+        fields = ['id', 'title', 'description', 'price', 'publisher', 'image_url', 'publish_year', 'avg_rating', 'rating_count', 'rating_histogram', 'purchase_count', 'discount', 'discounted_price', 'approval', 'approval_description']
     
-    def get_purchase_count(self, obj):
-        return obj.get_purchase_count()
+    def get_discount(self, obj):
+        return obj.get_discount()
+
+    def get_discounted_price(self, obj):
+        return obj.get_effective_price()
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -77,25 +92,26 @@ class OrderListSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'user', 'game', 'buy_at', 'total_price', 'status', 'refund_description']
 
-class GameSearchSerializer(serializers.ModelSerializer):
-    ratings = RatingSerializer(many=True, read_only=True)
+class GameSearchSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     avg_rating = serializers.FloatField(read_only=True)
-    purchase_count = serializers.SerializerMethodField()
+    discount = serializers.SerializerMethodField()
+    discounted_price = serializers.SerializerMethodField()
     publisher = UserDetailSerializer()
     category_ids = serializers.SerializerMethodField()
     operating_system_ids = serializers.SerializerMethodField()
 
     class Meta:
         model = Game
-        fields = ['id', 'title', 'description', 'price', 'publisher', 'image_url', 'publish_year', 'avg_rating', 'ratings', 'purchase_count', 'approval', 'approval_description', 'category_ids', 'operating_system_ids']
+        fields = ['id', 'title', 'description', 'price', 'publisher', 'image_url', 'publish_year', 'avg_rating', 'rating_count', 'rating_histogram', 'purchase_count', 'discount', 'discounted_price', 'approval', 'approval_description', 'category_ids', 'operating_system_ids']
+
+    def get_discount(self, obj):
+        return obj.get_discount()
 
-    def get_purchase_count(self, obj):
-        return obj.get_purchase_count()
+    def get_discounted_price(self, obj):
+        return obj.get_effective_price()
 
     def get_category_ids(self, obj):
-        category_details = CategoryDetail.objects.filter(game=obj)
-        return [str(detail.category.id) for detail in category_details]
+        return [str(detail.category_id) for detail in obj.category_details.all()]
 
     def get_operating_system_ids(self, obj):
-        operating_system_details = OperatingSystemDetail.objects.filter(game=obj)
-        return [str(detail.operating_system.id) for detail in operating_system_details]
\ No newline at end of file
+        return [str(detail.operating_system_id) for detail in obj.operatingsystem_details.all()]
\ No newline at end of file
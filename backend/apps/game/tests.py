@@ -1,3 +1,965 @@
-from django.test import TestCase
+import base64
+import collections
+import datetime
+import importlib
+import json
+import io
+import shutil
+import tempfile
+import threading
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.useraccount.models import User
+from backend_project.encoding import dumps
+from backend_project.pagination import encode_cursor, estimate_count
+
+from .models import (Category, CategoryDetail, Game, GameDiscount, GameSalesDaily, OperatingSystem,
+                     OperatingSystemDetail, Order, Promotion, PromotionDetail, PublisherSalesDaily, Rating,
+                     rebuild_sales_rollups)
+from .batch import MAX_BATCH_IDS
+from .fast_render import render_games
+from .discounts import LOCK_KEY as DISCOUNT_LOCK_KEY, DiscountRefresher
+from .orders import place_order
+from .projections import GAME_PROJECTIONS, parse_fields, project_games
+from .response_cache import bump_shared_version, check_shared_cache, get_cache, shared_version
+from .serializers import GameDetailSerializer, GameListSerializer
+from .text_index import GameTextIndex, game_text_index
+
+
+def create_user(name, role='USER'):
+    return User.objects.create(email=f'{name}@example.com', username=name, password='pbkdf2_sha256$x', role=role)
+
+
+def create_game(publisher, number=0, **fields):
+    return Game.objects.create(
+        title=f'Game {number}', description=f'Description of game {number}', price=10 + number, publisher=publisher,
+        publish_year=datetime.date(2020, 1, 1), **{'approval': 'APPROVED', 'image': 'uploads/games/game.png', **fields}
+    )
+
+
+def create_promotion(game, title, discount, starts_in, ends_in):
+    # Running from now + starts_in to now + ends_in seconds
+    now = timezone.now()
+    promotion = Promotion.objects.create(title=title, end_day=now + datetime.timedelta(seconds=ends_in))
+    Promotion.objects.filter(pk=promotion.pk).update(start_day=now + datetime.timedelta(seconds=starts_in))
+    PromotionDetail.objects.create(promotion=promotion, game=game, discount=discount)
+    promotion.refresh_from_db()
+    return promotion
+
+
+class CatalogQueryCountTests(TestCase):
+    def setUp(self):
+        self.publisher = create_user('publisher', role='PUBLISHER')
+        self.buyers = [create_user(f'buyer{number}') for number in range(2)]
+        self.category = Category.objects.create(title='Action', description='Action games')
+        self.operating_system = OperatingSystem.objects.create(title='Linux')
+        self.games = 0
+
+    def add_games(self, count):
+        for _ in range(count):
+            game = create_game(self.publisher, self.games)
+            self.games += 1
+            CategoryDetail.objects.create(game=game, category=self.category)
+            OperatingSystemDetail.objects.create(game=game, operating_system=self.operating_system)
+            for rating, buyer in enumerate(self.buyers, start=3):
+                Order.objects.create(user=buyer, game=game, total_price=game.price)
+                Rating.objects.create(user=buyer, game=game, rating=rating, comment='Good')
+
+    def get(self, url):
+        get_cache().clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_catalog_queries_do_not_grow_with_the_catalog(self):
+        urls = [
+            '/api/game/',
+            '/api/game/manage/',
+            '/api/game/manage/?page_size=100',
+            f'/api/game/{self.publisher.id}/publishergame/',
+        ]
+        self.add_games(2)
+        counts = {}
+        for fast in (True, False):
+            for url in urls:
+                with override_settings(FAST_JSON_RENDERING=fast), CaptureQueriesContext(connection) as queries:
+                    self.get(url)
+                counts[fast, url] = len(queries)
+
+        self.add_games(20)
+        for (fast, url), count in counts.items():
+            with self.subTest(url=url, fast=fast), override_settings(FAST_JSON_RENDERING=fast), self.assertNumQueries(count):
+                self.assertEqual(len(self.get(url)), 22)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.publisher = create_user('publisher', role='PUBLISHER')
+        self.game = create_game(self.publisher)
+
+    def get(self, url='/api/game/', **headers):
+        return self.client.get(url, headers=headers)
+
+    def test_conditional_requests_are_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get(if_none_match=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(if_modified_since=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.get(if_none_match='"other"').status_code, 200)
+
+    def test_writes_invalidate_the_entry(self):
+        etag = self.get()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game.title = 'Ocean Racer'
+            self.game.save()
+
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['title'], 'Ocean Racer')
+
+    def test_orders_keep_the_entry(self):
+        buyer = create_user('buyer')
+        etag = self.get()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(buyer, self.game.id)
+
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+
+    def test_entries_expire_at_the_next_promotion_boundary(self):
+        cache = get_cache()
+        promotion = Promotion.objects.create(title='Sale', end_day=timezone.now() + datetime.timedelta(seconds=30))
+        PromotionDetail.objects.create(promotion=promotion, game=self.game, discount=50)
+        GameDiscount.objects.refresh()
+        for url in ('/api/game/', f'/api/game/{self.game.id}/', '/api/game/promotions/active/'):
+            with self.subTest(url=url), mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+                self.assertEqual(self.get(url).status_code, 200)
+                timeouts = [call.args[2] for call in cache_set.call_args_list if call.args[0].startswith('response:')]
+                self.assertEqual(len(timeouts), 1)
+                self.assertLessEqual(timeouts[0], 30)
+
+        promotion.end_day = timezone.now() - datetime.timedelta(seconds=1)
+        promotion.save()
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.get('/api/game/?page_size=5')
+        self.assertEqual(cache_set.call_args_list[-1].args[2], 300)
+
+    def test_per_process_cache_is_rejected_with_several_workers(self):
+        locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with override_settings(CACHES={'default': locmem, 'responses': locmem}, WEB_CONCURRENCY=2):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['game.E001'])
+        with override_settings(CACHES={'default': locmem, 'responses': locmem}, WEB_CONCURRENCY=1):
+            self.assertEqual(check_shared_cache(None), [])
+        with override_settings(WEB_CONCURRENCY=2):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class GameDiscountTests(TestCase):
+    def setUp(self):
+        self.publisher = create_user('publisher', role='PUBLISHER')
+        self.game = create_game(self.publisher)
+        self.now = timezone.now()
+
+    def promotion(self, title, discount, starts_in, ends_in):
+        return create_promotion(self.game, title, discount, starts_in, ends_in)
+
+    def catalog_discount(self):
+        get_cache().clear()
+        game, = self.client.get('/api/game/').json()['data']
+        return game['discount'], game['discounted_price']
+
+    def test_refresh_keeps_the_best_running_discount(self):
+        self.promotion('Small', 20, -60, 600)
+        best = self.promotion('Big', 50, -60, 300)
+        self.promotion('Later', 90, 60, 600)
+
+        self.assertTrue(GameDiscount.objects.refresh(now=self.now))
+        row = GameDiscount.objects.get(game=self.game)
+        self.assertEqual((row.promotion_id, row.discount, row.discounted_price), (best.id, 50, 5.0))
+        self.assertFalse(GameDiscount.objects.refresh(now=self.now))
+
+    def test_promotion_applies_once_it_starts(self):
+        promotion = self.promotion('Later', 50, 60, 600)
+        GameDiscount.objects.refresh(now=self.now)
+        self.assertFalse(GameDiscount.objects.exists())
+        self.assertEqual(GameDiscount.objects.next_change(self.now), promotion.start_day)
+
+        GameDiscount.objects.refresh(now=self.now + datetime.timedelta(seconds=61))
+        self.assertEqual(GameDiscount.objects.get(game=self.game).discount, 50)
+
+    def test_ended_discount_is_ignored_before_the_refresh(self):
+        promotion = self.promotion('Sale', 50, -60, 600)
+        GameDiscount.objects.refresh()
+        self.assertEqual(self.catalog_discount(), (50, 5.0))
+
+        # Ends without signals, as time passing would
+        ended = timezone.now() - datetime.timedelta(seconds=1)
+        Promotion.objects.filter(pk=promotion.pk).update(end_day=ended)
+        GameDiscount.objects.filter(game=self.game).update(ends_at=ended)
+        self.assertEqual(self.catalog_discount(), (None, 10.0))
+        self.assertTrue(GameDiscount.objects.refresh())
+        self.assertFalse(GameDiscount.objects.exists())
+
+    def test_refresher_writes_the_rows_and_waits_for_the_next_boundary(self):
+        self.promotion('Sale', 50, -60, 30)
+        self.promotion('Later', 20, 10, 600)
+
+        delay = DiscountRefresher(max_sleep=60).refresh(now=self.now)
+        self.assertEqual(GameDiscount.objects.get(game=self.game).discount, 50)
+        self.assertLessEqual(delay, 10)
+        self.assertEqual(DiscountRefresher(max_sleep=5).refresh(now=self.now), 5)
+
+    def test_refresher_skips_while_another_worker_refreshes(self):
+        self.promotion('Sale', 50, -60, 600)
+        get_cache().add(DISCOUNT_LOCK_KEY, 'other worker', 60)
+        self.addCleanup(get_cache().delete, DISCOUNT_LOCK_KEY)
+
+        DiscountRefresher().refresh(now=self.now)
+        self.assertFalse(GameDiscount.objects.exists())
+
+    def test_migration_backfills_running_promotions(self):
+        self.promotion('Sale', 50, -60, 600)
+        self.promotion('Ended', 80, -600, -60)
+        self.promotion('Later', 90, 60, 600)
+        migration = importlib.import_module('apps.game.migrations.0015_backfill_game_discounts')
+
+        migration.backfill_game_discounts(django_apps, None)
+        row = GameDiscount.objects.get(game=self.game)
+        self.assertEqual((row.discount, row.discounted_price), (50, 5.0))
+
+
+class GameSearchTests(TestCase):
+    def setUp(self):
+        self.publisher = create_user('publisher', role='PUBLISHER')
+        self.category = Category.objects.create(title='Action', description='Action games')
+        self.game = create_game(self.publisher)
+        CategoryDetail.objects.create(game=self.game, category=self.category)
+
+    def test_filters_by_ids(self):
+        response = self.client.get('/api/game/search/query/', {
+            'category': str(self.category.id), 'publisher_id': str(self.publisher.id)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([game['id'] for game in response.json()['data']], [str(self.game.id)])
+
+    def test_malformed_ids_are_rejected(self):
+        for key in ('category', 'os', 'publisher_id'):
+            with self.subTest(key=key):
+                response = self.client.get('/api/game/search/query/', {key: f'{self.category.id},abc'})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': f'Invalid {key}'})
+
+
+class TextIndexTests(TestCase):
+    def setUp(self):
+        # Two cache clients on one directory stand for the caches of two
+        # worker processes: nothing is shared in memory between them
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.caches = [FileBasedCache(directory, {}) for _ in range(2)]
+        self.game = create_game(create_user('publisher', role='PUBLISHER'))
+        # The copy of the second worker
+        self.worker = GameTextIndex()
+        with self.in_worker(1):
+            self.worker.ensure_built()
+        patcher = mock.patch.object(self.worker, 'rebuild_async')
+        self.rebuild_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def in_worker(self, number):
+        return mock.patch('apps.game.response_cache.get_cache', return_value=self.caches[number])
+
+    def search(self, query):
+        with self.in_worker(1):
+            return [game_id for game_id, _ in self.worker.search(query)]
+
+    def test_other_workers_rebuild_after_a_commit(self):
+        with self.in_worker(0), self.captureOnCommitCallbacks(execute=True):
+            self.game.title = 'Ocean Racer'
+            self.game.save()
+
+        # The current copy is served while the rebuild runs
+        self.assertEqual(self.search('racer'), [])
+        self.rebuild_async.assert_called_once()
+        with self.in_worker(1):
+            self.worker.rebuild()
+        self.assertEqual(self.search('racer'), [str(self.game.id)])
+        self.rebuild_async.assert_called_once()
+
+    def test_worker_serves_its_patch_until_the_rebuild(self):
+        self.worker.add(self.game.id, 'Ocean Racer', self.game.description)
+        with self.in_worker(1):
+            self.worker.changed()
+
+        self.assertEqual(self.search('racer'), [str(self.game.id)])
+        self.rebuild_async.assert_called_once()
+
+    def test_bumps_from_both_workers_leave_a_new_version(self):
+        with self.in_worker(0):
+            built = shared_version('test-index')
+        versions = []
+        for number in (0, 1):
+            with self.in_worker(number):
+                versions.append(bump_shared_version('test-index'))
+        for number in (0, 1):
+            with self.in_worker(number):
+                self.assertEqual(shared_version('test-index'), versions[-1])
+        self.assertNotIn(versions[-1], [built, versions[0]])
+
+
+class TextSearchTests(TestCase):
+    def setUp(self):
+        self.game = create_game(create_user('publisher', role='PUBLISHER'))
+
+    def test_invalid_limits_are_rejected(self):
+        for url in ('/api/game/search/text/', '/api/game/search/suggest/'):
+            for limit in ('abc', '0', '-1'):
+                with self.subTest(url=url, limit=limit):
+                    response = self.client.get(url, {'q': 'racer', 'limit': limit})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json(), {'error': 'Invalid limit'})
+
+    def test_other_errors_are_server_errors(self):
+        with mock.patch.object(game_text_index, 'search', side_effect=ValueError('broken index')):
+            response = self.client.get('/api/game/search/text/', {'q': 'racer', 'limit': '5'})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {'error': 'broken index'})
+
+
+class RatingCounterTests(TestCase):
+    def setUp(self):
+        self.game = create_game(create_user('publisher', role='PUBLISHER'))
+        self.buyers = [create_user(f'buyer{number}') for number in range(2)]
+        for buyer in self.buyers:
+            Order.objects.create(user=buyer, game=self.game, total_price=self.game.price)
+
+    def rate(self, user, rating):
+        return self.client.post(f'/api/game/{self.game.id}/rate/', {'rating': rating},
+                                HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def assert_counters(self, avg_rating, rating_count, histogram):
+        game = Game.objects.get(pk=self.game.pk)
+        self.assertEqual((game.avg_rating, game.rating_count), (avg_rating, rating_count))
+        self.assertEqual(game.rating_histogram(), {star: histogram.get(star, 0) for star in range(1, 6)})
+        # Same as a full recount
+        game.update_avg_rating()
+        self.assertEqual((game.avg_rating, game.rating_count), (avg_rating, rating_count))
+        self.assertEqual(game.rating_histogram(), {star: histogram.get(star, 0) for star in range(1, 6)})
+
+    def test_rate_game_moves_the_counters(self):
+        self.assertEqual(self.rate(self.buyers[0], 4).status_code, 200)
+        self.assert_counters(4.0, 1, {4: 1})
+        self.assertEqual(self.rate(self.buyers[0], 2).status_code, 200)
+        self.assert_counters(2.0, 1, {2: 1})
+        self.assertEqual(self.rate(self.buyers[1], 5).status_code, 200)
+        self.assert_counters(3.5, 2, {2: 1, 5: 1})
+
+        Rating.objects.get(user=self.buyers[0]).delete()
+        self.assert_counters(5.0, 1, {5: 1})
+        Rating.objects.get(user=self.buyers[1]).delete()
+        self.assert_counters(0.0, 0, {})
+
+    def test_rejected_ratings_leave_the_counters(self):
+        self.assertEqual(self.rate(create_user('stranger'), 5).status_code, 403)
+        self.assertEqual(self.rate(self.buyers[0], 6).status_code, 400)
+        self.assertEqual(self.rate(self.buyers[0], 'abc').status_code, 400)
+        self.assert_counters(0.0, 0, {})
+
+    def test_apply_rating_delta(self):
+        Game.apply_rating_delta(self.game.id, added=5)
+        Game.apply_rating_delta(self.game.id, added=2)
+        game = Game.objects.get(pk=self.game.pk)
+        self.assertEqual((game.avg_rating, game.rating_count, game.rating_sum), (3.5, 2, 7))
+
+        Game.apply_rating_delta(self.game.id, added=3, removed=5)
+        game = Game.objects.get(pk=self.game.pk)
+        self.assertEqual((game.avg_rating, game.rating_count, game.rating_sum), (2.5, 2, 5))
+        self.assertEqual(game.rating_histogram(), {1: 0, 2: 1, 3: 1, 4: 0, 5: 0})
+
+        Game.apply_rating_delta(self.game.id, removed=2)
+        Game.apply_rating_delta(self.game.id, removed=3)
+        game = Game.objects.get(pk=self.game.pk)
+        self.assertEqual((game.avg_rating, game.rating_count, game.rating_sum), (0.0, 0, 0))
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.game = create_game(create_user('publisher', role='PUBLISHER'))
+        self.buyer = create_user('buyer')
+
+    def prices(self, ids):
+        return self.client.get('/api/game/prices/', {'ids': ids})
+
+    def test_charged_price_is_the_best_running_discount(self):
+        create_promotion(self.game, 'Small', 20, -60, 600)
+        best = create_promotion(self.game, 'Big', 50, -60, 300)
+        create_promotion(self.game, 'Ended', 90, -600, -60)
+        create_promotion(self.game, 'Later', 80, 60, 600)
+
+        game = Game.objects.with_best_discount().get(pk=self.game.pk)
+        self.assertEqual((game.best_discount, game.best_promotion_id), (50, best.id))
+        price, = self.prices(str(self.game.id)).json()['data']
+        self.assertEqual(price, {
+            'game_id': str(self.game.id), 'price': 10, 'discount': 50, 'effective_price': 5.0,
+            'promotion_id': str(best.id), 'discount_ends_at': best.end_day.isoformat(),
+        })
+        # The catalog shows the price that is charged
+        GameDiscount.objects.refresh()
+        get_cache().clear()
+        self.assertEqual(self.client.get(f'/api/game/{self.game.id}/').json()['data']['discounted_price'], 5.0)
+        order, _ = place_order(self.buyer, self.game.id)
+        self.assertEqual(order.total_price, 5.0)
+
+    def test_ended_promotion_is_ignored(self):
+        create_promotion(self.game, 'Ended', 90, -600, -60)
+
+        price, = self.prices(str(self.game.id)).json()['data']
+        self.assertEqual((price['discount'], price['effective_price'], price['promotion_id']), (None, 10, None))
+        order, _ = place_order(self.buyer, self.game.id)
+        self.assertEqual(order.total_price, 10)
+
+    def test_unknown_and_invalid_ids(self):
+        response = self.prices(f'{self.game.id},{uuid.uuid4()}')
+        self.assertEqual([price['game_id'] for price in response.json()['data']], [str(self.game.id)])
+        response = self.prices('abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid game id: abc'})
+        response = self.prices(','.join(str(uuid.uuid4()) for _ in range(101)))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'At most 100 ids per request'})
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        publisher = create_user('publisher', role='PUBLISHER')
+        self.category = Category.objects.create(title='Action', description='Action games', image='uploads/categories/action.png')
+        self.games = [create_game(publisher, number) for number in range(3)]
+        for game in self.games:
+            CategoryDetail.objects.create(game=game, category=self.category)
+        self.promotion = create_promotion(self.games[0], 'Sale', 50, -60, 600)
+
+    def batch(self, ids, **params):
+        return self.client.get('/api/game/batch/', {'ids': ','.join(str(game_id) for game_id in ids), **params})
+
+    def test_known_games_come_back_in_order_with_the_unknown_ids(self):
+        unknown = uuid.uuid4()
+        ids = [self.games[2].id, unknown, self.games[0].id]
+        response = self.batch(ids, include='categories,promotion,ratings')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([game['id'] for game in data['data']], [str(self.games[2].id), str(self.games[0].id)])
+        self.assertEqual(data['missing'], [str(unknown)])
+        first, second = data['data']
+        self.assertEqual([category['id'] for category in first['categories']], [str(self.category.id)])
+        self.assertIsNone(first['promotion'])
+        self.assertEqual(second['promotion']['promotion']['id'], str(self.promotion.id))
+        self.assertEqual(second['ratings']['rating_count'], 0)
+
+    def test_only_unknown_ids(self):
+        unknown = [uuid.uuid4(), uuid.uuid4()]
+        response = self.batch(unknown)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'data': [], 'missing': [str(game_id) for game_id in unknown]})
+
+    def test_size_cap_and_bad_parameters(self):
+        ids = [game.id for game in self.games] + [uuid.uuid4() for _ in range(MAX_BATCH_IDS - len(self.games))]
+        self.assertEqual(self.batch(ids).status_code, 200)
+        for params, error in [
+            ({'ids': ','.join(str(game_id) for game_id in ids + [uuid.uuid4()])}, f'At most {MAX_BATCH_IDS} ids per request'),
+            ({'ids': f'{self.games[0].id},abc'}, 'Invalid game id: abc'),
+            ({'ids': str(self.games[0].id), 'include': 'images,reviews'}, 'Invalid include: reviews'),
+        ]:
+            with self.subTest(params=params):
+                response = self.client.get('/api/game/batch/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': error})
+
+    def test_serialization_errors_are_server_errors(self):
+        # A category without an image cannot build its image_url
+        Category.objects.filter(pk=self.category.pk).update(image='')
+        response = self.batch([self.games[0].id], include='categories')
+
+        self.assertEqual(response.status_code, 500)
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        include = 'images,categories,operating_systems,promotion,ratings'
+        with CaptureQueriesContext(connection) as queries:
+            self.batch([self.games[0].id], include=include)
+        get_cache().clear()
+        with self.assertNumQueries(len(queries)):
+            self.batch([game.id for game in self.games], include=include)
+
+
+class FastRenderTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.publisher = create_user('publisher', role='PUBLISHER')
+        User.objects.filter(pk=self.publisher.pk).update(avatar='uploads/avatars/publisher.png')
+        plain = create_game(self.publisher, 0)
+        running = create_game(self.publisher, 1)
+        ended = create_game(self.publisher, 2)
+        self.imageless = create_game(self.publisher, 3, approval='PENDING', image=None)
+        create_promotion(running, 'Running', 30, -60, 600)
+        promotion = create_promotion(ended, 'Ended', 50, -60, 600)
+        GameDiscount.objects.refresh()
+        # Ends without signals, as time passing would
+        past = timezone.now() - datetime.timedelta(seconds=1)
+        Promotion.objects.filter(pk=promotion.pk).update(end_day=past)
+        GameDiscount.objects.filter(game=ended).update(ends_at=past)
+        self.games = Game.objects.filter(pk__in=[plain.pk, running.pk, ended.pk]).order_by('title')
+
+    def encode_serialized(self, data):
+        # As the DRF path encodes it (the serializer's histogram has int keys)
+        with mock.patch('backend_project.encoding.orjson', None):
+            return dumps(data)
+
+    def assertSamePayload(self, serializer_class, games, fields=None):
+        fast = dumps(render_games(games, fields))
+        slow = self.encode_serialized(serializer_class(project_games(games, fields), many=True, fields=fields).data)
+        self.assertEqual(fast, slow)
+        return json.loads(fast)
+
+    def test_list_payloads_match_the_serializers(self):
+        for serializer_class in (GameDetailSerializer, GameListSerializer):
+            with self.subTest(serializer=serializer_class.__name__):
+                data = self.assertSamePayload(serializer_class, self.games)
+                self.assertEqual([(game['discount'], game['discounted_price']) for game in data],
+                                 [(None, 10), (30, 7.7), (None, 12)])
+                self.assertEqual(data[0]['publisher']['avatar_url'][-len('publisher.png'):], 'publisher.png')
+                for query in ({'fields': 'discounted_price,title'}, {'projection': 'card'},
+                              {'projection': 'summary', 'fields': 'rating_histogram'}):
+                    self.assertSamePayload(serializer_class, self.games, parse_fields(query, serializer_class))
+
+    def test_detail_payload_matches_the_serializer(self):
+        for game in self.games:
+            with self.subTest(game=game.title):
+                fast = dumps(render_games(Game.objects.filter(pk=game.pk))[0])
+                slow = self.encode_serialized(
+                    GameDetailSerializer(project_games(Game.objects.all(), None).get(pk=game.pk)).data)
+                self.assertEqual(fast, slow)
+
+    def test_null_image(self):
+        games = Game.objects.filter(pk=self.imageless.pk)
+        # Payloads without the image render the same; asking for it fails the same way
+        data = self.assertSamePayload(GameDetailSerializer, games, ['title', 'price', 'discount'])
+        self.assertEqual(data, [{'title': 'Game 3', 'price': 13.0, 'discount': None}])
+        message = "The 'image' attribute has no file associated with it."
+        with self.assertRaisesMessage(ValueError, message):
+            render_games(games)
+        with self.assertRaisesMessage(ValueError, message):
+            GameDetailSerializer(project_games(games, None), many=True).data
+
+    def test_publisher_list_render_error_is_a_server_error(self):
+        for fast in (True, False):
+            with self.subTest(fast=fast), override_settings(FAST_JSON_RENDERING=fast):
+                response = self.client.get(f'/api/game/{self.publisher.id}/publishergame/')
+                self.assertEqual(response.status_code, 500)
+                self.assertEqual(response.json(), {'error': "The 'image' attribute has no file associated with it."})
+                response = self.client.get(f'/api/game/{self.publisher.id}/publishergame/', {'fields': 'title,bogus'})
+                self.assertEqual(response.status_code, 400)
+
+
+class ProjectionTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.publisher = create_user('publisher', role='PUBLISHER')
+        self.game = create_game(self.publisher)
+        create_promotion(self.game, 'Sale', 50, -60, 600)
+        GameDiscount.objects.refresh()
+        self.urls = {
+            '/api/game/': lambda body: body['data'][0],
+            '/api/game/manage/': lambda body: body['data'][0],
+            f'/api/game/{self.publisher.id}/publishergame/': lambda body: body['data'][0],
+            f'/api/game/{self.game.id}/': lambda body: body['data'],
+            '/api/game/batch/': lambda body: body['data'][0],
+        }
+
+    def get(self, url, **params):
+        for fast in (True, False):
+            with override_settings(FAST_JSON_RENDERING=fast):
+                get_cache().clear()
+                if url == '/api/game/batch/':
+                    params = {**params, 'ids': str(self.game.id)}
+                yield self.client.get(url, params)
+
+    def test_only_the_requested_fields_are_returned(self):
+        for url, item in self.urls.items():
+            with self.subTest(url=url):
+                for response in self.get(url, fields='title,discounted_price'):
+                    self.assertEqual(response.status_code, 200)
+                    keys = set(item(response.json()))
+                    # The batch keeps the id to match the requested ids
+                    self.assertEqual(keys - {'id'} if 'batch' in url else keys, {'title', 'discounted_price'})
+                    self.assertEqual(item(response.json())['discounted_price'], 5.0)
+
+    def test_named_projection(self):
+        for url, item in self.urls.items():
+            with self.subTest(url=url):
+                for response in self.get(url, projection='card'):
+                    self.assertEqual(set(item(response.json())), set(GAME_PROJECTIONS['card']))
+
+    def test_unknown_fields_are_rejected(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                for params, error in (({'fields': 'title,password'}, 'Invalid fields: password'),
+                                      ({'projection': 'poster'}, 'Invalid projection: poster')):
+                    for response in self.get(url, **params):
+                        self.assertEqual(response.status_code, 400)
+                        self.assertEqual(response.json(), {'error': error})
+
+
+class CursorTests(TestCase):
+    def setUp(self):
+        self.publisher = create_user('publisher', role='PUBLISHER')
+        self.game = create_game(self.publisher)
+        for number in range(3):
+            buyer = create_user(f'buyer{number}')
+            Order.objects.create(user=buyer, game=self.game, total_price=10)
+            Rating.objects.create(user=buyer, game=self.game, rating=5)
+        self.urls = ['/api/game/orders/', f'/api/game/{self.game.id}/ratings/']
+
+    def test_pages_follow_the_cursor(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                seen, cursor = [], ''
+                while True:
+                    response = self.client.get(url, {'page_size': 2, **({'cursor': cursor} if cursor else {})})
+                    self.assertEqual(response.status_code, 200)
+                    seen += [row['id'] for row in response.json()['data']]
+                    cursor = response.json()['next_cursor']
+                    if not cursor:
+                        break
+                self.assertEqual(len(set(seen)), 3)
+
+    def test_tampered_cursors_are_rejected(self):
+        now = timezone.now().isoformat()
+        cursors = [
+            'not a cursor',
+            base64.urlsafe_b64encode(b'[1, 2]').decode(),
+            encode_cursor('yesterday', self.game.id),
+            encode_cursor(now, 'zz'),
+            base64.urlsafe_b64encode(json.dumps({'v': [now], 'id': str(self.game.id)}).encode()).decode(),
+            base64.urlsafe_b64encode(json.dumps({'v': None, 'id': str(self.game.id)}).encode()).decode(),
+        ]
+        for url in self.urls:
+            for cursor in cursors:
+                with self.subTest(url=url, cursor=cursor):
+                    response = self.client.get(url, {'page_size': 2, 'cursor': cursor})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+
+class AdminPageTests(TestCase):
+    def setUp(self):
+        self.publisher = create_user('publisher', role='PUBLISHER')
+        self.games = [create_game(self.publisher, number) for number in range(3)]
+        for number in range(5):
+            Order.objects.create(user=create_user(f'buyer{number}'), game=self.games[number % 3], total_price=10)
+        # Every order on the same instant, so only the id orders them
+        Order.objects.update(buy_at=timezone.now())
+
+    def pages(self, url, page_size, **params):
+        rows, cursor = [], ''
+        while True:
+            response = self.client.get(url, {'page_size': page_size, **params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertLessEqual(len(body['data']), page_size)
+            rows += body['data']
+            cursor = body['next_cursor']
+            if not cursor:
+                return rows, body['total']
+
+    def test_order_pages_cross_ties(self):
+        rows, total = self.pages('/api/game/orders/', 2)
+        ids = sorted((str(order_id) for order_id in Order.objects.values_list('id', flat=True)), reverse=True)
+        self.assertEqual([row['id'] for row in rows], ids)
+        self.assertEqual(total, {'count': 5, 'exact': True})
+
+        rows, total = self.pages('/api/game/orders/', 1, game_id=self.games[0].id)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(total, {'count': 2, 'exact': True})
+
+    def test_manage_pages(self):
+        rows, total = self.pages('/api/game/manage/', 2, fields='title')
+        self.assertEqual(rows, [{'title': f'Game {number}'} for number in range(3)])
+        self.assertEqual(total, {'count': 3, 'exact': True})
+
+    def test_tampered_cursors_are_rejected(self):
+        cursors = {
+            '/api/game/orders/': ['not a cursor', encode_cursor('yesterday', uuid.uuid4()), encode_cursor(None, uuid.uuid4())],
+            '/api/game/manage/': ['not a cursor', encode_cursor('Game 0', 'zz'), encode_cursor(None, uuid.uuid4())],
+        }
+        for url, tampered in cursors.items():
+            for cursor in tampered:
+                with self.subTest(url=url, cursor=cursor):
+                    response = self.client.get(url, {'cursor': cursor})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+    def test_count_stops_at_the_cap(self):
+        self.assertEqual(estimate_count(Order.objects.all(), cap=10), (5, True))
+        self.assertEqual(estimate_count(Order.objects.all(), cap=5), (5, True))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(estimate_count(Order.objects.all(), cap=3), (3, False))
+        self.assertEqual(len(queries), 1)
+        self.assertIn('LIMIT 4', queries[0]['sql'])
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        self.publisher = create_user('publisher', role='PUBLISHER')
+        self.buyer = create_user('buyer')
+        self.game = create_game(self.publisher)
+
+    def post_order(self, key):
+        return self.client.post(f'/api/game/order/{self.game.id}/', HTTP_IDEMPOTENCY_KEY=key,
+                                HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.buyer)}')
+
+    def test_same_key_replays_the_purchase(self):
+        order, created = place_order(self.buyer, self.game.id, 'checkout-1')
+        replayed, replay_created = place_order(self.buyer, self.game.id, 'checkout-1')
+
+        self.assertTrue(created)
+        self.assertFalse(replay_created)
+        self.assertEqual(replayed.id, order.id)
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.purchase_count, 1)
+        self.assertEqual(GameSalesDaily.objects.get(game=self.game).orders, 1)
+
+    def test_other_key_is_rejected_once_bought(self):
+        place_order(self.buyer, self.game.id, 'checkout-1')
+
+        with self.assertRaises(ValueError):
+            place_order(self.buyer, self.game.id, 'checkout-2')
+        with self.assertRaises(ValueError):
+            place_order(self.buyer, self.game.id)
+
+    def test_buying_again_after_a_refund_needs_a_new_key(self):
+        order, _ = place_order(self.buyer, self.game.id, 'checkout-1')
+        order.status = 'REFUNDED'
+        order.save()
+
+        replayed, created = place_order(self.buyer, self.game.id, 'checkout-1')
+        self.assertFalse(created)
+        self.assertEqual(replayed.status, 'REFUNDED')
+        bought, created = place_order(self.buyer, self.game.id, 'checkout-2')
+        self.assertTrue(created)
+        self.assertEqual(bought.status, 'PAID')
+
+    def test_order_endpoint_reports_replays(self):
+        first = self.post_order('checkout-1')
+        second = self.post_order('checkout-1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertFalse(first.json()['replayed'])
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(second.json()['replayed'])
+        self.assertEqual(second.json()['order']['id'], first.json()['order']['id'])
+        self.assertEqual(self.post_order('checkout-2').status_code, 400)
+        self.assertEqual(self.post_order('x' * 65).status_code, 400)
+
+
+class ConcurrentPlaceOrderTests(TransactionTestCase):
+    # One connection per thread: run against PostgreSQL (max_connections
+    # above PURCHASES) or a file based SQLite test database
+    PURCHASES = 100
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('needs a test database that allows concurrent connections')
+        self.publisher = create_user('publisher', role='PUBLISHER')
+        self.buyer = create_user('buyer')
+        self.game = create_game(self.publisher)
+
+    def purchase_concurrently(self, key_for):
+        results = collections.Counter()
+        barrier = threading.Barrier(self.PURCHASES)
+
+        def purchase(number):
+            try:
+                barrier.wait()
+                order, created = place_order(self.buyer, self.game.id, key_for(number))
+                results['created' if created else 'replayed'] += 1
+            except ValueError:
+                results['rejected'] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=purchase, args=(number,)) for number in range(self.PURCHASES)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def assert_bought_once(self):
+        self.assertEqual(Order.objects.filter(user=self.buyer, game=self.game).count(), 1)
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.purchase_count, 1)
+        self.assertEqual([row.orders for row in GameSalesDaily.objects.filter(game=self.game)], [1])
+        self.assertEqual([row.orders for row in PublisherSalesDaily.objects.filter(publisher=self.publisher)], [1])
+
+    def test_simultaneous_purchases_with_one_key(self):
+        results = self.purchase_concurrently(lambda number: 'checkout-1')
+
+        self.assertEqual(results, {'created': 1, 'replayed': self.PURCHASES - 1})
+        self.assert_bought_once()
+
+    def test_simultaneous_purchases_without_a_key(self):
+        results = self.purchase_concurrently(lambda number: '')
+
+        self.assertEqual(results, {'created': 1, 'rejected': self.PURCHASES - 1})
+        self.assert_bought_once()
+
+
+class ReconcileGameCountersTests(TestCase):
+    def setUp(self):
+        publisher = create_user('publisher', role='PUBLISHER')
+        buyers = [create_user(f'buyer{number}') for number in range(2)]
+        self.games = [create_game(publisher, number) for number in range(3)]
+        for game in self.games:
+            for buyer in buyers:
+                Order.objects.create(user=buyer, game=game, total_price=game.price)
+
+    def reconcile(self, *args):
+        out = io.StringIO()
+        call_command('reconcile_game_counters', '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def counts(self):
+        return list(Game.objects.order_by('id').values_list('purchase_count', 'wishlist_count', 'refund_count'))
+
+    def test_fixes_drifted_counters(self):
+        Game.objects.filter(pk__in=[self.games[0].pk, self.games[2].pk]).update(purchase_count=7, refund_count=1)
+
+        self.assertIn('2 games with drifted counters found', self.reconcile('--dry-run'))
+        self.assertIn('2 games with drifted counters fixed', self.reconcile())
+        self.assertEqual(self.counts(), [(2, 0, 0)] * 3)
+        self.assertIn('0 games with drifted counters fixed', self.reconcile())
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.publisher = create_user('publisher', role='PUBLISHER')
+        self.buyer = create_user('buyer')
+        self.game = create_game(self.publisher)
+        self.days = [timezone.now() - datetime.timedelta(days=days) for days in (10, 5, 1)]
+
+    def rollups(self, model=GameSalesDaily):
+        return {
+            row['day']: (row['orders'], row['revenue'], row['refunds'], row['refunded'])
+            for row in model.objects.values('day', 'orders', 'revenue', 'refunds', 'refunded')
+        }
+
+    def refund(self, order, at):
+        order = Order.objects.get(pk=order.pk)
+        order.status = 'REFUNDED'
+        with mock.patch('django.utils.timezone.now', return_value=at):
+            order.save()
+
+    def test_refund_is_recorded_on_the_refund_day(self):
+        order = Order.objects.create(user=self.buyer, game=self.game, total_price=10, buy_at=self.days[0])
+        self.refund(order, self.days[1])
+
+        expected = {
+            timezone.localdate(self.days[0]): (1, 10, 0, 0),
+            timezone.localdate(self.days[1]): (0, 0, 1, 10),
+        }
+        self.assertEqual(self.rollups(), expected)
+        self.assertEqual(self.rollups(PublisherSalesDaily), expected)
+        rebuild_sales_rollups()
+        self.assertEqual(self.rollups(), expected)
+
+    def test_buying_again_keeps_the_refund(self):
+        order = Order.objects.create(user=self.buyer, game=self.game, total_price=10, buy_at=self.days[0])
+        self.refund(order, self.days[1])
+        with mock.patch('django.utils.timezone.now', return_value=self.days[2]):
+            place_order(self.buyer, self.game.id)
+
+        self.assertEqual(self.rollups(), {
+            timezone.localdate(self.days[0]): (1, 10, 0, 0),
+            timezone.localdate(self.days[1]): (0, 0, 1, 10),
+            timezone.localdate(self.days[2]): (1, 10, 0, 0),
+        })
+
+    def test_deleting_an_order_matches_a_rebuild(self):
+        order = Order.objects.create(user=self.buyer, game=self.game, total_price=10, buy_at=self.days[0])
+        self.refund(order, self.days[1])
+        Order.objects.get(pk=order.pk).delete()
+
+        self.assertEqual({amounts for amounts in self.rollups().values()}, {(0, 0, 0, 0)})
+        rebuild_sales_rollups()
+        self.assertEqual(self.rollups(), {})
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = create_user('admin', role='ADMIN')
+        self.user = create_user('user')
+        publisher = create_user('publisher', role='PUBLISHER')
+        self.games = [create_game(publisher, number) for number in range(3)]
+        for game in self.games:
+            Order.objects.create(user=self.admin, game=game, total_price=game.price)
+        self.exports = {
+            '/api/game/manage/export/': sorted(str(game.id) for game in self.games),
+            '/api/game/orders/export/': sorted(str(order.id) for order in Order.objects.all()),
+        }
+
+    def export(self, url, user=None, **params):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'} if user else {}
+        return self.client.get(url, params, **headers)
+
+    def lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_exports_need_an_admin(self):
+        for url in self.exports:
+            with self.subTest(url=url):
+                self.assertEqual(self.export(url).status_code, 401)
+                self.assertEqual(self.export(url, self.user).status_code, 403)
+
+    def test_streams_every_row(self):
+        for url, ids in self.exports.items():
+            with self.subTest(url=url):
+                rows = [json.loads(line) for line in self.lines(self.export(url, self.admin))]
+                self.assertEqual([row['id'] for row in rows], ids)
+                header, *csv_rows = self.lines(self.export(url, self.admin, export_format='csv'))
+                self.assertTrue(header.startswith('id,'))
+                self.assertEqual([row.split(',', 1)[0] for row in csv_rows], ids)
+
+    def test_cursor_resumes_after_the_last_row(self):
+        for url, ids in self.exports.items():
+            with self.subTest(url=url):
+                rows = self.lines(self.export(url, self.admin, cursor=ids[0]))
+                self.assertEqual([json.loads(line)['id'] for line in rows], ids[1:])
+                # No second header in a resumed CSV
+                rows = self.lines(self.export(url, self.admin, cursor=ids[0], export_format='csv'))
+                self.assertEqual([row.split(',', 1)[0] for row in rows], ids[1:])
+
+    def test_bad_parameters_are_rejected(self):
+        for url in self.exports:
+            with self.subTest(url=url):
+                response = self.export(url, self.admin, export_format='xml')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid export_format: xml'})
+                response = self.export(url, self.admin, cursor='abc')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid cursor'})
@@ -0,0 +1,252 @@
+import bisect
+import heapq
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from django.db import connection
+
+from .response_cache import bump_shared_version, shared_version
+
+# In-process inverted index over approved games' title and description.
+# Each worker process keeps its own copy, built at startup (or on first use)
+# and patched by the Game post_save/post_delete signals. Committed changes
+# bump a version in the shared response cache; every worker notices it on its
+# next search and rebuilds in the background while serving its current copy.
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+TITLE_BOOST = 3.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_PREFIX_EXPANSIONS = 50
+MAX_SUGGEST_CANDIDATES = 500
+VERSION_NAME = 'game-text-index'
+STATE = ('_postings', '_doc_terms', '_doc_len', '_total_len', '_titles', '_sources', '_title_postings', '_title_vocab')
+
+
+def normalize(text):
+    # Fold Vietnamese diacritics: "Đường Đua" -> "duong dua"
+    text = text.lower()
+    if text.isascii():
+        return text
+    text = text.replace('đ', 'd')
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text or ''))
+
+
+def parse_limit(query, default, maximum):
+    try:
+        limit = int(query.get('limit', default))
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    return min(limit, maximum)
+
+
+class GameTextIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._built = False
+        self._version = None
+        self._patches = 0
+        self._reset()
+
+    def _reset(self):
+        self._postings = defaultdict(dict)  # term -> {game_id: weighted tf}
+        self._doc_terms = {}  # game_id -> {term: weighted tf}
+        self._doc_len = {}
+        self._total_len = 0.0
+        self._titles = {}
+        self._sources = {}  # game_id -> (title, description hash), to skip unchanged saves
+        self._title_postings = defaultdict(set)  # title term -> {game_id}
+        self._title_vocab = []  # sorted title terms for prefix lookup
+
+    def build(self, rows, version=None):
+        # Index into a fresh copy and swap it in, searches keep using the
+        # current one meanwhile. A patch made to that during the build is
+        # lost, so the version stays unset and the next search rebuilds.
+        patches = self._patches
+        fresh = GameTextIndex()
+        for game_id, title, description in rows:
+            fresh._add(game_id, title, description)
+        with self._lock:
+            for name in STATE:
+                setattr(self, name, getattr(fresh, name))
+            self._version = version if self._patches == patches else None
+            self._built = True
+
+    def rebuild(self):
+        with self._build_lock:
+            version = shared_version(VERSION_NAME)
+            if self._built and version == self._version:
+                return
+            from .models import Game
+            self.build(Game.objects.filter(approval='APPROVED').values_list('id', 'title', 'description').iterator(), version)
+
+    def rebuild_async(self):
+        if not self._build_lock.locked():
+            threading.Thread(target=self._rebuild_in_thread, daemon=True).start()
+
+    def _rebuild_in_thread(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Could not build the game text index')
+        finally:
+            connection.close()
+
+    def ensure_built(self):
+        if not self._built:
+            # Waits for the startup build when it is still running
+            self.rebuild()
+        elif shared_version(VERSION_NAME) != self._version:
+            self.rebuild_async()
+
+    def add(self, game_id, title, description):
+        # Returns False when the game is already indexed with this text
+        with self._lock:
+            if not self._built:
+                return True
+            if self._sources.get(str(game_id)) == (title, hash(description)):
+                return False
+            self._remove(game_id)
+            self._add(game_id, title, description)
+            self._patches += 1
+            return True
+
+    def remove(self, game_id):
+        with self._lock:
+            if not self._built:
+                return True
+            if str(game_id) not in self._doc_terms:
+                return False
+            self._remove(game_id)
+            self._patches += 1
+            return True
+
+    def changed(self):
+        # Run after the commit of a change this process already applied. The
+        # shared cache has no atomic compare-and-set, so this worker cannot
+        # tell whether another one changed games at the same time: it keeps
+        # serving its patched copy and rebuilds like the others.
+        bump_shared_version(VERSION_NAME)
+
+    def _add(self, game_id, title, description):
+        game_id = str(game_id)
+        terms = defaultdict(float)
+        title_tokens = tokenize(title)
+        for token in title_tokens:
+            terms[token] += TITLE_BOOST
+        for token in tokenize(description):
+            terms[token] += 1.0
+        for term, tf in terms.items():
+            self._postings[term][game_id] = tf
+        self._doc_terms[game_id] = terms
+        self._doc_len[game_id] = sum(terms.values())
+        self._total_len += self._doc_len[game_id]
+        self._titles[game_id] = title
+        self._sources[game_id] = (title, hash(description))
+        for token in set(title_tokens):
+            if not self._title_postings[token]:
+                bisect.insort(self._title_vocab, token)
+            self._title_postings[token].add(game_id)
+
+    def _remove(self, game_id):
+        game_id = str(game_id)
+        terms = self._doc_terms.pop(game_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(game_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_len.pop(game_id)
+        self._sources.pop(game_id, None)
+        for token in set(tokenize(self._titles.pop(game_id))):
+            postings = self._title_postings[token]
+            postings.discard(game_id)
+            if not postings:
+                del self._title_postings[token]
+                i = bisect.bisect_left(self._title_vocab, token)
+                if i < len(self._title_vocab) and self._title_vocab[i] == token:
+                    del self._title_vocab[i]
+
+    def _prefix_terms(self, prefix):
+        i = bisect.bisect_left(self._title_vocab, prefix)
+        terms = []
+        while i < len(self._title_vocab) and len(terms) < MAX_PREFIX_EXPANSIONS:
+            term = self._title_vocab[i]
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+            i += 1
+        return terms
+
+    def search(self, query, limit=20, prefix=False):
+        # BM25 over title (boosted) + description; with prefix=True the last
+        # query token also matches title terms that start with it
+        self.ensure_built()
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs
+            query_terms = [[token] for token in tokens]
+            if prefix:
+                query_terms[-1] = [tokens[-1]] + [t for t in self._prefix_terms(tokens[-1]) if t != tokens[-1]]
+            scores = defaultdict(float)
+            for alternatives in query_terms:
+                for term in alternatives:
+                    postings = self._postings.get(term)
+                    if not postings:
+                        continue
+                    idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for game_id, tf in postings.items():
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[game_id] / avg_len)
+                        scores[game_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def suggest(self, query, limit=10):
+        # Typeahead on titles: every token but the last must match a whole
+        # title word, the last one is matched as a prefix
+        self.ensure_built()
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            required = [self._title_postings.get(token, set()) for token in tokens[:-1]]
+            if any(not postings for postings in required):
+                return []
+            required.sort(key=len)
+            candidates = []
+            seen = set()
+            for term in self._prefix_terms(tokens[-1]):
+                for game_id in self._title_postings[term]:
+                    if game_id in seen or not all(game_id in postings for postings in required):
+                        continue
+                    seen.add(game_id)
+                    candidates.append(game_id)
+                    if len(candidates) >= MAX_SUGGEST_CANDIDATES:
+                        break
+                if len(candidates) >= MAX_SUGGEST_CANDIDATES:
+                    break
+            candidates.sort(key=lambda game_id: (len(self._titles[game_id]), self._titles[game_id]))
+            return [{'id': game_id, 'title': self._titles[game_id]} for game_id in candidates[:limit]]
+
+
+game_text_index = GameTextIndex()
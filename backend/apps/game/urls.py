@@ -4,7 +4,11 @@ from . import api
 urlpatterns = [
     path('', api.game_list, name='api_game_list'),
     path('search/', api.game_list_search, name='api_game_list_search'),
+    path('search/query/', api.game_search, name='api_game_search'),
+    path('search/text/', api.game_text_search, name='api_game_text_search'),
+    path('search/suggest/', api.game_suggest, name='api_game_suggest'),
     path('manage/', api.game_list_manage, name='api_game_list_manage'),
+    path('manage/export/', api.game_export, name='api_game_export'),
     path('category/', api.category_list, name='api_category_list'),
     path('category/<uuid:gameId>/', api.category_game_list, name='api_category_game_list'),
     path('category/create/', api.create_category, name='api_create_category'),
@@ -25,6 +29,8 @@ urlpatterns = [
     path('image/<uuid:gameId>/', api.image_list, name='api_image_list'),
     path('promotion_detail/<uuid:game_id>/', api.game_promotion_detail, name='game_promotion_detail'),
     path('promotion/<uuid:game_id>/', api.game_promotion, name='game_promotion'),
+    path('batch/', api.game_batch, name='api_game_batch'),
+    path('prices/', api.game_prices, name='api_game_prices'),
     path('promotions/', api.promotion_list, name='api_promotion_list'),
     path('promotions/<uuid:promotion_id>/details/', api.promotion_details, name='api_promotion_details'),
     path('promotions/create/', api.create_promotion, name='api_create_promotion'),
@@ -32,8 +38,11 @@ urlpatterns = [
     path('promotions/<uuid:promotion_id>/delete/', api.delete_promotion, name='api_delete_promotion'),
     path('<uuid:userId>/order/', api.user_game_list, name='api_user_game_list'),
     path('<uuid:userId>/publishergame/', api.publisher_game_list, name='api_user_game_list'),
+    path('analytics/publisher/<uuid:userId>/', api.publisher_sales, name='api_publisher_sales'),
+    path('analytics/game/<uuid:game_id>/', api.game_sales, name='api_game_sales'),
     path('order/<uuid:game_id>/', api.order_game, name='api_game_order'),
     path('orders/', api.order_list, name='api_order_list'),
+    path('orders/export/', api.order_export, name='api_order_export'),
     path('orders/<uuid:order_id>/update/', api.update_order, name='api_update_order'),
     path('orders/<uuid:order_id>/delete/', api.delete_order, name='api_delete_order'),
     path('<uuid:gameId>/toggle_favorite/', api.toggle_favorite, name='api_toggle_favorite'),
@@ -2,4 +2,5 @@ from django.contrib import admin
 from .models import *
 
 # Register your models here.
-admin.site.register(AccessGameHistory)
\ No newline at end of file
+admin.site.register(AccessGameHistory)
+admin.site.register(UserRecommendation)
\ No newline at end of file
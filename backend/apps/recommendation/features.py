@@ -0,0 +1,185 @@
+import logging
+import threading
+
+import numpy as np
+from django.db import connection
+
+from apps.game.models import Game, Category, CategoryDetail
+from apps.game.response_cache import bump_shared_version, shared_version
+
+# Game x category matrix shared by every recommendation request of this
+# process. Built at startup (or on first use), then patched in place by the
+# CategoryDetail / Game signals; changes it cannot patch (new game, new
+# category) just mark it stale so the next request rebuilds it. Committed
+# changes bump a version in the shared response cache; every worker notices it
+# on its next request and rebuilds in the background while serving its
+# current copy.
+
+logger = logging.getLogger(__name__)
+
+VERSION_NAME = 'game-feature-matrix'
+
+
+class GameFeatureMatrix:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._stale = True
+        self._version = None
+        self._patches = 0
+        self.game_ids = []
+        self.game_index = {}
+        self.category_index = {}
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.normalized = self.matrix
+        self.approved = np.zeros(0, dtype=bool)
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
+            self._patches += 1
+
+    def ensure_built(self):
+        if self._stale:
+            # Waits for the startup build when it is still running
+            self.rebuild()
+        elif shared_version(VERSION_NAME) != self._version:
+            self.rebuild_async()
+
+    def rebuild(self):
+        with self._build_lock:
+            version = shared_version(VERSION_NAME)
+            if not self._stale and version == self._version:
+                return
+            self._build(version)
+
+    def rebuild_async(self):
+        if not self._build_lock.locked():
+            threading.Thread(target=self._rebuild_in_thread, daemon=True).start()
+
+    def _rebuild_in_thread(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Could not build the game feature matrix')
+        finally:
+            connection.close()
+
+    def changed(self):
+        # Run after the commit of a change this process already applied. The
+        # shared cache has no atomic compare-and-set, so this worker cannot
+        # tell whether another one changed games at the same time: it keeps
+        # serving its patched copy and rebuilds like the others.
+        bump_shared_version(VERSION_NAME)
+
+    def _build(self, version):
+        # Reads into new arrays and swaps them in, requests keep using the
+        # current ones meanwhile. A patch made to those during the build is
+        # lost, so the version stays unset and the next request rebuilds.
+        patches = self._patches
+        games = list(Game.objects.values_list('id', 'approval'))
+        game_ids = [game_id for game_id, _ in games]
+        game_index = {game_id: i for i, game_id in enumerate(game_ids)}
+        category_index = {category_id: j for j, category_id in enumerate(Category.objects.values_list('id', flat=True))}
+        matrix = np.zeros((len(game_ids), len(category_index)), dtype=np.float32)
+        rows, cols = [], []
+        for game_id, category_id in CategoryDetail.objects.values_list('game_id', 'category_id'):
+            if game_id in game_index and category_id in category_index:
+                rows.append(game_index[game_id])
+                cols.append(category_index[category_id])
+        matrix[rows, cols] = 1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        with self._lock:
+            self.game_ids = game_ids
+            self.game_index = game_index
+            self.category_index = category_index
+            self.matrix = matrix
+            self.normalized = matrix / norms
+            self.approved = np.array([approval == 'APPROVED' for _, approval in games], dtype=bool)
+            self._version = version if self._patches == patches else None
+            self._stale = False
+
+    def _normalize(self, rows):
+        norms = np.linalg.norm(self.matrix[rows], axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.normalized[rows] = self.matrix[rows] / norms
+
+    def set_category(self, game_id, category_id, value):
+        with self._lock:
+            if self._stale:
+                return
+            i = self.game_index.get(game_id)
+            j = self.category_index.get(category_id)
+            if i is None or j is None:
+                self.invalidate()
+                return
+            self.matrix[i, j] = value
+            self._normalize([i])
+            self._patches += 1
+
+    def set_approval(self, game_id, approved):
+        # Returns False when the approval did not change
+        with self._lock:
+            if self._stale:
+                return True
+            i = self.game_index.get(game_id)
+            if i is None:
+                self.invalidate()
+                return True
+            if self.approved[i] == approved:
+                return False
+            self.approved[i] = approved
+            self._patches += 1
+            return True
+
+    def profile(self, weighted_game_ids):
+        # Weighted average of the category vectors of the given games
+        self.ensure_built()
+        profile = np.zeros(self.matrix.shape[1], dtype=np.float32)
+        total_weight = 0.0
+        for game_id, weight in weighted_game_ids:
+            i = self.game_index.get(game_id)
+            if i is not None:
+                profile += self.matrix[i] * weight
+            total_weight += weight
+        if total_weight > 0:
+            profile /= total_weight
+        return profile
+
+    def snapshot(self):
+        self.ensure_built()
+        with self._lock:
+            return self.game_ids, self.game_index, self.matrix, self.normalized, self.approved.copy()
+
+    def top_k(self, profile, exclude_game_ids, k=5):
+        # Cosine similarity of every approved game against the profile,
+        # excluding the given games; returns up to k game ids, best first
+        game_ids, game_index, _, normalized, candidates = self.snapshot()
+        for game_id in exclude_game_ids:
+            i = game_index.get(game_id)
+            if i is not None:
+                candidates[i] = False
+        top = rank_top_k(normalized, candidates[np.newaxis, :], profile[np.newaxis, :], k)[0]
+        return [game_ids[i] for i in top]
+
+
+def rank_top_k(normalized, candidates, profiles, k):
+    # profiles: (users x categories), candidates: (users x games) bool mask.
+    # Returns, per user, the row indexes of the k best candidate games.
+    norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    scores = (profiles / norms) @ normalized.T
+    scores = np.where(candidates, scores, -np.inf)
+    results = []
+    for row, count in zip(scores, candidates.sum(axis=1)):
+        kk = min(k, int(count))
+        if not kk:
+            results.append(np.zeros(0, dtype=np.int64))
+            continue
+        top = np.argpartition(-row, kk - 1)[:kk]
+        results.append(top[np.argsort(-row[top], kind='stable')])
+    return results
+
+
+game_feature_matrix = GameFeatureMatrix()
@@ -0,0 +1,206 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from apps.game.models import Game
+from apps.useraccount.models import User
+
+from .models import AccessGameHistory
+
+logger = logging.getLogger(__name__)
+
+# Game page views are queued here instead of being written by the request.
+# Repeated (user, game) hits are coalesced and a background thread flushes
+# them to AccessGameHistory in one bulk upsert every FLUSH_INTERVAL_MS. A
+# failed flush is requeued; after MAX_RETRIES failures in a row the queue is
+# written one (user, game) pair at a time and the pairs that fail on their
+# own are logged and dropped (counted as dead_lettered), so one bad row
+# cannot hold the queue forever.
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL_MS': 500,
+    'MAX_PENDING': 10000,
+    'MAX_RETRIES': 8,
+}
+
+
+def buffer_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'RECOMMENDATION_ACCESS_BUFFER', {})}
+
+
+class AccessEventBuffer:
+    def __init__(self, flush_interval_ms, max_pending, max_retries):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {}  # (user_id, game_id) -> [hits, last accessed_at]
+        self._pending_events = 0
+        self._thread = None
+        self._pid = None
+        self._accepted = 0
+        self._dropped = 0
+        self._invalid = 0
+        self._failures = 0
+        self._attempts = 0
+        self._dead_lettered = 0
+        self._flushes = 0
+        self._flushed_events = 0
+        self._flushed_rows = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def add(self, user_id, game_id):
+        # Returns False when the buffer is full and the event was dropped
+        self._ensure_worker()
+        key = (str(user_id), str(game_id))
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                if len(self._pending) >= self.max_pending:
+                    self._dropped += 1
+                    return False
+                self._pending[key] = [1, timezone.now()]
+            else:
+                entry[0] += 1
+                entry[1] = timezone.now()
+            self._pending_events += 1
+            self._accepted += 1
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+        return True
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                events, self._pending_events = self._pending_events, 0
+            if not pending:
+                return 0
+            started = time.perf_counter()
+            try:
+                rows = self._write(pending)
+                self._attempts = 0
+            except Exception:
+                self._attempts += 1
+                with self._lock:
+                    self._failures += 1
+                if self._attempts < self.max_retries:
+                    self._requeue(pending)
+                    raise
+                logger.exception('Failed to write access events %d times, writing them one by one', self._attempts)
+                self._attempts = 0
+                rows = self._write_each(pending)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._flushes += 1
+                self._flushed_events += events
+                self._flushed_rows += rows
+                self._last_flush_ms = elapsed_ms
+                self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+                self._total_flush_ms += elapsed_ms
+            return rows
+
+    def _requeue(self, pending):
+        with self._lock:
+            for key, (hits, accessed_at) in pending.items():
+                entry = self._pending.get(key)
+                if entry is not None:
+                    entry[0] += hits
+                elif len(self._pending) < self.max_pending:
+                    self._pending[key] = [hits, accessed_at]
+                else:
+                    self._dropped += hits
+                    continue
+                self._pending_events += hits
+
+    def _write_each(self, pending):
+        # Last resort for a batch that keeps failing
+        rows = 0
+        for (user_id, game_id), entry in pending.items():
+            try:
+                rows += self._write({(user_id, game_id): entry})
+            except Exception:
+                logger.exception('Dropped %d access events of user %s for game %s', entry[0], user_id, game_id)
+                with self._lock:
+                    self._dead_lettered += entry[0]
+        return rows
+
+    def _write(self, pending):
+        # Events for deleted games/users would fail the whole bulk upsert on
+        # the foreign keys, so drop them up front
+        user_ids = {user_id for user_id, _ in pending}
+        game_ids = {game_id for _, game_id in pending}
+        valid_users = {str(pk) for pk in User.objects.filter(id__in=user_ids).values_list('id', flat=True)}
+        valid_games = {str(pk) for pk in Game.objects.filter(id__in=game_ids).values_list('id', flat=True)}
+        events = [
+            (user_id, game_id, hits, accessed_at)
+            for (user_id, game_id), (hits, accessed_at) in pending.items()
+            if user_id in valid_users and game_id in valid_games
+        ]
+        with self._lock:
+            self._invalid += len(pending) - len(events)
+        AccessGameHistory.objects.record_accesses(events)
+        return len(events)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'queue_depth': len(self._pending),
+                'pending_events': self._pending_events,
+                'accepted': self._accepted,
+                'dropped': self._dropped,
+                'invalid': self._invalid,
+                'failures': self._failures,
+                'dead_lettered': self._dead_lettered,
+                'flushes': self._flushes,
+                'flushed_events': self._flushed_events,
+                'flushed_rows': self._flushed_rows,
+                'last_flush_ms': round(self._last_flush_ms, 3),
+                'max_flush_ms': round(self._max_flush_ms, 3),
+                'avg_flush_ms': round(self._total_flush_ms / self._flushes, 3) if self._flushes else 0.0,
+            }
+
+    def _ensure_worker(self):
+        # (Re)start the flusher lazily, also after a fork into a new worker
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='access-event-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush access events')
+            finally:
+                close_old_connections()
+
+
+_config = buffer_settings()
+access_event_buffer = AccessEventBuffer(_config['FLUSH_INTERVAL_MS'], _config['MAX_PENDING'], _config['MAX_RETRIES'])
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        access_event_buffer.flush()
+    except Exception:
+        logger.exception('Failed to flush access events on shutdown')
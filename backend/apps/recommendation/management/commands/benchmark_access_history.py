@@ -0,0 +1,124 @@
+import datetime
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.game.models import Game
+from apps.recommendation.models import HISTORY_SIZE, AccessGameHistory
+from apps.useraccount.models import User
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def is_write(sql):
+    # executemany is logged as "<n> times: <sql>"
+    return sql.split(' times: ', 1)[-1].lstrip().upper().startswith(WRITES)
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_record_access(user_id, game_id):
+    # The view before user-006: get or create, count and trim, then rewrite
+    # every history row to apply the decay
+    game = Game.objects.get(id=game_id)
+    user = User.objects.get(id=user_id)
+    try:
+        history = AccessGameHistory.objects.get(user=user, game=game)
+        history.weight += 1
+        history.save()
+    except AccessGameHistory.DoesNotExist:
+        history = AccessGameHistory(user=user, game=game, weight=1)
+        history.save()
+    user_histories = AccessGameHistory.objects.filter(user=user).order_by('-updated_at')
+    if user_histories.count() > HISTORY_SIZE:
+        ids_to_delete = list(user_histories.values_list('id', flat=True)[HISTORY_SIZE:])
+        AccessGameHistory.objects.filter(id__in=ids_to_delete).delete()
+    histories = AccessGameHistory.objects.filter(user=user).order_by('-updated_at')
+    if histories.exists():
+        max_date = histories.first().updated_at.timestamp()
+        for history in histories:
+            time_diff_days = (max_date - history.updated_at.timestamp()) / (24 * 3600)
+            history.weight = max(history.weight / (time_diff_days + 1), 1.0)
+            history.save()
+
+
+class Command(BaseCommand):
+    help = 'Compare queries and writes per game view for the access history paths (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--games', type=int, default=15)
+        parser.add_argument('--views', type=int, default=30, help='Views per user')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['users'], options['games'], options['views'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, user_count, game_count, views):
+        publisher = User.objects.create(
+            email=f'bench-{uuid.uuid4().hex}@example.com', username=f'bench-{uuid.uuid4().hex[:8]}',
+            avatar='uploads/avatars/bench.png', role='PUBLISHER')
+        games = Game.objects.bulk_create([
+            Game(title=f'Benchmark game {uuid.uuid4().hex}', description='Benchmark', price=9.99,
+                 publisher=publisher, image='uploads/games/bench.png', publish_year=datetime.date(2020, 1, 1),
+                 approval='APPROVED')
+            for _ in range(game_count)
+        ])
+        self.stdout.write(f'{user_count} users x {views} views over {game_count} games, history size {HISTORY_SIZE}')
+
+        def create_users(name):
+            return User.objects.bulk_create([
+                User(email=f'{name}-{uuid.uuid4().hex}@example.com', username=f'{name}-{uuid.uuid4().hex[:8]}')
+                for _ in range(user_count)
+            ])
+
+        def events(users):
+            # Cycle each user through more games than the history keeps so the
+            # trim runs once the history is full
+            return [(user.id, games[view % game_count].id) for view in range(views) for user in users]
+
+        def legacy(users):
+            return [lambda user_id=user_id, game_id=game_id: legacy_record_access(user_id, game_id)
+                    for user_id, game_id in events(users)]
+
+        def upsert(users):
+            return [lambda user_id=user_id, game_id=game_id: AccessGameHistory.objects.record_access(user_id, game_id)
+                    for user_id, game_id in events(users)]
+
+        def buffered(users):
+            # What the ingest buffer flushes: one record_accesses call per batch
+            now = timezone.now()
+            batch = [
+                (user_id, game_id, 1, now + datetime.timedelta(microseconds=index))
+                for index, (user_id, game_id) in enumerate(events(users))
+            ]
+            return [lambda: AccessGameHistory.objects.record_accesses(batch)]
+
+        total = user_count * views
+        for name, calls in [('legacy', legacy), ('upsert', upsert), ('buffered', buffered)]:
+            users = create_users(name)
+            query_count = writes = 0
+            elapsed = 0.0
+            for call in calls(users):
+                # The connection only keeps the last 9000 queries
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    call()
+                    elapsed += time.perf_counter() - started
+                query_count += len(queries)
+                writes += sum(1 for query in queries if is_write(query['sql']))
+            kept = AccessGameHistory.objects.filter(user__in=users).count()
+            self.stdout.write(
+                f'{name:>10}: {query_count / total:6.2f} queries/view, {writes / total:6.2f} writes/view, '
+                f'{elapsed / total * 1000:7.3f} ms/view, {kept} rows kept')
@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.recommendation.features import game_feature_matrix
+from apps.recommendation.models import AccessGameHistory
+from apps.recommendation.store import (
+    TOP_N, build_batch, init_worker, load_histories, load_purchases,
+    rank_batch, rank_batch_in_worker, save_results,
+)
+
+
+class Command(BaseCommand):
+    help = 'Compute top-N game recommendations for every active user with access history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--top-n', type=int, default=TOP_N)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        top_n = options['top_n']
+        started = time.perf_counter()
+
+        game_feature_matrix.invalidate()
+        game_ids, game_index, matrix, normalized, approved = game_feature_matrix.snapshot()
+        user_ids = list(
+            AccessGameHistory.objects.filter(user__is_active=True)
+            .values_list('user_id', flat=True).distinct().order_by('user_id')
+        )
+        batches = [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)]
+        self.stdout.write(f'{len(user_ids)} users, {len(game_ids)} games, {len(batches)} batches, {options["workers"]} workers')
+
+        # Workers only do the numpy scoring; reading histories and writing
+        # results stay in this process so the pool never touches the database
+        prepared = []
+        for batch in batches:
+            histories = load_histories(batch)
+            purchases = load_purchases(batch)
+            prepared.append((batch, histories, build_batch(batch, histories, purchases, game_index, matrix)))
+        loaded = time.perf_counter()
+
+        jobs = [(profiles, exclude_users, exclude_games, top_n) for _, _, (profiles, exclude_users, exclude_games) in prepared]
+        if options['workers'] > 1 and len(jobs) > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(options['workers'], initializer=init_worker, initargs=(normalized, approved)) as pool:
+                results = list(pool.map(rank_batch_in_worker, jobs))
+        else:
+            results = [rank_batch(normalized, approved, *job) for job in jobs]
+        scored = time.perf_counter()
+
+        for (batch, histories, _), batch_results in zip(prepared, results):
+            save_results(batch, batch_results, histories, game_ids)
+        finished = time.perf_counter()
+
+        total = finished - started
+        self.stdout.write(
+            f'load {loaded - started:.2f}s, score {scored - loaded:.2f}s, save {finished - scored:.2f}s'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Computed recommendations for {len(user_ids)} users in {total:.2f}s '
+            f'({len(user_ids) / total if total else 0:.0f} users/sec, scoring {len(user_ids) / (scored - loaded) if scored > loaded else 0:.0f} users/sec)'
+        ))
@@ -1,13 +1,59 @@
 import uuid
 
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.db import models, connection, transaction
+from django.utils import timezone
+from django.db.models import F, UniqueConstraint, Window
+from django.db.models.functions import RowNumber
 from django.core.validators import MinValueValidator
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
-from apps.game.models import Game
+from apps.game.models import Game, Category, CategoryDetail
 from apps.useraccount.models import User
 
+from .features import game_feature_matrix
+
+HISTORY_SIZE = 10
+
 # Create your models here.
+class AccessGameHistoryManager(models.Manager):
+    def record_access(self, user_id, game_id):
+        self.record_accesses([(user_id, game_id, 1, timezone.now())])
+
+    def record_accesses(self, events):
+        # events: (user_id, game_id, hits, accessed_at). One upsert adds the
+        # hits to each counter, one delete keeps every user's newest
+        # HISTORY_SIZE rows; the time decay is applied when reading
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        fields = {field.name: field for field in self.model._meta.concrete_fields}
+        params = [
+            (
+                fields['id'].get_db_prep_value(uuid.uuid4(), connection),
+                fields['game'].get_db_prep_value(game_id, connection),
+                fields['user'].get_db_prep_value(user_id, connection),
+                hits,
+                fields['created_at'].get_db_prep_value(accessed_at, connection),
+                fields['updated_at'].get_db_prep_value(accessed_at, connection),
+            )
+            for user_id, game_id, hits, accessed_at in events
+        ]
+        if not params:
+            return
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO {table} (id, game_id, user_id, weight, created_at, updated_at) '
+                    f'VALUES (%s, %s, %s, %s, %s, %s) '
+                    f'ON CONFLICT (game_id, user_id) DO UPDATE '
+                    f'SET weight = {table}.weight + excluded.weight, updated_at = excluded.updated_at',
+                    params,
+                )
+            user_ids = {user_id for user_id, _, _, _ in events}
+            ranked = self.filter(user_id__in=user_ids).annotate(
+                position=Window(RowNumber(), partition_by=[F('user_id')], order_by=F('updated_at').desc())
+            ).filter(position__gt=HISTORY_SIZE).values_list('id', flat=True)
+            self.filter(id__in=list(ranked)).delete()
+
 class AccessGameHistory(models.Model):
     class Meta:
         constraints = [
@@ -21,5 +67,45 @@ class AccessGameHistory(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AccessGameHistoryManager()
+    
     def __str__(self):
-        return f"{self.user.username} - {self.game.title}"
\ No newline at end of file
+        return f"{self.user.username} - {self.game.title}"
+
+def decayed_weight(weight, updated_at, latest):
+    # Linear decay by days between this access and the user's latest one
+    time_diff_days = (latest - updated_at).total_seconds() / (24 * 3600)
+    return max(weight / (time_diff_days + 1), 1.0)
+
+class UserRecommendation(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='recommendation')
+    game_ids = models.JSONField(default=list)
+    version = models.IntegerField(default=0)
+    history_updated_at = models.DateTimeField(null=True, blank=True)
+    computed_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Recommendations for {self.user.username}"
+
+@receiver(post_save, sender=CategoryDetail)
+def update_feature_matrix_on_category_save(sender, instance, **kwargs):
+    game_feature_matrix.set_category(instance.game_id, instance.category_id, 1.0)
+    transaction.on_commit(game_feature_matrix.changed)
+
+@receiver(post_delete, sender=CategoryDetail)
+def update_feature_matrix_on_category_delete(sender, instance, **kwargs):
+    game_feature_matrix.set_category(instance.game_id, instance.category_id, 0.0)
+    transaction.on_commit(game_feature_matrix.changed)
+
+@receiver(post_save, sender=Game)
+def update_feature_matrix_on_game_save(sender, instance, **kwargs):
+    if game_feature_matrix.set_approval(instance.id, instance.approval == 'APPROVED'):
+        transaction.on_commit(game_feature_matrix.changed)
+
+@receiver(post_delete, sender=Game)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_feature_matrix(sender, instance, **kwargs):
+    game_feature_matrix.invalidate()
+    transaction.on_commit(game_feature_matrix.changed)
@@ -0,0 +1,123 @@
+from collections import defaultdict
+
+import numpy as np
+
+from apps.game.models import Order
+
+from .features import game_feature_matrix, rank_top_k
+from .models import HISTORY_SIZE, AccessGameHistory, UserRecommendation, decayed_weight
+
+# Bump when the scoring changes so every stored result is recomputed
+RECOMMENDATION_VERSION = 2
+TOP_N = 5
+
+
+def load_histories(user_ids):
+    # user_id -> [(game_id, decayed weight, updated_at)], newest first
+    histories = defaultdict(list)
+    rows = AccessGameHistory.objects.filter(user_id__in=user_ids).order_by('user_id', '-updated_at')
+    for user_id, game_id, weight, updated_at in rows.values_list('user_id', 'game_id', 'weight', 'updated_at'):
+        history = histories[user_id]
+        if len(history) < HISTORY_SIZE:
+            latest = history[0][2] if history else updated_at
+            history.append((game_id, decayed_weight(weight, updated_at, latest), updated_at))
+    return histories
+
+
+def load_purchases(user_ids):
+    purchases = defaultdict(set)
+    rows = Order.objects.filter(user_id__in=user_ids, status='PAID').values_list('user_id', 'game_id')
+    for user_id, game_id in rows:
+        purchases[user_id].add(game_id)
+    return purchases
+
+
+def build_batch(user_ids, histories, purchases, game_index, matrix):
+    # One profile row per user plus the (user row, game row) pairs to skip:
+    # games the user already opened or bought
+    profile_rows, game_rows, weights = [], [], []
+    exclude_users, exclude_games = [], []
+    totals = np.zeros(len(user_ids), dtype=np.float32)
+    for r, user_id in enumerate(user_ids):
+        for game_id, weight, _ in histories.get(user_id, []):
+            totals[r] += weight
+            i = game_index.get(game_id)
+            if i is None:
+                continue
+            profile_rows.append(r)
+            game_rows.append(i)
+            weights.append(weight)
+            exclude_users.append(r)
+            exclude_games.append(i)
+        for game_id in purchases.get(user_id, ()):
+            i = game_index.get(game_id)
+            if i is not None:
+                exclude_users.append(r)
+                exclude_games.append(i)
+    profiles = np.zeros((len(user_ids), matrix.shape[1]), dtype=np.float32)
+    if profile_rows:
+        np.add.at(profiles, profile_rows, matrix[game_rows] * np.array(weights, dtype=np.float32)[:, np.newaxis])
+    totals[totals == 0] = 1.0
+    profiles /= totals[:, np.newaxis]
+    return profiles, np.array(exclude_users, dtype=np.int64), np.array(exclude_games, dtype=np.int64)
+
+
+def rank_batch(normalized, approved, profiles, exclude_users, exclude_games, k):
+    candidates = np.repeat(approved[np.newaxis, :], len(profiles), axis=0)
+    candidates[exclude_users, exclude_games] = False
+    return rank_top_k(normalized, candidates, profiles, k)
+
+
+# Process pool workers receive the matrix once, through the initializer
+_worker_state = {}
+
+
+def init_worker(normalized, approved):
+    _worker_state['normalized'] = normalized
+    _worker_state['approved'] = approved
+
+
+def rank_batch_in_worker(args):
+    profiles, exclude_users, exclude_games, k = args
+    return rank_batch(_worker_state['normalized'], _worker_state['approved'], profiles, exclude_users, exclude_games, k)
+
+
+def save_results(user_ids, results, histories, game_ids):
+    UserRecommendation.objects.bulk_create(
+        [
+            UserRecommendation(
+                user_id=user_id,
+                game_ids=[str(game_ids[i]) for i in top],
+                version=RECOMMENDATION_VERSION,
+                history_updated_at=histories[user_id][0][2] if histories.get(user_id) else None,
+            )
+            for user_id, top in zip(user_ids, results)
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['game_ids', 'version', 'history_updated_at', 'computed_at'],
+    )
+
+
+def compute_live(user_id, histories, k=TOP_N):
+    game_ids, game_index, matrix, normalized, approved = game_feature_matrix.snapshot()
+    purchases = load_purchases([user_id])
+    profiles, exclude_users, exclude_games = build_batch([user_id], histories, purchases, game_index, matrix)
+    results = rank_batch(normalized, approved, profiles, exclude_users, exclude_games, k)
+    save_results([user_id], results, histories, game_ids)
+    return [game_ids[i] for i in results[0]]
+
+
+def get_recommended_game_ids(user_id):
+    # Serve the precomputed result unless the user's history moved since
+    histories = load_histories([user_id])
+    if not histories.get(user_id):
+        return []
+    stored = UserRecommendation.objects.filter(user_id=user_id).first()
+    if (
+        stored is not None
+        and stored.version == RECOMMENDATION_VERSION
+        and stored.history_updated_at == histories[user_id][0][2]
+    ):
+        return stored.game_ids
+    return compute_live(user_id, histories)
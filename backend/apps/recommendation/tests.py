@@ -1,3 +1,238 @@
-from django.test import TestCase
+import datetime
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.game.models import Category, CategoryDetail, Game
+from apps.useraccount.models import User
+
+from . import ingest
+from .features import GameFeatureMatrix
+from .ingest import AccessEventBuffer
+from .models import HISTORY_SIZE, AccessGameHistory, UserRecommendation
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.publisher = User.objects.create(email='publisher@example.com', username='publisher', password='pbkdf2_sha256$x', role='PUBLISHER')
+        self.user = User.objects.create(email='player@example.com', username='player', password='pbkdf2_sha256$x')
+        category = Category.objects.create(title='Action', description='Action games')
+        self.games = []
+        for number in range(4):
+            game = Game.objects.create(
+                title=f'Game {number}', description='An action game', price=10, publisher=self.publisher,
+                publish_year=datetime.date(2020, 1, 1), approval='APPROVED', image='uploads/games/game.png',
+            )
+            CategoryDetail.objects.create(game=game, category=category)
+            self.games.append(game)
+        AccessGameHistory.objects.record_access(self.user.id, self.games[0].id)
+
+    def recommended(self):
+        response = self.client.get(f'/api/recommendation/{self.user.id}/')
+        self.assertEqual(response.status_code, 200)
+        return {game['id'] for game in response.json()['data']}
+
+    def test_games_no_longer_approved_are_not_served(self):
+        self.assertEqual(self.recommended(), {str(game.id) for game in self.games[1:]})
+        rejected = self.games[1]
+        rejected.approval = 'REJECTED'
+        rejected.save()
+
+        self.assertIn(str(rejected.id), UserRecommendation.objects.get(user=self.user).game_ids)
+        self.assertEqual(self.recommended(), {str(game.id) for game in self.games[2:]})
+
+
+class RecordAccessTests(TestCase):
+    def setUp(self):
+        self.publisher = User.objects.create(email='publisher@example.com', username='publisher', password='pbkdf2_sha256$x', role='PUBLISHER')
+        self.user = User.objects.create(email='player@example.com', username='player', password='pbkdf2_sha256$x')
+        self.games = [
+            Game.objects.create(
+                title=f'Game {number}', description='An action game', price=10, publisher=self.publisher,
+                publish_year=datetime.date(2020, 1, 1), approval='APPROVED', image='uploads/games/game.png',
+            )
+            for number in range(HISTORY_SIZE + 2)
+        ]
+
+    def history(self):
+        return dict(AccessGameHistory.objects.filter(user=self.user).values_list('game_id', 'weight'))
+
+    def test_repeated_access_adds_to_one_row(self):
+        for _ in range(3):
+            AccessGameHistory.objects.record_access(self.user.id, self.games[0].id)
+        AccessGameHistory.objects.record_access(self.user.id, self.games[1].id)
+
+        self.assertEqual(self.history(), {self.games[0].id: 3, self.games[1].id: 1})
+
+    def test_history_keeps_the_newest_games(self):
+        for game in self.games[:HISTORY_SIZE + 1]:
+            AccessGameHistory.objects.record_access(self.user.id, game.id)
+        self.assertEqual(set(self.history()), {game.id for game in self.games[1:HISTORY_SIZE + 1]})
+
+        # A revisit moves the game to the front, so the next trim drops game 2
+        AccessGameHistory.objects.record_access(self.user.id, self.games[1].id)
+        AccessGameHistory.objects.record_access(self.user.id, self.games[-1].id)
+        self.assertEqual(set(self.history()), {game.id for game in self.games[1:] if game != self.games[2]})
+
+
+class AccessEventBufferTests(TestCase):
+    def setUp(self):
+        self.publisher = User.objects.create(email='publisher@example.com', username='publisher', password='pbkdf2_sha256$x', role='PUBLISHER')
+        self.user = User.objects.create(email='player@example.com', username='player', password='pbkdf2_sha256$x')
+        self.games = [
+            Game.objects.create(
+                title=f'Game {number}', description='An action game', price=10, publisher=self.publisher,
+                publish_year=datetime.date(2020, 1, 1), approval='APPROVED', image='uploads/games/game.png',
+            )
+            for number in range(3)
+        ]
+        # Flushes are driven by the tests, not by the background thread
+        patcher = mock.patch.object(AccessEventBuffer, '_ensure_worker')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def history(self):
+        return dict(AccessGameHistory.objects.filter(user=self.user).values_list('game_id', 'weight'))
+
+    def test_flush_writes_coalesced_events(self):
+        buffer = AccessEventBuffer(500, 100, 3)
+        for game in (self.games[0], self.games[0], self.games[1]):
+            self.assertTrue(buffer.add(self.user.id, game.id))
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(self.history(), {self.games[0].id: 2, self.games[1].id: 1})
+        self.assertEqual(buffer.flush(), 0)
+        metrics = buffer.metrics()
+        self.assertEqual((metrics['queue_depth'], metrics['flushed_events'], metrics['flushed_rows']), (0, 3, 2))
+
+    def test_full_buffer_drops_new_pairs(self):
+        buffer = AccessEventBuffer(500, 2, 3)
+        self.assertTrue(buffer.add(self.user.id, self.games[0].id))
+        self.assertTrue(buffer.add(self.user.id, self.games[1].id))
+        self.assertTrue(buffer._wakeup.is_set())
+
+        # Known pairs still coalesce, a new one is refused
+        self.assertTrue(buffer.add(self.user.id, self.games[0].id))
+        self.assertFalse(buffer.add(self.user.id, self.games[2].id))
+        self.assertEqual(buffer.metrics()['dropped'], 1)
+        buffer.flush()
+        self.assertTrue(buffer.add(self.user.id, self.games[2].id))
+
+    def test_full_buffer_answers_503(self):
+        full = AccessEventBuffer(500, 0, 3)
+        with mock.patch('apps.recommendation.api.access_event_buffer', full):
+            response = self.client.post(
+                f'/api/recommendation/{self.user.id}/{self.games[0].id}/',
+                {'user_id': str(self.user.id), 'game_id': str(self.games[0].id)}, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+
+    def test_failing_flush_is_requeued_then_written_pair_by_pair(self):
+        buffer = AccessEventBuffer(500, 100, 2)
+        for game in self.games[:2]:
+            buffer.add(self.user.id, game.id)
+        record_accesses = AccessGameHistory.objects.record_accesses
+
+        def flaky(events):
+            if len(events) > 1 or events[0][1] == str(self.games[0].id):
+                raise DatabaseError('cannot write')
+            return record_accesses(events)
+
+        with mock.patch.object(AccessGameHistory.objects, 'record_accesses', flaky), \
+                self.assertLogs('apps.recommendation.ingest', 'ERROR'):
+            with self.assertRaises(DatabaseError):
+                buffer.flush()
+            self.assertEqual(buffer.metrics()['pending_events'], 2)
+            self.assertEqual(buffer.flush(), 1)
+
+        self.assertEqual(self.history(), {self.games[1].id: 1})
+        metrics = buffer.metrics()
+        self.assertEqual((metrics['pending_events'], metrics['failures'], metrics['dead_lettered']), (0, 2, 1))
+
+    def test_shutdown_flushes_the_queue(self):
+        buffer = AccessEventBuffer(500, 100, 3)
+        buffer.add(self.user.id, self.games[0].id)
+        with mock.patch('apps.recommendation.ingest.access_event_buffer', buffer):
+            ingest._flush_on_exit()
+
+        self.assertEqual(self.history(), {self.games[0].id: 1})
+
+    def test_metrics_need_an_admin(self):
+        url = '/api/recommendation/ingest/metrics/'
+        admin = User.objects.create(email='admin@example.com', username='admin', password='pbkdf2_sha256$x', role='ADMIN')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}').status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admin)}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('dead_lettered', response.json()['data'])
+
+
+class FeatureMatrixTests(TestCase):
+    def setUp(self):
+        publisher = User.objects.create(email='publisher@example.com', username='publisher', password='pbkdf2_sha256$x', role='PUBLISHER')
+        self.game = Game.objects.create(
+            title='Game', description='An action game', price=10, publisher=publisher,
+            publish_year=datetime.date(2020, 1, 1), approval='APPROVED', image='uploads/games/game.png',
+        )
+        self.category = Category.objects.create(title='Action', description='Action games')
+        # A cache directory of its own, so the versions only reach this
+        # process's matrix through the files
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_patcher = override_settings(CACHES={
+            **settings.CACHES,
+            'responses': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.directory},
+        })
+        settings_patcher.enable()
+        self.addCleanup(settings_patcher.disable)
+        # Stands for the matrix of another worker process
+        self.worker = GameFeatureMatrix()
+        self.worker.ensure_built()
+        patcher = mock.patch.object(self.worker, 'rebuild_async')
+        self.rebuild_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def approved(self):
+        game_ids, _, _, _, approved = self.worker.snapshot()
+        return [game_id for game_id, flag in zip(game_ids, approved) if flag]
+
+    def test_other_workers_rebuild_after_a_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game.approval = 'REJECTED'
+            self.game.save()
+
+        # The current matrix is served while the rebuild runs
+        self.assertEqual(self.approved(), [self.game.id])
+        self.rebuild_async.assert_called_once()
+        self.worker.rebuild()
+        self.assertEqual(self.approved(), [])
+
+    def test_worker_serves_its_patch_until_the_rebuild(self):
+        self.worker.set_category(self.game.id, self.category.id, 1.0)
+        self.worker.changed()
+
+        np.testing.assert_array_equal(self.worker.profile([(self.game.id, 1.0)]), [1.0])
+        self.rebuild_async.assert_called_once()
+
+    def test_bump_from_another_process_triggers_a_rebuild(self):
+        subprocess.run(
+            [sys.executable, '-c', (
+                'import django; django.setup(); '
+                'from apps.game.response_cache import bump_shared_version; '
+                'from apps.recommendation.features import VERSION_NAME; '
+                'bump_shared_version(VERSION_NAME)'
+            )],
+            cwd=settings.BASE_DIR, check=True,
+            env={**os.environ, 'RESPONSE_CACHE_URL': self.directory, 'DJANGO_SETTINGS_MODULE': 'backend_project.settings'},
+        )
+
+        self.approved()
+        self.rebuild_async.assert_called_once()
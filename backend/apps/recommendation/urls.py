@@ -4,4 +4,5 @@ from . import api
 urlpatterns = [
     path('<uuid:userId>/<uuid:gameId>/', api.update_access_history, name='api_update_access_history'),
     path('<uuid:userId>/', api.get_recommendations, name='api_get_recommendations'),
+    path('ingest/metrics/', api.access_event_metrics, name='api_access_event_metrics'),
 ]
@@ -6,6 +6,10 @@ from rest_framework.authentication import TokenAuthentication
 
 from .models import User
 from .serializers import UserDetailSerializer
+from .filters import filter_users
+from backend_project.exports import export_response
+from backend_project.permissions import IsAdminRole
+from backend_project.pagination import admin_page, wants_page
 
 
 @api_view(['GET'])
@@ -151,12 +155,30 @@ def user_register(request):
 @permission_classes([])
 def get_users(request):
     try:
-        users = User.objects.all()
+        users = filter_users(request, User.objects.all())
+        if wants_page(request.GET):
+            page, meta = admin_page(users, request.GET, 'date_joined', True)
+            serializer = UserDetailSerializer(page, many=True)
+            return JsonResponse({'data': serializer.data, **meta})
         serializer = UserDetailSerializer(users, many=True)
         return JsonResponse({'data': serializer.data})
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+@api_view(['GET'])
+@permission_classes([IsAdminRole])
+def export_users(request):
+    try:
+        users = filter_users(request, User.objects.all())
+        return export_response(request, users, [
+            ('id', 'id'), ('email', 'email'), ('username', 'username'), ('role', 'role'),
+            ('is_active', 'is_active'), ('date_joined', 'date_joined'), ('last_login', 'last_login'),
+        ], 'users')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
 @api_view(['POST'])
 @authentication_classes([])
 @permission_classes([])
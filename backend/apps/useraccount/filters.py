@@ -0,0 +1,11 @@
+from backend_project.filters import filter_param
+
+
+def filter_users(request, users):
+    role = filter_param(request, 'role')
+    if role:
+        users = users.filter(role=role)
+    is_active = filter_param(request, 'is_active', {'true': True, 'false': False}.get)
+    if is_active is not None:
+        users = users.filter(is_active=is_active)
+    return users
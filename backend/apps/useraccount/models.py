@@ -16,6 +16,11 @@ class CustomUserManager(UserManager):
 
 
 class User(AbstractUser):
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['-date_joined', '-id'], name='user_date_joined_idx')
+        ]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     email = models.EmailField(unique=True)
     username = models.CharField(
@@ -12,4 +12,13 @@ class UserDetailSerializer(serializers.ModelSerializer):
             'avatar_url',
             'is_active',
             'role'
+        ]
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = [
+            'id',
+            'username',
+            'avatar_url'
         ]
\ No newline at end of file
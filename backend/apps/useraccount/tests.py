@@ -1,3 +1,72 @@
+import json
+
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend_project.pagination import encode_cursor
+
+from .models import User
+
+
+def create_user(name, role='USER'):
+    return User.objects.create(email=f'{name}@example.com', username=name, password='pbkdf2_sha256$x', role=role)
+
+
+class ExportUsersTests(TestCase):
+    def setUp(self):
+        self.admin = create_user('admin', role='ADMIN')
+        self.users = [create_user(f'user{number}') for number in range(3)]
+        self.ids = sorted(str(user.id) for user in [self.admin, *self.users])
+
+    def export(self, user=None, **params):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'} if user else {}
+        return self.client.get('/api/auth/users/export/', params, **headers)
+
+    def lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_export_needs_an_admin(self):
+        self.assertEqual(self.export().status_code, 401)
+        self.assertEqual(self.export(self.users[0]).status_code, 403)
+
+    def test_streams_and_resumes(self):
+        rows = [json.loads(line) for line in self.lines(self.export(self.admin))]
+        self.assertEqual([row['id'] for row in rows], self.ids)
+        self.assertNotIn('password', rows[0])
+
+        rows = self.lines(self.export(self.admin, cursor=self.ids[1], export_format='csv'))
+        self.assertEqual([row.split(',', 1)[0] for row in rows], self.ids[2:])
+
+    def test_bad_export_format_is_rejected(self):
+        response = self.export(self.admin, export_format='xml')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid export_format: xml'})
+
+
+class UserPageTests(TestCase):
+    def setUp(self):
+        for number in range(5):
+            create_user(f'user{number}')
+        # Every user joined on the same instant, so only the id orders them
+        User.objects.update(date_joined=timezone.now())
+
+    def test_pages_cross_ties(self):
+        rows, cursor = [], ''
+        while True:
+            response = self.client.get('/api/auth/users/', {'page_size': 2, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            rows += response.json()['data']
+            cursor = response.json()['next_cursor']
+            if not cursor:
+                break
+        ids = sorted((str(user_id) for user_id in User.objects.values_list('id', flat=True)), reverse=True)
+        self.assertEqual([row['id'] for row in rows], ids)
+        self.assertEqual(response.json()['total'], {'count': 5, 'exact': True})
 
-# Create your tests here.
+    def test_tampered_cursor_is_rejected(self):
+        response = self.client.get('/api/auth/users/', {'cursor': encode_cursor('yesterday', User.objects.first().id)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid cursor'})
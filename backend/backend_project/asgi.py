@@ -11,7 +11,19 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_project.settings')
 application = get_asgi_application()
 
 from apps.chat import routing
+from apps.chat.persistence import install_signal_handlers
 from apps.chat.token_auth import TokenAuthMiddleware
+from apps.game.discounts import discount_refresher
+from apps.game.text_index import game_text_index
+from apps.recommendation.features import game_feature_matrix
+
+# Build the in-process indexes in the background instead of on the first request
+game_text_index.rebuild_async()
+game_feature_matrix.rebuild_async()
+# Apply promotions as they start and end
+discount_refresher.start()
+# Write the queued chat messages before a SIGTERM/SIGINT stops the process
+install_signal_handlers()
 
 application = ProtocolTypeRouter({
     'http': get_asgi_application(),
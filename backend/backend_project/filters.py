@@ -0,0 +1,13 @@
+def filter_param(request, key, parse=None):
+    # Parse a query-string filter, raising ValueError (a 400) on a bad value
+    # rather than letting the database reject it later, e.g. mid-stream
+    value = request.GET.get(key, '')
+    if not value or parse is None:
+        return value or None
+    try:
+        parsed = parse(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f'Invalid {key}')
+    return parsed
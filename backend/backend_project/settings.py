@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 from datetime import timedelta
 
@@ -28,12 +29,89 @@ SITE_ID = 1
 
 WEBSITE_URL = 'http://localhost:8000'
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# Chat groups are shared between daphne processes through a Redis-protocol
+# broker: redis://host:6379/0, or unix:///tmp/webgame-chat.sock for the local
+# stand-in started with `manage.py run_chat_broker`. Without one, chat only
+# reaches clients connected to the same process.
+CHAT_BROKER_URL = os.environ.get('CHAT_BROKER_URL', '')
+
+if CHAT_BROKER_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'apps.chat.layers.BrokerChannelLayer',
+            'CONFIG': {
+                'url': CHAT_BROKER_URL,
+                'capacity': 100,
+                'expiry': 60,
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
     }
+
+# Game page views are buffered in memory and flushed to AccessGameHistory in bulk
+RECOMMENDATION_ACCESS_BUFFER = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL_MS': 500,
+    'MAX_PENDING': 10000,
+    'MAX_RETRIES': 8,
+}
+
+# Chat messages are queued by ChatConsumer and written in bulk every
+# FLUSH_INTERVAL_MS; remaining ones are written on shutdown. Messages that
+# cannot be written go to DEAD_LETTER_PATH for `manage.py replay_chat_dead_letters`
+CHAT_MESSAGE_BUFFER = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL_MS': 20,
+    'MAX_BATCH': 500,
+    'MAX_PENDING': 10000,
+    'MAX_RETRIES': 8,
+    'DEAD_LETTER_PATH': os.environ.get('CHAT_DEAD_LETTER_PATH', str(BASE_DIR / 'chat_dead_letters.jsonl')),
 }
 
+# Public catalog responses, their invalidation tags and the version stamps of
+# the per-process indexes. It has to be shared by every worker or a change made
+# in one process leaves the others serving stale data: a directory on the host
+# by default, or Redis (redis://host:6379/1, needs the redis package) when the
+# workers run on several hosts. A per-process LocMemCache is rejected by
+# `manage.py check` once WEB_CONCURRENCY is above 1.
+RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL', '')
+
+if RESPONSE_CACHE_URL.startswith(('redis://', 'rediss://', 'unix://')):
+    RESPONSE_CACHE_BACKEND = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': RESPONSE_CACHE_URL,
+    }
+else:
+    RESPONSE_CACHE_BACKEND = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': RESPONSE_CACHE_URL or os.path.join(tempfile.gettempdir(), 'webgame-responses'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+
+# Number of server processes sharing the caches above
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': RESPONSE_CACHE_BACKEND,
+}
+
+RESPONSE_CACHE = {
+    'ALIAS': 'responses',
+    'TIMEOUT': 300,
+}
+
+# Catalog lists render from values_list() rows instead of DRF serializers
+# (same JSON); uses orjson when it is installed
+FAST_JSON_RENDERING = True
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
@@ -158,6 +236,13 @@ DATABASES = {
     }
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # A file test database (not the in-memory default) so threaded tests get
+    # their own connections; IMMEDIATE makes concurrent writers queue on the
+    # lock instead of failing on a lock upgrade
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE', 'timeout': 60}
+    DATABASES['default']['TEST'] = {'NAME': os.environ.get('SQL_TEST_DATABASE', str(BASE_DIR / 'test_db.sqlite3'))}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
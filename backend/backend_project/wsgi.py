@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_project.settings')
 
 application = get_wsgi_application()
+
+from apps.game.discounts import discount_refresher
+from apps.game.text_index import game_text_index
+from apps.recommendation.features import game_feature_matrix
+
+# Build the in-process indexes in the background instead of on the first request
+game_text_index.rebuild_async()
+game_feature_matrix.rebuild_async()
+# Apply promotions as they start and end
+discount_refresher.start()
@@ -34,6 +34,8 @@ const Rating: React.FC<RatingProps> = ({ id, avgRating }) => {
     const router = useRouter()
 
   const [ratings, setRatings] = useState<Rating[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
   const [userId, setUserId] = useState<string | null>(null);
   const [hasPurchased, setHasPurchased] = useState<boolean>(false);
   const [rating, setRating] = useState<number>(0);
@@ -59,14 +61,30 @@ const Rating: React.FC<RatingProps> = ({ id, avgRating }) => {
     }
   };
 
-  // Fetch ratings for the game
+  // Fetch ratings for the game, newest first, one page at a time
   const getRatings = async () => {
     try {
       const response = await apiService.get(`/api/game/${id}/ratings/`);
       setRatings(response.data || []);
+      setNextCursor(response.next_cursor || null);
     } catch (error) {
       console.error('Error fetching ratings:', error);
       setRatings([]);
+      setNextCursor(null);
+    }
+  };
+
+  const loadMoreRatings = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await apiService.get(`/api/game/${id}/ratings/?cursor=${encodeURIComponent(nextCursor)}`);
+      setRatings((current) => [...current, ...(response.data || [])]);
+      setNextCursor(response.next_cursor || null);
+    } catch (error) {
+      console.error('Error fetching more ratings:', error);
+    } finally {
+      setLoadingMore(false);
     }
   };
 
@@ -247,6 +265,18 @@ const Rating: React.FC<RatingProps> = ({ id, avgRating }) => {
                 </p>
               </div>
             ))}
+            {nextCursor && (
+              <button
+                type="button"
+                onClick={loadMoreRatings}
+                disabled={loadingMore}
+                className={`w-full py-2 text-red-600 font-semibold rounded-lg hover:bg-gray-200 transition-colors ${
+                  loadingMore ? 'opacity-50 cursor-not-allowed' : ''
+                }`}
+              >
+                {loadingMore ? 'Loading...' : 'Load more reviews'}
+              </button>
+            )}
           </div>
         ) : (
           <p className="p-4 text-gray-600">No ratings yet. Be the first to rate this game!</p>